@@ -2,23 +2,114 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from config import Config
+from app.utils.banco import SessaoRoteada, configurar_banco
 import os
 
-# Inicializa as extensões
-db = SQLAlchemy()
+# Inicializa as extensões (ligadas a cada aplicação em create_app). A sessão
+# envia as leituras das rotas somente de leitura à réplica, se houver uma
+db = SQLAlchemy(session_options={'class_': SessaoRoteada})
 migrate = Migrate()
 
-# Cria a instância da aplicação
-app = Flask(__name__)
-app.config.from_object(Config)
+def create_app(config=Config):
+    """
+    Cria e configura uma instância da aplicação (application factory).
 
-# Criar pasta de uploads se não existir
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    Os controllers são importados aqui dentro, e não no nível do módulo, para
+    que `import app` (migrações, scripts, testes) não carregue as rotas; o
+    xhtml2pdf só é importado quando um relatório em PDF é gerado.
 
-# Inicializa as extensões com a aplicação
-db.init_app(app)
-migrate.init_app(app, db)
+    Args:
+        config: Classe ou objeto de configuração (padrão: config.Config)
 
-# Importa os modelos e controllers
-from app.models import models
-from app.controllers import livro_controller, usuario_controller, emprestimo_controller
+    Returns:
+        Aplicação Flask pronta para uso
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    # Criar pasta de uploads se não existir
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    # Templates compilados pelo Jinja gravados em disco: os demais processos
+    # (workers, pool de relatórios, comandos) carregam o bytecode em vez de
+    # compilar o template de novo. A chave inclui o conteúdo do template,
+    # então uma edição invalida o cache sozinha
+    if app.config['TEMPLATES_CACHE_FOLDER']:
+        from jinja2 import FileSystemBytecodeCache
+        os.makedirs(app.config['TEMPLATES_CACHE_FOLDER'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATES_CACHE_FOLDER'])
+
+    # Inicializa as extensões com a aplicação (pool, opções do engine e réplica em app/utils/banco.py)
+    configurar_banco(app)
+    db.init_app(app)
+    migrate.init_app(app, db)
+
+    # Modelos e eventos que mantêm o índice de busca, as versões dos dados e
+    # as estatísticas da página inicial
+    from app.models import models
+    from app.utils import busca, versoes
+    from app.utils.estatisticas import configurar_estatisticas
+    configurar_estatisticas(app)
+
+    # Cache das páginas de listagem e fragmentos de template (RESPOSTAS_CACHE_BACKEND)
+    from app.utils.cache_respostas import configurar_cache_respostas
+    configurar_cache_respostas(app)
+
+    # Tempo, consultas SQL e renderização por rota (/metrics) e profiler opcional
+    from app.utils.metricas import configurar_metricas
+    configurar_metricas(app)
+
+    # Registro das alterações de livros, usuários e empréstimos (AUDITORIA_BACKEND)
+    from app.utils.auditoria import configurar_auditoria
+    configurar_auditoria(app)
+
+    # Verificação do número de consultas SQL por requisição (ORCAMENTO_CONSULTAS)
+    from app.utils.consultas import configurar_orcamento_consultas
+    configurar_orcamento_consultas(app)
+
+    # Rotas, agrupadas em um blueprint por controller
+    from app.controllers.livro_controller import livros_bp
+    from app.controllers.usuario_controller import usuarios_bp
+    from app.controllers.emprestimo_controller import emprestimos_bp
+    from app.controllers.relatorio_controller import relatorios_bp
+    from app.controllers.metricas_controller import metricas_bp
+    from app.controllers.api_controller import api_bp
+    app.register_blueprint(livros_bp)
+    app.register_blueprint(usuarios_bp)
+    app.register_blueprint(emprestimos_bp)
+    app.register_blueprint(relatorios_bp)
+    app.register_blueprint(metricas_bp)
+    app.register_blueprint(api_bp)
+
+    # Comandos de linha de comando (flask capas ..., flask busca ..., flask atrasos ..., flask banco ...,
+    # flask catalogo ..., flask auditoria ..., flask templates ...)
+    from app.commands.capa_commands import capas_cli
+    from app.commands.busca_commands import busca_cli
+    from app.commands.atraso_commands import atrasos_cli
+    from app.commands.banco_commands import banco_cli
+    from app.commands.catalogo_commands import catalogo_cli
+    from app.commands.auditoria_commands import auditoria_cli
+    from app.commands.template_commands import templates_cli
+    app.cli.add_command(capas_cli)
+    app.cli.add_command(busca_cli)
+    app.cli.add_command(atrasos_cli)
+    app.cli.add_command(banco_cli)
+    app.cli.add_command(catalogo_cli)
+    app.cli.add_command(auditoria_cli)
+    app.cli.add_command(templates_cli)
+
+    # Tarefas periódicas executadas pelo próprio processo (AGENDADOR_ATIVO=1)
+    if app.config['AGENDADOR_ATIVO']:
+        from app.utils.agendador import iniciar_agendador
+        from app.utils.atrasos import tarefa_atrasos
+        from app.utils.estatisticas import recalcular_estatisticas
+        from app.utils.auditoria import tarefa_auditoria
+        tarefas = [
+            ('atrasos', app.config['ATRASOS_HORARIO'], tarefa_atrasos),
+            ('estatisticas', app.config['ESTATISTICAS_RECALCULO_SEGUNDOS'], recalcular_estatisticas),
+        ]
+        if app.config['AUDITORIA_RETENCAO_DIAS'] > 0:
+            tarefas.append(('auditoria', app.config['AUDITORIA_PODA_HORARIO'], tarefa_auditoria))
+        iniciar_agendador(app, tarefas)
+
+    return app
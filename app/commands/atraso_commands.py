@@ -0,0 +1,31 @@
+from flask.cli import AppGroup
+from app.utils.atrasos import processar_atrasos
+from app.utils.tarefas import OCUPADA, CONCLUIDA, RETOMADA
+import click
+
+atrasos_cli = AppGroup('atrasos', help='Processamento dos empréstimos atrasados.')
+
+@atrasos_cli.command('processar')
+@click.option('--data', 'referencia', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Data de referência, AAAA-MM-DD (padrão: hoje).')
+@click.option('--lote', type=click.IntRange(min=1), default=None, help='Empréstimos por lote (padrão: ATRASOS_LOTE).')
+@click.option('--reiniciar', is_flag=True, help='Ignora o checkpoint e processa novamente desde o início.')
+def processar_command(referencia, lote, reiniciar):
+    """Calcula dias de atraso e multas e registra as notificações dos empréstimos atrasados"""
+    resultado = processar_atrasos(referencia.date() if referencia else None, lote, reiniciar)
+
+    if resultado.estado == OCUPADA:
+        click.echo('⚠️  O processamento de atrasos já está em execução em outro processo.')
+        return
+    if resultado.estado == CONCLUIDA:
+        click.echo(f'O processamento desta data já foi concluído ({resultado.processados} empréstimo(s)). '
+                   'Use --reiniciar para processar novamente.')
+        return
+
+    if resultado.estado == RETOMADA:
+        click.echo(f'↩️  Retomado do checkpoint: {resultado.processados - resultado.nesta_execucao} '
+                   'empréstimo(s) já estavam processados.')
+    taxa = resultado.nesta_execucao / resultado.segundos if resultado.segundos else 0
+    click.echo(f'✅ {resultado.nesta_execucao} empréstimo(s) atrasado(s) processado(s) em {resultado.segundos:.1f}s '
+               f'({taxa:.0f}/s): {resultado.novos} novo(s) atraso(s) notificado(s), '
+               f'{resultado.removidos} removido(s) do retrato.')
@@ -0,0 +1,51 @@
+from flask import current_app
+from flask.cli import AppGroup
+from datetime import datetime, timedelta
+from app import db
+from app.models.models import RegistroAuditoria
+from app.utils.auditoria import TABELAS_AUDITADAS, podar_auditoria, buffer_auditoria
+import click
+import json
+
+auditoria_cli = AppGroup('auditoria', help='Registro das alterações de livros, usuários e empréstimos.')
+
+@auditoria_cli.command('podar')
+@click.option('--dias', type=click.IntRange(min=1), default=None,
+              help='Remove os registros com mais de N dias (padrão: AUDITORIA_RETENCAO_DIAS).')
+@click.option('--manter', type=click.IntRange(min=0), default=None,
+              help='Mantém só os N registros mais recentes.')
+@click.option('--lote', type=click.IntRange(min=1), default=5000, help='Registros removidos por transação.')
+@click.option('--arquivar', type=click.File('a', encoding='utf-8'), default=None,
+              help='Acrescenta os registros removidos a este arquivo (um JSON por linha).')
+def podar_command(dias, manter, lote, arquivar):
+    """Aplica a retenção da tabela auditoria, por idade e/ou quantidade"""
+    dias = dias or (current_app.config['AUDITORIA_RETENCAO_DIAS'] if manter is None else None)
+    if not dias and manter is None:
+        raise click.ClickException('Informe --dias ou --manter (AUDITORIA_RETENCAO_DIAS está desativado).')
+
+    antes_de = datetime.utcnow() - timedelta(days=dias) if dias else None
+    removidos = podar_auditoria(antes_de, manter, lote, arquivar)
+    restantes = db.session.execute(db.select(db.func.count()).select_from(RegistroAuditoria)).scalar()
+    click.echo(f'✅ {removidos} registro(s) removido(s); {restantes} na tabela.')
+
+@auditoria_cli.command('historico')
+@click.argument('tabela', type=click.Choice(sorted(TABELAS_AUDITADAS)))
+@click.argument('id', type=int)
+def historico_command(tabela, id):
+    """Mostra as alterações registradas de um livro, usuário ou empréstimo"""
+    buffer = buffer_auditoria()
+    if buffer is not None:
+        buffer.descarregar()
+    registros = db.session.scalars(
+        db.select(RegistroAuditoria)
+        .where(RegistroAuditoria.tabela == tabela, RegistroAuditoria.registro_id == id)
+        .order_by(RegistroAuditoria.id)
+    ).all()
+    if not registros:
+        click.echo('Nenhuma alteração registrada.')
+        return
+    for registro in registros:
+        origem = ' '.join(parte for parte in (registro.origem, registro.endereco_ip) if parte)
+        click.echo(f'{registro.registrado_em:%Y-%m-%d %H:%M:%S} {registro.operacao} ({origem or "?"})')
+        for campo, (antes, depois) in registro.alteracoes.items():
+            click.echo(f'    {campo}: {json.dumps(antes, ensure_ascii=False)} -> {json.dumps(depois, ensure_ascii=False)}')
@@ -0,0 +1,23 @@
+from flask.cli import AppGroup
+from app.utils.planos import verificar_indices
+import click
+
+banco_cli = AppGroup('banco', help='Diagnóstico do banco de dados.')
+
+@banco_cli.command('verificar-indices')
+@click.option('--plano', 'mostrar_plano', is_flag=True, help='Mostra o plano de cada consulta.')
+def verificar_indices_command(mostrar_plano):
+    """Confere com EXPLAIN que as consultas de listagem e busca usam índices"""
+    resultados = verificar_indices()
+    for resultado in resultados:
+        if resultado.varreduras:
+            click.echo(f'❌ {resultado.descricao}: {"; ".join(resultado.varreduras)}')
+        else:
+            click.echo(f'✅ {resultado.descricao}')
+        if mostrar_plano:
+            click.echo(f'   {resultado.plano}')
+
+    falhas = sum(1 for resultado in resultados if resultado.varreduras)
+    if falhas:
+        raise click.ClickException(f'{falhas} consulta(s) sem índice.')
+    click.echo(f'Todas as {len(resultados)} consultas usam índice.')
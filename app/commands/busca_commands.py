@@ -0,0 +1,17 @@
+from flask.cli import AppGroup
+from app import db
+from app.utils.busca import criar_estrutura_busca, reindexar
+import click
+import time
+
+busca_cli = AppGroup('busca', help='Índice de busca do acervo.')
+
+@busca_cli.command('reindexar')
+def reindexar_command():
+    """Recria o índice de busca de todos os livros"""
+    inicio = time.perf_counter()
+    with db.engine.begin() as conexao:
+        criar_estrutura_busca(conexao)
+        total = reindexar(conexao)
+    duracao = time.perf_counter() - inicio
+    click.echo(f'✅ {total} livro(s) indexado(s) em {duracao:.1f}s.')
@@ -0,0 +1,51 @@
+from flask import current_app
+from flask.cli import AppGroup
+from concurrent.futures import ProcessPoolExecutor
+from app import db
+from app.models.models import Livro
+from app.utils.capa_utils import gerar_variantes, podar_variantes
+import click
+import time
+
+capas_cli = AppGroup('capas', help='Gerenciamento das capas dos livros.')
+
+def gerar_variantes_seguro(argumentos):
+    """Executa gerar_variantes em um processo do pool, devolvendo -1 em caso de falha"""
+    capa_hash, pasta, pasta_variantes, forcar = argumentos
+    try:
+        return gerar_variantes(capa_hash, pasta, pasta_variantes, forcar)
+    except OSError:
+        return -1
+
+@capas_cli.command('gerar-variantes')
+@click.option('--processos', type=int, default=None, help='Número de processos (padrão: número de CPUs).')
+@click.option('--forcar', is_flag=True, help='Regera também as variantes que já existem.')
+def gerar_variantes_command(processos, forcar):
+    """Gera as miniaturas (thumb, medium) de todas as capas do acervo"""
+    hashes = [capa_hash for (capa_hash,) in
+              db.session.query(Livro.capa_hash).filter(Livro.capa_hash.isnot(None)).distinct()]
+    if not hashes:
+        click.echo('Nenhuma capa cadastrada.')
+        return
+
+    pasta = current_app.config['UPLOAD_FOLDER']
+    pasta_variantes = current_app.config['CAPA_VARIANTES_FOLDER']
+    tarefas = [(capa_hash, pasta, pasta_variantes, forcar) for capa_hash in hashes]
+
+    inicio = time.perf_counter()
+    geradas = falhas = 0
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        with click.progressbar(pool.map(gerar_variantes_seguro, tarefas, chunksize=16),
+                               length=len(tarefas), label='Gerando variantes') as resultados:
+            for resultado in resultados:
+                if resultado < 0:
+                    falhas += 1
+                else:
+                    geradas += resultado
+    duracao = time.perf_counter() - inicio
+
+    removidas = podar_variantes()
+    click.echo(f'✅ {len(hashes)} capa(s) processada(s) em {duracao:.1f}s: '
+               f'{geradas} variante(s) gerada(s), {falhas} falha(s).')
+    if removidas:
+        click.echo(f'⚠️  {removidas} variante(s) removida(s) para respeitar CAPA_VARIANTES_MAX_BYTES.')
@@ -0,0 +1,97 @@
+from flask import current_app
+from flask.cli import AppGroup
+from app.controllers.livro_controller import COLUNAS_EXPORTACAO_LIVROS, consulta_exportacao_livros
+from app.controllers.usuario_controller import COLUNAS_EXPORTACAO_USUARIOS, consulta_exportacao_usuarios
+from app.controllers.emprestimo_controller import COLUNAS_EXPORTACAO_EMPRESTIMOS, consulta_exportacao_emprestimos
+from app.utils.exportacao import GERADORES_EXPORTACAO, FORMATOS_EXPORTACAO, formato_disponivel, linhas_exportacao
+from app.utils.importacao import ENTIDADES_IMPORTACAO, FORMATOS_IMPORTACAO, importar
+import click
+import os
+import time
+
+catalogo_cli = AppGroup('catalogo', help='Importação e exportação do acervo em lote.')
+
+# Consulta e colunas de cada exportação (as mesmas das rotas /<tipo>/exportar.<formato>)
+EXPORTACOES = {
+    'livros': (consulta_exportacao_livros, COLUNAS_EXPORTACAO_LIVROS),
+    'usuarios': (consulta_exportacao_usuarios, COLUNAS_EXPORTACAO_USUARIOS),
+    'emprestimos': (consulta_exportacao_emprestimos, COLUNAS_EXPORTACAO_EMPRESTIMOS),
+}
+
+def formato_do_arquivo(caminho, formatos):
+    """Formato pela extensão do arquivo (.csv, .ndjson, .jsonl), ou None"""
+    extensao = os.path.splitext(caminho)[1].lower().lstrip('.')
+    extensao = 'ndjson' if extensao == 'jsonl' else extensao
+    return extensao if extensao in formatos else None
+
+@catalogo_cli.command('importar')
+@click.argument('tipo', type=click.Choice(list(ENTIDADES_IMPORTACAO)))
+@click.argument('arquivo', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--formato', type=click.Choice(FORMATOS_IMPORTACAO), default=None,
+              help='Formato do arquivo (padrão: pela extensão).')
+@click.option('--lote', type=click.IntRange(min=1), default=None,
+              help='Registros por transação (padrão: IMPORTACAO_LOTE).')
+@click.option('--max-erros', type=click.IntRange(min=0), default=20,
+              help='Linhas rejeitadas listadas na saída (padrão: 20).')
+def importar_command(tipo, arquivo, formato, lote, max_erros):
+    """Importa livros ou usuários de um CSV ou NDJSON ('-' lê da entrada padrão), atualizando os já cadastrados"""
+    formato = formato or formato_do_arquivo(arquivo.name, FORMATOS_IMPORTACAO)
+    if formato is None:
+        raise click.UsageError('Não foi possível deduzir o formato pela extensão; use --formato.')
+
+    listados = 0
+
+    def rejeitar(linha, mensagem):
+        nonlocal listados
+        listados += 1
+        if listados <= max_erros:
+            click.echo(f'Linha {linha}: {mensagem}', err=True)
+
+    def progresso(lidos, gravados, segundos):
+        click.echo(f'  {lidos} lido(s), {gravados} gravado(s) em {segundos:.1f}s '
+                   f'({gravados / segundos if segundos else 0:.0f} registros/s)')
+
+    resultado = importar(tipo, arquivo, formato, lote, rejeitar, progresso)
+
+    if listados > max_erros:
+        click.echo(f'... e mais {listados - max_erros} linha(s) rejeitada(s).', err=True)
+    gravados = resultado.inseridos + resultado.atualizados
+    taxa = gravados / resultado.segundos if resultado.segundos else 0
+    click.echo(f'✅ {resultado.lidos} registro(s) lido(s) em {resultado.segundos:.1f}s ({taxa:.0f}/s): '
+               f'{resultado.inseridos} inserido(s), {resultado.atualizados} atualizado(s), '
+               f'{resultado.rejeitados} rejeitado(s).')
+
+@catalogo_cli.command('exportar')
+@click.argument('tipo', type=click.Choice(list(EXPORTACOES)))
+@click.option('--formato', type=click.Choice(list(FORMATOS_EXPORTACAO)), default=None,
+              help='Formato da exportação (padrão: pela extensão de --saida, ou csv).')
+@click.option('--saida', type=click.Path(dir_okay=False, allow_dash=True), default='-',
+              help="Arquivo de destino (padrão: '-', a saída padrão).")
+def exportar_command(tipo, formato, saida):
+    """Exporta livros, usuários ou empréstimos em CSV, NDJSON ou XLSX, lidos do banco em lotes"""
+    formato = formato or (formato_do_arquivo(saida, FORMATOS_EXPORTACAO) if saida != '-' else None) or 'csv'
+    if not formato_disponivel(formato):
+        raise click.ClickException('A exportação em XLSX exige o pacote openpyxl (pip install openpyxl).')
+
+    consulta, colunas = EXPORTACOES[tipo]
+    cabecalho = [nome for nome, _ in colunas]
+    total = 0
+
+    def contar(linhas):
+        nonlocal total
+        for linha in linhas:
+            total += 1
+            yield linha
+
+    inicio = time.perf_counter()
+    linhas = contar(linhas_exportacao(consulta(), colunas, current_app.config['EXPORTACAO_LOTE']))
+    # O XLSX é binário; CSV e NDJSON são gerados como texto
+    with click.open_file(saida, 'wb' if formato == 'xlsx' else 'w', encoding=None if formato == 'xlsx' else 'utf-8',
+                         atomic=saida != '-') as destino:
+        for bloco in GERADORES_EXPORTACAO[formato](linhas, cabecalho):
+            destino.write(bloco)
+    duracao = time.perf_counter() - inicio
+
+    # Com a exportação na saída padrão, o resumo vai para a saída de erros
+    taxa = total / duracao if duracao else 0
+    click.echo(f'✅ {total} registro(s) exportado(s) em {duracao:.1f}s ({taxa:.0f}/s).', err=saida == '-')
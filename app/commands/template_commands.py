@@ -0,0 +1,21 @@
+from flask import current_app
+from flask.cli import AppGroup
+import click
+import time
+
+templates_cli = AppGroup('templates', help='Cache dos templates Jinja compilados.')
+
+@templates_cli.command('compilar')
+def compilar_command():
+    """Compila todos os templates e grava o bytecode em TEMPLATES_CACHE_FOLDER (ex.: no deploy)"""
+    ambiente = current_app.jinja_env
+    if ambiente.bytecode_cache is None:
+        raise click.ClickException('Cache de templates desativado (TEMPLATES_CACHE_FOLDER vazio).')
+
+    inicio = time.perf_counter()
+    nomes = ambiente.list_templates()
+    for nome in nomes:
+        ambiente.get_template(nome)
+    duracao = time.perf_counter() - inicio
+    click.echo(f'✅ {len(nomes)} template(s) compilado(s) em {duracao:.1f}s '
+               f'({current_app.config["TEMPLATES_CACHE_FOLDER"]}).')
@@ -0,0 +1,218 @@
+from flask import Blueprint, request, abort
+from app import db
+from app.models.models import Livro, Usuario, Emprestimo, Atraso, emprestimo_livro
+from app.controllers.livro_controller import ORDENACAO_LIVROS
+from app.controllers.usuario_controller import ORDENACAO_USUARIOS
+from app.controllers.emprestimo_controller import ORDENACAO_EMPRESTIMOS
+from app.utils.consultas import orcamento_consultas
+from app.utils.banco import somente_leitura
+from app.utils.paginacao import paginar, parametros_paginacao, filtro_prefixo
+from app.utils.api import (ler_campos, ler_inclusoes, selecao, dicionarios, agrupar, resposta_api,
+                           erro_api)
+from datetime import datetime
+
+# API JSON somente de leitura. Cada recurso declara os campos que podem ser
+# pedidos em ?campos=; só as colunas pedidas entram no SELECT e as linhas
+# são serializadas direto das tuplas (Row), sem montar objetos do ORM.
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+api_bp.register_error_handler(400, erro_api)
+api_bp.register_error_handler(404, erro_api)
+
+# Campos de cada recurso. A capa é referenciada pelo hash (o arquivo é
+# servido por /capa_livro/<id>?v=<capa_hash>); total_emprestimos é uma
+# subconsulta agregada, calculada só quando pedida.
+CAMPOS_LIVROS = {
+    'id': Livro.id,
+    'titulo': Livro.titulo,
+    'autor': Livro.autor,
+    'isbn': Livro.isbn,
+    'ano_publicacao': Livro.ano_publicacao,
+    'categoria': Livro.categoria,
+    'exemplares': Livro.exemplares,
+    'disponiveis': Livro.disponiveis,
+    'capa_hash': Livro.capa_hash,
+    'total_emprestimos': Livro.total_emprestimos,
+}
+PADRAO_LIVROS = ('titulo', 'autor', 'isbn', 'ano_publicacao', 'categoria', 'exemplares', 'disponiveis',
+                 'capa_hash')
+
+CAMPOS_USUARIOS = {
+    'id': Usuario.id,
+    'nome': Usuario.nome,
+    'email': Usuario.email,
+    'total_emprestimos': Usuario.total_emprestimos,
+}
+PADRAO_USUARIOS = ('nome', 'email')
+
+CAMPOS_EMPRESTIMOS = {
+    'id': Emprestimo.id,
+    'numero_emprestimo': Emprestimo.numero_emprestimo,
+    'usuario_id': Emprestimo.usuario_id,
+    'data_emprestimo': Emprestimo.data_emprestimo,
+    'data_devolucao': Emprestimo.data_devolucao,
+    'devolvido_em': Emprestimo.devolvido_em,
+}
+PADRAO_EMPRESTIMOS = ('numero_emprestimo', 'usuario_id', 'data_emprestimo', 'data_devolucao', 'devolvido_em')
+
+# Campos das relações incluídas com ?incluir=
+RESUMO_LIVROS = ('id', 'titulo', 'autor', 'isbn')
+RESUMO_USUARIOS = ('id', 'nome', 'email')
+RESUMO_EMPRESTIMOS = ('id', 'numero_emprestimo', 'data_emprestimo', 'data_devolucao', 'devolvido_em')
+
+def resposta_pagina(pagina, dados):
+    """Corpo de uma listagem: os registros da página e os cursores de navegação (None se não houver)"""
+    return {'dados': dados, 'proximo': pagina.proximo, 'anterior': pagina.anterior}
+
+def buscar_um(query, id_coluna, id):
+    """Linha do registro com o id informado; responde 404 se não existir"""
+    linha = query.filter(id_coluna == id).first()
+    if linha is None:
+        abort(404, description='Registro não encontrado')
+    return linha
+
+# Relações incluídas: uma consulta com IN (...) para todos os registros da
+# página, qualquer que seja o número de registros
+
+def livros_por_emprestimo(emprestimo_ids):
+    linhas = (db.session.query(emprestimo_livro.c.emprestimo_id, *(CAMPOS_LIVROS[campo] for campo in RESUMO_LIVROS))
+              .join(Livro, Livro.id == emprestimo_livro.c.livro_id)
+              .filter(emprestimo_livro.c.emprestimo_id.in_(emprestimo_ids))
+              .order_by(emprestimo_livro.c.emprestimo_id, Livro.titulo))
+    return agrupar(linhas, RESUMO_LIVROS)
+
+def usuarios_por_id(usuario_ids):
+    linhas = (db.session.query(*(CAMPOS_USUARIOS[campo] for campo in RESUMO_USUARIOS))
+              .filter(Usuario.id.in_(usuario_ids)))
+    return {item['id']: item for item in dicionarios(linhas, RESUMO_USUARIOS)}
+
+def emprestimos_por_usuario(usuario_ids):
+    linhas = (db.session.query(Emprestimo.usuario_id, *(CAMPOS_EMPRESTIMOS[campo] for campo in RESUMO_EMPRESTIMOS))
+              .filter(Emprestimo.usuario_id.in_(usuario_ids))
+              .order_by(Emprestimo.usuario_id, Emprestimo.data_emprestimo.desc()))
+    return agrupar(linhas, RESUMO_EMPRESTIMOS)
+
+def incluir_em_emprestimos(linhas, campos, inclusoes):
+    """Dicionários dos empréstimos com o usuário e/ou os livros pedidos em ?incluir="""
+    dados = dicionarios(linhas, campos)
+    if 'usuario' in inclusoes:
+        usuarios = usuarios_por_id({linha.usuario_id for linha in linhas})
+        for item, linha in zip(dados, linhas):
+            item['usuario'] = usuarios.get(linha.usuario_id)
+    if 'livros' in inclusoes:
+        livros = livros_por_emprestimo([item['id'] for item in dados])
+        for item in dados:
+            item['livros'] = livros.get(item['id'], [])
+    return dados
+
+def incluir_em_usuarios(linhas, campos, inclusoes):
+    """Dicionários dos usuários com os empréstimos pedidos em ?incluir="""
+    dados = dicionarios(linhas, campos)
+    if 'emprestimos' in inclusoes:
+        emprestimos = emprestimos_por_usuario([item['id'] for item in dados])
+        for item in dados:
+            item['emprestimos'] = emprestimos.get(item['id'], [])
+    return dados
+
+@api_bp.route('/livros')
+@somente_leitura
+@orcamento_consultas(2)
+@resposta_api('livros', por_campo={'total_emprestimos': ('emprestimos',)})
+def livros():
+    """Livros com os mesmos filtros, ordenação e cursor da listagem HTML"""
+    campos = ler_campos(CAMPOS_LIVROS, PADRAO_LIVROS)
+    # Livros não têm relações a incluir: qualquer ?incluir= é desconhecido (400)
+    ler_inclusoes(())
+    coluna, descendente, cursor, por_pagina = parametros_paginacao(ORDENACAO_LIVROS, 'titulo')
+
+    query = db.session.query(*selecao(CAMPOS_LIVROS, campos, coluna))
+    categoria = request.args.get('categoria', '').strip()
+    autor = request.args.get('autor', '').strip()
+    ano_min = request.args.get('ano_min', type=int)
+    ano_max = request.args.get('ano_max', type=int)
+    if categoria:
+        query = query.filter(Livro.categoria == categoria)
+    if autor:
+        query = query.filter(filtro_prefixo(Livro.autor, autor))
+    if ano_min is not None:
+        query = query.filter(Livro.ano_publicacao >= ano_min)
+    if ano_max is not None:
+        query = query.filter(Livro.ano_publicacao <= ano_max)
+
+    pagina = paginar(query, coluna, Livro.id, descendente, cursor, por_pagina)
+    return resposta_pagina(pagina, dicionarios(pagina.itens, campos))
+
+@api_bp.route('/livros/<int:id>')
+@somente_leitura
+@orcamento_consultas(2)
+@resposta_api('livros', por_campo={'total_emprestimos': ('emprestimos',)})
+def livro(id):
+    campos = ler_campos(CAMPOS_LIVROS, PADRAO_LIVROS)
+    ler_inclusoes(())
+    linha = buscar_um(db.session.query(*selecao(CAMPOS_LIVROS, campos)), Livro.id, id)
+    return {'dados': dicionarios([linha], campos)[0]}
+
+@api_bp.route('/usuarios')
+@somente_leitura
+@orcamento_consultas(3)
+@resposta_api('usuarios', 'emprestimos')
+def usuarios():
+    """Usuários com filtro por nome, ordenação e cursor; ?incluir=emprestimos"""
+    campos = ler_campos(CAMPOS_USUARIOS, PADRAO_USUARIOS)
+    inclusoes = ler_inclusoes(('emprestimos',))
+    coluna, descendente, cursor, por_pagina = parametros_paginacao(ORDENACAO_USUARIOS, 'nome')
+
+    query = db.session.query(*selecao(CAMPOS_USUARIOS, campos, coluna))
+    nome = request.args.get('nome', '').strip()
+    if nome:
+        query = query.filter(filtro_prefixo(Usuario.nome, nome))
+
+    pagina = paginar(query, coluna, Usuario.id, descendente, cursor, por_pagina)
+    return resposta_pagina(pagina, incluir_em_usuarios(pagina.itens, campos, inclusoes))
+
+@api_bp.route('/usuarios/<int:id>')
+@somente_leitura
+@orcamento_consultas(3)
+@resposta_api('usuarios', 'emprestimos')
+def usuario(id):
+    campos = ler_campos(CAMPOS_USUARIOS, PADRAO_USUARIOS)
+    inclusoes = ler_inclusoes(('emprestimos',))
+    linha = buscar_um(db.session.query(*selecao(CAMPOS_USUARIOS, campos)), Usuario.id, id)
+    return {'dados': incluir_em_usuarios([linha], campos, inclusoes)[0]}
+
+@api_bp.route('/emprestimos')
+@somente_leitura
+@orcamento_consultas(4)
+@resposta_api('emprestimos', 'usuarios', 'livros', 'atrasos')
+def emprestimos():
+    """Empréstimos com os filtros, ordenação e cursor da listagem HTML; ?incluir=usuario,livros"""
+    campos = ler_campos(CAMPOS_EMPRESTIMOS, PADRAO_EMPRESTIMOS)
+    inclusoes = ler_inclusoes(('usuario', 'livros'))
+    atrasados = request.args.get('atrasados') == '1'
+    # Mesma ordenação padrão da listagem HTML (os atrasados por devolução)
+    coluna, descendente, cursor, por_pagina = parametros_paginacao(
+        ORDENACAO_EMPRESTIMOS, 'data_devolucao' if atrasados else 'data_emprestimo')
+
+    query = db.session.query(*selecao(CAMPOS_EMPRESTIMOS, campos, coluna, Emprestimo.usuario_id))
+    usuario_id = request.args.get('usuario', type=int)
+    dias_min = request.args.get('dias_min', type=int)
+    if usuario_id is not None:
+        query = query.filter(Emprestimo.usuario_id == usuario_id)
+    if atrasados:
+        query = query.filter(Emprestimo.devolvido_em.is_(None),
+                             Emprestimo.data_devolucao < datetime.now().date())
+    if dias_min is not None:
+        query = query.join(Atraso, Atraso.emprestimo_id == Emprestimo.id).filter(Atraso.dias_atraso >= dias_min)
+
+    pagina = paginar(query, coluna, Emprestimo.id, descendente, cursor, por_pagina)
+    return resposta_pagina(pagina, incluir_em_emprestimos(pagina.itens, campos, inclusoes))
+
+@api_bp.route('/emprestimos/<int:id>')
+@somente_leitura
+@orcamento_consultas(4)
+@resposta_api('emprestimos', 'usuarios', 'livros', 'atrasos')
+def emprestimo(id):
+    campos = ler_campos(CAMPOS_EMPRESTIMOS, PADRAO_EMPRESTIMOS)
+    inclusoes = ler_inclusoes(('usuario', 'livros'))
+    query = db.session.query(*selecao(CAMPOS_EMPRESTIMOS, campos, Emprestimo.usuario_id))
+    linha = buscar_um(query, Emprestimo.id, id)
+    return {'dados': incluir_em_emprestimos([linha], campos, inclusoes)[0]}
@@ -1,198 +1,350 @@
-from flask import render_template, request, redirect, url_for, flash
-from app import app, db
-from app.models.models import Emprestimo, Usuario, Livro
-from app.utils.pdf_utils import generate_pdf
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, abort
+from app import db
+from app.models.models import Emprestimo, Usuario, Livro, Atraso, excluir
+from app.services.emprestimos import (validar_campos, pre_verificacao, conferir_emprestimo,
+                                      sincronizar_livros, travar_usuarios, criar_emprestimo, criar_emprestimos)
+from app.utils.relatorios import solicitar_relatorio
+from app.utils.pdf_utils import TabelaPdf, ColunaPdf
+from app.utils.exportacao import formato_disponivel, resposta_exportacao
+from app.utils.consultas import orcamento_consultas
+from app.utils.banco import somente_leitura
+from app.utils.paginacao import Listagem, paginar, parametros_paginacao
+from app.utils.estatisticas import obter_estatisticas
+from app.utils.cache_respostas import cache_pagina
+from app.utils.circulacao import (reservar_exemplares, liberar_exemplares, mensagem_indisponiveis,
+                                  registrar_devolucao)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload, contains_eager
 from datetime import datetime, timedelta, timedelta
 
-@app.route('/')
+emprestimos_bp = Blueprint('emprestimos', __name__)
+
+@emprestimos_bp.route('/')
+@orcamento_consultas(3)
 def index():
-    """Página inicial com opções para ir para livros, usuários ou empréstimos"""
-    return render_template('index.html')
+    """Página inicial com opções para ir para livros, usuários ou empréstimos e as estatísticas do acervo"""
+    # Vêm do cache; só quando ele expira as estatísticas são recalculadas (3 consultas)
+    return render_template('index.html', estatisticas=obter_estatisticas())
+
+# Colunas aceitas no parâmetro ?ordem= da listagem
+ORDENACAO_EMPRESTIMOS = {
+    'numero': Emprestimo.numero_emprestimo,
+    'data_emprestimo': Emprestimo.data_emprestimo,
+    'data_devolucao': Emprestimo.data_devolucao,
+}
+
+def listagem_emprestimos():
+    """Consulta da listagem de empréstimos com os filtros e a ordenação da URL"""
+    usuario_id = request.args.get('usuario', type=int)
+    atrasados = request.args.get('atrasados') == '1'
+    dias_min = request.args.get('dias_min', type=int)
+
+    # Usuário e atraso vêm no mesmo SELECT (muitos-para-um); os livros de todos
+    # os empréstimos da página vêm em uma única consulta extra com IN (...)
+    query = Emprestimo.query.options(joinedload(Emprestimo.usuario), selectinload(Emprestimo.livros))
+    if dias_min is not None:
+        # Filtra pelo retrato do último processamento de atrasos (índice em dias_atraso)
+        query = (query.join(Emprestimo.atraso).filter(Atraso.dias_atraso >= dias_min)
+                 .options(contains_eager(Emprestimo.atraso)))
+    else:
+        query = query.options(joinedload(Emprestimo.atraso))
+    if usuario_id is not None:
+        query = query.filter(Emprestimo.usuario_id == usuario_id)
+    if atrasados:
+        query = query.filter(Emprestimo.devolvido_em.is_(None),
+                             Emprestimo.data_devolucao < datetime.now().date())
+
+    # Os atrasados saem por padrão em ordem de devolução: com (data_devolucao,
+    # id) o índice parcial dos empréstimos ativos atende filtro e ordenação
+    coluna, descendente, cursor, por_pagina = parametros_paginacao(
+        ORDENACAO_EMPRESTIMOS, 'data_devolucao' if atrasados else 'data_emprestimo')
+    return Listagem(query, coluna, Emprestimo.id, descendente, cursor, por_pagina)
 
-@app.route('/emprestimos')
+@emprestimos_bp.route('/emprestimos')
+@somente_leitura
+@orcamento_consultas(4)
+@cache_pagina('emprestimos', 'usuarios', 'livros', 'atrasos')
 def emprestimos():
-    """Lista todos os empréstimos"""
-    emprestimos = Emprestimo.query.all()
-    return render_template('emprestimos/emprestimos.html', emprestimos=emprestimos)
+    """Lista os empréstimos com filtros, ordenação e paginação por cursor"""
+    usuario_id = request.args.get('usuario', type=int)
+    usuario = db.session.get(Usuario, usuario_id) if usuario_id is not None else None
+    pagina = paginar(*listagem_emprestimos())
+    return render_template('emprestimos/emprestimos.html', emprestimos=pagina.itens, pagina=pagina,
+                           usuario_filtro=usuario, hoje=datetime.now().date())
 
-@app.route('/create_emprestimo', methods=['GET', 'POST'])
+def formulario_emprestimo(template, emprestimo=None, usuario_id=None, livro_ids=None):
+    """
+    Renderiza o formulário de empréstimo carregando só o usuário e os livros selecionados.
+
+    As opções de usuário e livro são buscadas pelo navegador nas rotas de
+    autocomplete, então o tamanho da página não depende do tamanho do acervo.
+    Quando a validação falha, usuario_id e livro_ids (vindos do POST) mantêm
+    a seleção feita pelo usuário.
+    """
+    if usuario_id is None and livro_ids is None and emprestimo is not None:
+        usuario = emprestimo.usuario
+        livros = emprestimo.livros
+    else:
+        usuario = db.session.get(Usuario, int(usuario_id)) if str(usuario_id or '').isdigit() else None
+        ids = [int(livro_id) for livro_id in livro_ids or [] if str(livro_id).isdigit()]
+        livros = Livro.query.filter(Livro.id.in_(ids)).all() if ids else []
+
+    return render_template(template, emprestimo=emprestimo,
+                           usuario_selecionado=usuario, livros_selecionados=livros,
+                           tem_usuarios=db.session.query(Usuario.id).first() is not None,
+                           tem_livros=db.session.query(Livro.id).first() is not None,
+                           today=datetime.now().strftime('%Y-%m-%d'))
+
+@emprestimos_bp.route('/create_emprestimo', methods=['GET', 'POST'])
 def create_emprestimo():
     """Criar um novo empréstimo"""
     if request.method == 'POST':
-        numero_emprestimo = request.form['numero_emprestimo'].strip()
         usuario_id = request.form.get('usuario')
         livro_ids = request.form.getlist('livros')
-        data_devolucao = request.form.get('data_devolucao')
-        
-        # Validações
-        if not numero_emprestimo:
-            flash('Número do empréstimo é obrigatório!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/create_emprestimo.html', usuarios=usuarios, livros=livros)
-        
-        if not usuario_id:
-            flash('Selecione um usuário!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/create_emprestimo.html', usuarios=usuarios, livros=livros)
         
-        if not livro_ids:
-            flash('Selecione pelo menos um livro!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/create_emprestimo.html', usuarios=usuarios, livros=livros)
-        
-        if not data_devolucao:
-            flash('Data de devolução é obrigatória!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/create_emprestimo.html', usuarios=usuarios, livros=livros)
-        
-        # Validar data de devolução não pode ser anterior à data atual
+        # Validações: campos primeiro, depois uma única consulta confere número,
+        # usuário e livros no banco
+        erro, dados = validar_campos(request.form.get('numero_emprestimo'), usuario_id, livro_ids,
+                                     request.form.get('data_devolucao'))
+        if erro is None:
+            erro = conferir_emprestimo(dados, pre_verificacao([dados]))
+        if erro is None:
+            # Retira os exemplares da estante antes de gravar o empréstimo
+            indisponiveis = reservar_exemplares(dados.livro_ids)
+            if indisponiveis:
+                erro = mensagem_indisponiveis(indisponiveis)
+            elif travar_usuarios([dados.usuario_id]):
+                # Usuário excluído depois da pré-verificação
+                erro = 'Usuário não encontrado!'
+        if erro:
+            db.session.rollback()
+            flash(erro, 'danger')
+            return formulario_emprestimo('emprestimos/create_emprestimo.html', usuario_id=usuario_id, livro_ids=livro_ids)
+
         try:
-            data_dev = datetime.strptime(data_devolucao, '%Y-%m-%d').date()
-            if data_dev < datetime.now().date():
-                flash('Data de devolução não pode ser anterior à data atual!', 'danger')
-                usuarios = Usuario.query.all()
-                livros = Livro.query.all()
-                return render_template('emprestimos/create_emprestimo.html', usuarios=usuarios, livros=livros)
-        except ValueError:
-            flash('Data de devolução inválida!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/create_emprestimo.html', usuarios=usuarios, livros=livros)
-        
-        # Verificar número duplicado
-        if Emprestimo.query.filter_by(numero_emprestimo=numero_emprestimo).first():
+            criar_emprestimo(dados)
+            db.session.commit()
+        except IntegrityError:
+            # Outro processo gravou o mesmo número entre a verificação e o INSERT
+            db.session.rollback()
             flash('Número de empréstimo já cadastrado!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/create_emprestimo.html', usuarios=usuarios, livros=livros)
-
-        new_emprestimo = Emprestimo(
-            numero_emprestimo=numero_emprestimo,
-            usuario_id=usuario_id,
-            data_devolucao=datetime.strptime(data_devolucao, '%Y-%m-%d').date()
-        )
-
-        # Adicionar os livros selecionados ao empréstimo
-        for livro_id in livro_ids:
-            livro = Livro.query.get(livro_id)
-            if livro:
-                new_emprestimo.livros.append(livro)
-
-        db.session.add(new_emprestimo)
-        db.session.commit()
-        flash(f'Empréstimo "{numero_emprestimo}" cadastrado com sucesso!', 'success')
-        return redirect(url_for('emprestimos'))
+            return formulario_emprestimo('emprestimos/create_emprestimo.html', usuario_id=usuario_id, livro_ids=livro_ids)
+        flash(f'Empréstimo "{dados.numero_emprestimo}" cadastrado com sucesso!', 'success')
+        return redirect(url_for('emprestimos.emprestimos'))
 
-    usuarios = Usuario.query.all()
-    livros = Livro.query.all()
-    return render_template('emprestimos/create_emprestimo.html', usuarios=usuarios, livros=livros, today=datetime.now().strftime('%Y-%m-%d'))
+    return formulario_emprestimo('emprestimos/create_emprestimo.html')
 
-@app.route('/update_emprestimo/<int:id>', methods=['GET', 'POST'])
+@emprestimos_bp.route('/update_emprestimo/<int:id>', methods=['GET', 'POST'])
 def update_emprestimo(id):
     """Atualizar um empréstimo existente"""
-    emprestimo = Emprestimo.query.get_or_404(id)
+    # No POST a linha do empréstimo fica travada até o commit, para que
+    # edições, devoluções e exclusões simultâneas não se misturem
+    emprestimo = db.session.get(Emprestimo, id, with_for_update=request.method == 'POST')
+    if emprestimo is None:
+        abort(404)
 
     if request.method == 'POST':
-        numero_emprestimo = request.form['numero_emprestimo'].strip()
         usuario_id = request.form.get('usuario')
         livro_ids = request.form.getlist('livros')
-        data_devolucao = request.form.get('data_devolucao')
-        
-        # Validações
-        if not numero_emprestimo:
-            flash('Número do empréstimo é obrigatório!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/update_emprestimo.html', emprestimo=emprestimo, usuarios=usuarios, livros=livros)
-        
-        if not usuario_id:
-            flash('Selecione um usuário!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/update_emprestimo.html', emprestimo=emprestimo, usuarios=usuarios, livros=livros)
-        
-        if not livro_ids:
-            flash('Selecione pelo menos um livro!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/update_emprestimo.html', emprestimo=emprestimo, usuarios=usuarios, livros=livros)
-        
-        if not data_devolucao:
-            flash('Data de devolução é obrigatória!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/update_emprestimo.html', emprestimo=emprestimo, usuarios=usuarios, livros=livros)
-        
-        # Validar data de devolução não pode ser anterior à data atual
-        try:
-            data_dev = datetime.strptime(data_devolucao, '%Y-%m-%d').date()
-            if data_dev < datetime.now().date():
-                flash('Data de devolução não pode ser anterior à data atual!', 'danger')
-                usuarios = Usuario.query.all()
-                livros = Livro.query.all()
-                return render_template('emprestimos/update_emprestimo.html', emprestimo=emprestimo, usuarios=usuarios, livros=livros)
-        except ValueError:
-            flash('Data de devolução inválida!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/update_emprestimo.html', emprestimo=emprestimo, usuarios=usuarios, livros=livros)
         
-        # Verificar número duplicado (exceto o próprio empréstimo)
-        existing = Emprestimo.query.filter_by(numero_emprestimo=numero_emprestimo).first()
-        if existing and existing.id != id:
-            flash('Número de empréstimo já cadastrado!', 'danger')
-            usuarios = Usuario.query.all()
-            livros = Livro.query.all()
-            return render_template('emprestimos/update_emprestimo.html', emprestimo=emprestimo, usuarios=usuarios, livros=livros)
+        # Validações (a pré-verificação também traz os livros atuais do empréstimo)
+        erro, dados = validar_campos(request.form.get('numero_emprestimo'), usuario_id, livro_ids,
+                                     request.form.get('data_devolucao'))
+        if erro is None:
+            verificacao = pre_verificacao([dados], emprestimo_id=id)
+            erro = conferir_emprestimo(dados, verificacao)
+        if erro:
+            flash(erro, 'danger')
+            return formulario_emprestimo('emprestimos/update_emprestimo.html', emprestimo=emprestimo,
+                                        usuario_id=usuario_id, livro_ids=livro_ids)
         
-        emprestimo.numero_emprestimo = numero_emprestimo
-        emprestimo.usuario_id = usuario_id
-        emprestimo.data_devolucao = datetime.strptime(data_devolucao, '%Y-%m-%d').date()
+        if dados.usuario_id != emprestimo.usuario_id and travar_usuarios([dados.usuario_id]):
+            # O novo usuário foi excluído depois da pré-verificação
+            db.session.rollback()
+            flash('Usuário não encontrado!', 'danger')
+            return formulario_emprestimo('emprestimos/update_emprestimo.html', emprestimo=emprestimo,
+                                        usuario_id=usuario_id, livro_ids=livro_ids)
+
+        if dados.data_devolucao != emprestimo.data_devolucao and emprestimo.atraso is not None:
+            # O atraso calculado para o prazo antigo deixa de valer (o próximo processamento recalcula)
+            emprestimo.atraso = None
+        emprestimo.numero_emprestimo = dados.numero_emprestimo
+        emprestimo.usuario_id = dados.usuario_id
+        emprestimo.data_devolucao = dados.data_devolucao
         
-        # Atualizar livros do empréstimo
-        emprestimo.livros = []
-        for livro_id in livro_ids:
-            livro = Livro.query.get(livro_id)
-            if livro:
-                emprestimo.livros.append(livro)
+        # Atualizar livros do empréstimo: insere/remove só os que mudaram
+        inseridos, removidos = sincronizar_livros(id, dados.livro_ids, verificacao.livros_atuais)
+
+        # Em um empréstimo ativo, os livros trocados também saem/voltam à estante
+        if emprestimo.ativo:
+            liberar_exemplares(removidos)
+            indisponiveis = reservar_exemplares(inseridos)
+            if indisponiveis:
+                erro = mensagem_indisponiveis(indisponiveis)
+                db.session.rollback()
+                flash(erro, 'danger')
+                return formulario_emprestimo('emprestimos/update_emprestimo.html', emprestimo=emprestimo,
+                                            usuario_id=usuario_id, livro_ids=livro_ids)
+
+        db.session.commit()
+        flash(f'Empréstimo "{dados.numero_emprestimo}" atualizado com sucesso!', 'success')
+        return redirect(url_for('emprestimos.emprestimos'))
+
+    return formulario_emprestimo('emprestimos/update_emprestimo.html', emprestimo=emprestimo)
 
+@emprestimos_bp.route('/emprestimos/lote', methods=['POST'])
+def create_emprestimos_lote():
+    """
+    Criar vários empréstimos em uma única transação (importação das unidades).
+
+    Recebe JSON no formato:
+        {"emprestimos": [{"numero_emprestimo": "EMP-1", "usuario_id": 1,
+                          "livros": [1, 2], "data_devolucao": "2030-01-31",
+                          "data_emprestimo": "2030-01-10T14:30:00"}, ...]}
+
+    data_emprestimo é opcional (padrão: agora). Ou todos os empréstimos são
+    criados, ou nenhum: qualquer erro devolve 422 com a lista de erros.
+    """
+    corpo = request.get_json(silent=True)
+    itens = corpo.get('emprestimos') if isinstance(corpo, dict) else None
+    if not isinstance(itens, list) or not itens:
+        return jsonify(erro='Envie um JSON com a lista "emprestimos".'), 400
+    if len(itens) > current_app.config['EMPRESTIMOS_LOTE_MAX']:
+        return jsonify(erro=f'No máximo {current_app.config["EMPRESTIMOS_LOTE_MAX"]} empréstimos por lote.'), 413
+
+    erros = []
+    lista = []
+    numeros = set()
+    for indice, item in enumerate(itens):
+        if not isinstance(item, dict):
+            erros.append({'indice': indice, 'erro': 'Empréstimo inválido!'})
+            continue
+        livros = item.get('livros')
+        erro, dados = validar_campos(item.get('numero_emprestimo'), item.get('usuario_id'),
+                                     livros if isinstance(livros, list) else None,
+                                     item.get('data_devolucao'), item.get('data_emprestimo'))
+        if erro is None and dados.numero_emprestimo in numeros:
+            erro = 'Número de empréstimo repetido no lote!'
+        if erro:
+            erros.append({'indice': indice, 'erro': erro})
+        else:
+            numeros.add(dados.numero_emprestimo)
+            lista.append((indice, dados))
+
+    # Uma única consulta confere números, usuários e livros de todo o lote
+    if lista:
+        verificacao = pre_verificacao([dados for _, dados in lista])
+        for indice, dados in lista:
+            erro = conferir_emprestimo(dados, verificacao)
+            if erro:
+                erros.append({'indice': indice, 'erro': erro})
+    if erros:
+        return jsonify(erros=sorted(erros, key=lambda erro: erro['indice'])), 422
+
+    try:
+        indisponiveis = reservar_exemplares([livro_id for _, dados in lista for livro_id in dados.livro_ids])
+        if indisponiveis:
+            db.session.rollback()
+            return jsonify(erro='Sem exemplares disponíveis; nenhum empréstimo foi criado.',
+                           livros=sorted(indisponiveis)), 409
+        excluidos = travar_usuarios(dados.usuario_id for _, dados in lista)
+        if excluidos:
+            db.session.rollback()
+            return jsonify(erro='Usuário(s) excluído(s); nenhum empréstimo foi criado.',
+                           usuarios=sorted(excluidos)), 409
+        criados = criar_emprestimos([dados for _, dados in lista])
         db.session.commit()
-        flash(f'Empréstimo "{numero_emprestimo}" atualizado com sucesso!', 'success')
-        return redirect(url_for('emprestimos'))
+    except IntegrityError:
+        # Outro processo gravou um dos números entre a verificação e o INSERT
+        db.session.rollback()
+        return jsonify(erro='Conflito ao gravar o lote; nenhum empréstimo foi criado.'), 409
 
-    usuarios = Usuario.query.all()
-    livros = Livro.query.all()
-    return render_template('emprestimos/update_emprestimo.html', emprestimo=emprestimo, usuarios=usuarios, livros=livros, today=datetime.now().strftime('%Y-%m-%d'))
+    return jsonify(criados=len(criados),
+                   emprestimos=[{'id': id, 'numero_emprestimo': numero} for id, numero in criados]), 201
 
-@app.route('/delete_emprestimo/<int:id>')
+@emprestimos_bp.route('/delete_emprestimo/<int:id>', methods=['POST'])
 def delete_emprestimo(id):
-    """Deletar um empréstimo"""
-    emprestimo = Emprestimo.query.get_or_404(id)
+    """Excluir um empréstimo (exclusão lógica)"""
+    emprestimo = db.session.get(Emprestimo, id, with_for_update=True)
+    if emprestimo is None:
+        abort(404)
     numero = emprestimo.numero_emprestimo
-    db.session.delete(emprestimo)
+    # Excluir um empréstimo ainda ativo devolve os livros à estante
+    if emprestimo.ativo:
+        liberar_exemplares([livro.id for livro in emprestimo.livros])
+    # A situação de atraso é recalculada pelo processamento; a do excluído sai da listagem
+    emprestimo.atraso = None
+    excluir(emprestimo)
     db.session.commit()
     flash(f'Empréstimo "{numero}" excluído com sucesso!', 'success')
-    return redirect(url_for('emprestimos'))
+    return redirect(url_for('emprestimos.emprestimos'))
 
-@app.route('/emprestimos/pdf')
+@emprestimos_bp.route('/devolver_emprestimo/<int:id>', methods=['POST'])
+def devolver_emprestimo(id):
+    """Registrar a devolução dos livros de um empréstimo"""
+    emprestimo = Emprestimo.query.get_or_404(id)
+    numero = emprestimo.numero_emprestimo
+    if registrar_devolucao(id) is None:
+        flash(f'Empréstimo "{numero}" já foi devolvido!', 'warning')
+        return redirect(url_for('emprestimos.emprestimos'))
+    db.session.commit()
+    flash(f'Devolução do empréstimo "{numero}" registrada com sucesso!', 'success')
+    return redirect(url_for('emprestimos.emprestimos'))
+
+@emprestimos_bp.route('/emprestimos/pdf')
+@somente_leitura
+@orcamento_consultas(None)
 def emprestimos_pdf():
-    """Exportar lista de empréstimos para PDF"""
-    emprestimos = Emprestimo.query.all()
-    
-    context = {
-        'emprestimos': emprestimos,
-        'data_geracao': datetime.now().strftime('%d/%m/%Y às %H:%M'),
-        'ano_atual': datetime.now().year
-    }
+    """Exportar lista de empréstimos para PDF (gerado em segundo plano)"""
+    # Lido em lotes: os livros de cada lote vêm em uma consulta extra,
+    # então o total de consultas cresce com o número de empréstimos
+    query = Emprestimo.query.options(joinedload(Emprestimo.usuario), selectinload(Emprestimo.livros))
     
-    pdf = generate_pdf('emprestimos/emprestimos_pdf.html', context, filename='relatorio_emprestimos.pdf')
+    return solicitar_relatorio('emprestimos', 'emprestimos/emprestimos_pdf.html', query, 'emprestimos',
+                               ('emprestimos', 'usuarios', 'livros'), TABELA_PDF_EMPRESTIMOS)
+
+def formatar_data(data):
+    return data.strftime('%d/%m/%Y') if data else '-'
+
+# Colunas do relatório em PDF no backend 'tabela' (as mesmas de emprestimos_pdf.html)
+TABELA_PDF_EMPRESTIMOS = TabelaPdf('Relatório de Empréstimos', 'Total de Empréstimos', 'Nenhum empréstimo registrado.', [
+    ColunaPdf('Nº Empréstimo', 12, 'LEFT', lambda emprestimo: emprestimo.numero_emprestimo),
+    ColunaPdf('Usuário', 18, 'LEFT', lambda emprestimo: emprestimo.usuario.nome),
+    ColunaPdf('Email', 18, 'LEFT', lambda emprestimo: emprestimo.usuario.email),
+    ColunaPdf('Data Emp.', 10, 'CENTER', lambda emprestimo: formatar_data(emprestimo.data_emprestimo)),
+    ColunaPdf('Data Dev.', 10, 'CENTER', lambda emprestimo: formatar_data(emprestimo.data_devolucao)),
+    ColunaPdf('Qtd.', 8, 'CENTER', lambda emprestimo: len(emprestimo.livros)),
+    ColunaPdf('Livros Emprestados', 24, 'LEFT',
+              lambda emprestimo: '\n'.join(f'• {livro.titulo}' for livro in emprestimo.livros) or '-'),
+])
+
+# Colunas das exportações em CSV, NDJSON e XLSX
+COLUNAS_EXPORTACAO_EMPRESTIMOS = [
+    ('id', lambda emprestimo: emprestimo.id),
+    ('numero_emprestimo', lambda emprestimo: emprestimo.numero_emprestimo),
+    ('usuario', lambda emprestimo: emprestimo.usuario.nome),
+    ('email', lambda emprestimo: emprestimo.usuario.email),
+    ('data_emprestimo', lambda emprestimo: emprestimo.data_emprestimo),
+    ('data_devolucao', lambda emprestimo: emprestimo.data_devolucao),
+    ('devolvido_em', lambda emprestimo: emprestimo.devolvido_em),
+    ('livros', lambda emprestimo: '; '.join(livro.titulo for livro in emprestimo.livros)),
+]
+
+def consulta_exportacao_emprestimos():
+    """
+    Todos os empréstimos, na ordem das exportações (rota e flask catalogo exportar).
+
+    Os livros de cada lote de empréstimos vêm em uma consulta extra com IN (...)
+    """
+    return (Emprestimo.query.options(joinedload(Emprestimo.usuario), selectinload(Emprestimo.livros))
+            .order_by(Emprestimo.id))
+
+@emprestimos_bp.route('/emprestimos/exportar.<formato>')
+@somente_leitura
+def exportar_emprestimos(formato):
+    """Exportar todos os empréstimos em CSV, NDJSON ou XLSX, enviados enquanto são lidos do banco"""
+    if not formato_disponivel(formato):
+        flash('Formato de exportação indisponível!', 'danger')
+        return redirect(url_for('emprestimos.emprestimos'))
     
-    if pdf:
-        return pdf
-    else:
-        flash('Erro ao gerar o PDF!', 'danger')
-        return redirect(url_for('emprestimos'))
+    return resposta_exportacao(consulta_exportacao_emprestimos(), COLUNAS_EXPORTACAO_EMPRESTIMOS, formato, 'emprestimos')
@@ -1,177 +1,309 @@
-from flask import render_template, request, redirect, url_for, flash, send_file, abort
-from app import app, db
-from app.models.models import Livro
-from app.utils.pdf_utils import generate_pdf
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, send_file, abort, Response
+from app import db
+from app.models.models import Livro, excluir
+from app.services.livros import validar_um_livro, criar_livro, atualizar_livro
+from app.utils.relatorios import solicitar_relatorio
+from app.utils.pdf_utils import TabelaPdf, ColunaPdf
+from app.utils.exportacao import formato_disponivel, resposta_exportacao
+from app.utils.consultas import orcamento_consultas
+from app.utils.banco import somente_leitura
+from app.utils.paginacao import Listagem, paginar, parametros_paginacao, filtro_prefixo
+from app.utils.busca import buscar_livros
+from app.utils.autocomplete import parametros_autocomplete, resposta_autocomplete
+from app.utils.cache import CacheTTL
+from app.utils.cache_respostas import cache_pagina
+from app.utils.capa_utils import (salvar_capa_stream, caminho_capa, remover_capa, agendar_variantes,
+                                  obter_variante, CapaInvalida, TAMANHOS_CAPA,
+                                  TAMANHO_ORIGINAL, MIMETYPE_VARIANTE)
+from sqlalchemy.orm import undefer
 from datetime import datetime
-import io
+import os
 
-# Função para verificar extensão de arquivo
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+livros_bp = Blueprint('livros', __name__)
 
-@app.route('/livros')
+# Remove do disco uma capa que não é mais referenciada por nenhum livro
+def descartar_capa_orfa(capa_hash):
+    # Livros excluídos logicamente também contam: a capa continua com eles
+    if capa_hash and not Livro.query.filter_by(capa_hash=capa_hash).execution_options(incluir_excluidos=True).first():
+        remover_capa(capa_hash)
+
+# Grava a capa enviada no formulário, lida do upload em blocos, e agenda a
+# geração das miniaturas. Retorna (hash, tamanho, tipo) ou None se não houver
+# arquivo ou se ele não for PNG/JPEG (conferido pelo conteúdo)
+def receber_capa():
+    file = request.files.get('capa')
+    if not file or not file.filename:
+        return None
+    try:
+        capa = salvar_capa_stream(file.stream)
+    except CapaInvalida:
+        flash('Formato de imagem inválido! Use PNG, JPG ou JPEG.', 'warning')
+        return None
+    agendar_variantes(capa[0])
+    return capa
+
+# Colunas aceitas no parâmetro ?ordem= da listagem (todas com índice (coluna, id))
+ORDENACAO_LIVROS = {
+    'titulo': Livro.titulo,
+    'autor': Livro.autor,
+    'ano': Livro.ano_publicacao,
+    'categoria': Livro.categoria,
+}
+
+def listagem_livros():
+    """Consulta da listagem de livros com os filtros e a ordenação da URL"""
+    categoria = request.args.get('categoria', '').strip()
+    autor = request.args.get('autor', '').strip()
+    ano_min = request.args.get('ano_min', type=int)
+    ano_max = request.args.get('ano_max', type=int)
+
+    # Total de empréstimos vem de uma subconsulta agregada no mesmo SELECT
+    query = Livro.query.options(undefer(Livro.total_emprestimos))
+    if categoria:
+        query = query.filter(Livro.categoria == categoria)
+    if autor:
+        query = query.filter(filtro_prefixo(Livro.autor, autor))
+    if ano_min is not None:
+        query = query.filter(Livro.ano_publicacao >= ano_min)
+    if ano_max is not None:
+        query = query.filter(Livro.ano_publicacao <= ano_max)
+
+    coluna, descendente, cursor, por_pagina = parametros_paginacao(ORDENACAO_LIVROS, 'titulo')
+    return Listagem(query, coluna, Livro.id, descendente, cursor, por_pagina)
+
+@livros_bp.route('/livros')
+@somente_leitura
+@orcamento_consultas(2)
+@cache_pagina('livros', 'emprestimos')
 def livros():
-    """Lista todos os livros"""
-    livros = Livro.query.all()
-    return render_template('livros/livros.html', livros=livros)
+    """Lista os livros com filtros, ordenação e paginação por cursor"""
+    pagina = paginar(*listagem_livros())
+    return render_template('livros/livros.html', livros=pagina.itens, pagina=pagina)
+
+@livros_bp.route('/livros/busca')
+@somente_leitura
+@orcamento_consultas(3)
+@cache_pagina('livros', 'emprestimos')
+def busca_livros():
+    """Busca livros por título, autor ou categoria, em ordem de relevância"""
+    busca = request.args.get('q', '').strip()
+    if not busca:
+        return redirect(url_for('livros.livros'))
+
+    livros = buscar_livros(busca, limite=current_app.config['ITENS_POR_PAGINA_MAX'])
+    return render_template('livros/livros.html', livros=livros, pagina=None, busca=busca)
+
+# Sugestões recentes do autocomplete, guardadas por alguns segundos em cada processo
+cache_autocomplete = CacheTTL()
+
+@livros_bp.route('/livros/autocomplete')
+@somente_leitura
+@orcamento_consultas(2)
+def autocomplete_livros():
+    """Sugestões de livros (id e rótulo) pela busca textual de título, autor e categoria"""
+    termo, limite = parametros_autocomplete()
+    chave = (termo.lower(), limite)
+    sugestoes = cache_autocomplete.get(chave)
+    if sugestoes is None:
+        colunas = [Livro.id, Livro.titulo, Livro.autor, Livro.ano_publicacao]
+        if termo:
+            livros = buscar_livros(termo, limite, colunas=colunas)
+        else:
+            livros = db.session.query(*colunas).order_by(Livro.titulo, Livro.id).limit(limite).all()
+        sugestoes = [{'id': livro.id, 'label': f'{livro.titulo} - {livro.autor} ({livro.ano_publicacao})'}
+                     for livro in livros]
+        cache_autocomplete.set(chave, sugestoes, ttl=current_app.config['AUTOCOMPLETE_CACHE_SEGUNDOS'])
+    return resposta_autocomplete(sugestoes)
 
-@app.route('/create_livro', methods=['GET', 'POST'])
+@livros_bp.route('/create_livro', methods=['GET', 'POST'])
 def create_livro():
     """Criar um novo livro"""
     if request.method == 'POST':
-        titulo = request.form['titulo'].strip()
-        autor = request.form['autor'].strip()
-        isbn = request.form['isbn'].strip()
-        ano_publicacao = request.form['ano_publicacao'].strip()
-        categoria = request.form['categoria'].strip()
+        # Validações: campos primeiro, depois uma única consulta confere o ISBN
+        # (com ou sem hífens, pelo índice único em isbn_normalizado)
+        erro, dados = validar_um_livro(request.form)
+        if erro:
+            flash(erro, 'danger')
+            return redirect(url_for('livros.create_livro'))
         
-        # Validações
-        if not all([titulo, autor, isbn, ano_publicacao, categoria]):
-            flash('Todos os campos obrigatórios devem ser preenchidos!', 'danger')
-            return redirect(url_for('create_livro'))
+        # Processar upload de imagem (só a referência à capa vai para o banco)
+        capa_hash, capa_tamanho, capa_tipo = receber_capa() or (None, None, None)
         
-        # Validar ISBN (formato básico: 10 ou 13 dígitos, pode ter hífens)
-        isbn_clean = isbn.replace('-', '').replace(' ', '')
-        if not (isbn_clean.isdigit() and len(isbn_clean) in [10, 13]):
-            flash('ISBN inválido! Deve conter 10 ou 13 dígitos.', 'danger')
-            return redirect(url_for('create_livro'))
-        
-        # Validar ano
-        try:
-            ano = int(ano_publicacao)
-            if ano < 1000 or ano > 2100:
-                flash('Ano de publicação inválido!', 'danger')
-                return redirect(url_for('create_livro'))
-        except ValueError:
-            flash('Ano de publicação deve ser um número!', 'danger')
-            return redirect(url_for('create_livro'))
-        
-        # Verificar ISBN duplicado
-        if Livro.query.filter_by(isbn=isbn).first():
-            flash('ISBN já cadastrado!', 'danger')
-            return redirect(url_for('create_livro'))
-        
-        # Processar upload de imagem
-        capa_dados = None
-        capa_tipo = None
-        if 'capa' in request.files:
-            file = request.files['capa']
-            if file and file.filename and allowed_file(file.filename):
-                capa_dados = file.read()
-                capa_tipo = file.mimetype
-            elif file and file.filename and not allowed_file(file.filename):
-                flash('Formato de imagem inválido! Use PNG, JPG ou JPEG.', 'warning')
-        
-        new_livro = Livro(titulo=titulo, autor=autor, isbn=isbn, 
-                         ano_publicacao=ano, categoria=categoria,
-                         capa_dados=capa_dados, capa_tipo=capa_tipo)
-        db.session.add(new_livro)
-        db.session.commit()
-        flash(f'Livro "{titulo}" cadastrado com sucesso!', 'success')
-        return redirect(url_for('livros'))
+        erro, _ = criar_livro(dados, capa_hash=capa_hash, capa_tipo=capa_tipo, capa_tamanho=capa_tamanho)
+        if erro:
+            # A capa recém-gravada não ficou com nenhum livro
+            descartar_capa_orfa(capa_hash)
+            flash(erro, 'danger')
+            return redirect(url_for('livros.create_livro'))
+        flash(f'Livro "{dados["titulo"]}" cadastrado com sucesso!', 'success')
+        return redirect(url_for('livros.livros'))
     
     return render_template('livros/create_livro.html')
 
-@app.route('/update_livro/<int:id>', methods=['GET', 'POST'])
+@livros_bp.route('/update_livro/<int:id>', methods=['GET', 'POST'])
 def update_livro(id):
     """Atualizar um livro existente"""
     livro = Livro.query.get_or_404(id)
     
     if request.method == 'POST':
-        titulo = request.form['titulo'].strip()
-        autor = request.form['autor'].strip()
-        isbn = request.form['isbn'].strip()
-        ano_publicacao = request.form['ano_publicacao'].strip()
-        categoria = request.form['categoria'].strip()
-        
-        # Validações
-        if not all([titulo, autor, isbn, ano_publicacao, categoria]):
-            flash('Todos os campos obrigatórios devem ser preenchidos!', 'danger')
-            return redirect(url_for('update_livro', id=id))
-        
-        # Validar ISBN
-        isbn_clean = isbn.replace('-', '').replace(' ', '')
-        if not (isbn_clean.isdigit() and len(isbn_clean) in [10, 13]):
-            flash('ISBN inválido! Deve conter 10 ou 13 dígitos.', 'danger')
-            return redirect(url_for('update_livro', id=id))
-        
-        # Validar ano
-        try:
-            ano = int(ano_publicacao)
-            if ano < 1000 or ano > 2100:
-                flash('Ano de publicação inválido!', 'danger')
-                return redirect(url_for('update_livro', id=id))
-        except ValueError:
-            flash('Ano de publicação deve ser um número!', 'danger')
-            return redirect(url_for('update_livro', id=id))
-        
-        # Verificar ISBN duplicado (exceto o próprio livro)
-        existing = Livro.query.filter_by(isbn=isbn).first()
-        if existing and existing.id != id:
-            flash('ISBN já cadastrado em outro livro!', 'danger')
-            return redirect(url_for('update_livro', id=id))
+        # Validações (sem o campo de exemplares, o livro mantém os que tem)
+        formulario = request.form.to_dict()
+        formulario.setdefault('exemplares', str(livro.exemplares))
+        erro, dados = validar_um_livro(formulario, livro)
+        if erro:
+            flash(erro, 'danger')
+            return redirect(url_for('livros.update_livro', id=id))
         
         # Processar upload de nova imagem
-        if 'capa' in request.files:
-            file = request.files['capa']
-            if file and file.filename and allowed_file(file.filename):
-                livro.capa_dados = file.read()
-                livro.capa_tipo = file.mimetype
-            elif file and file.filename and not allowed_file(file.filename):
-                flash('Formato de imagem inválido! Use PNG, JPG ou JPEG.', 'warning')
+        capa_antiga = livro.capa_hash
+        capa = receber_capa()
+        if capa:
+            livro.capa_hash, livro.capa_tamanho, livro.capa_tipo = capa
         
-        livro.titulo = titulo
-        livro.autor = autor
-        livro.isbn = isbn
-        livro.ano_publicacao = ano
-        livro.categoria = categoria
-        db.session.commit()
-        flash(f'Livro "{titulo}" atualizado com sucesso!', 'success')
-        return redirect(url_for('livros'))
+        erro = atualizar_livro(livro, dados)
+        if erro:
+            # A nova capa já está em disco, mas a edição foi desfeita
+            if capa and capa[0] != capa_antiga:
+                descartar_capa_orfa(capa[0])
+            flash(erro, 'danger')
+            return redirect(url_for('livros.update_livro', id=id))
+        if capa_antiga != livro.capa_hash:
+            descartar_capa_orfa(capa_antiga)
+        flash(f'Livro "{dados["titulo"]}" atualizado com sucesso!', 'success')
+        return redirect(url_for('livros.livros'))
     
     return render_template('livros/update_livro.html', livro=livro)
 
-@app.route('/capa_livro/<int:id>')
+@livros_bp.route('/capa_livro/<int:id>')
 def capa_livro(id):
-    livro=Livro.query.get_or_404(id)
-    if livro.capa_dados and livro.capa_tipo:
-        return send_file(
-            io.BytesIO(livro.capa_dados),
-            mimetype=livro.capa_tipo,
+    """Serve a capa de um livro (original ou miniatura) com ETag, Last-Modified e suporte a Range"""
+    tamanho = request.args.get('tamanho', TAMANHO_ORIGINAL)
+    if tamanho != TAMANHO_ORIGINAL and tamanho not in TAMANHOS_CAPA:
+        abort(404)
+
+    # Busca apenas a referência da capa, sem carregar o restante do livro
+    capa = db.session.query(Livro.capa_hash, Livro.capa_tipo).filter(Livro.id == id).first()
+    if not capa or not capa.capa_hash or not capa.capa_tipo:
+        abort(404)
+
+    caminho = caminho_capa(capa.capa_hash)
+    try:
+        modificado_em = os.stat(caminho).st_mtime
+    except FileNotFoundError:
+        abort(404)
+
+    # URLs com ?v=<hash> apontam para um conteúdo que nunca muda
+    versionada = request.args.get('v') == capa.capa_hash
+    etag = capa.capa_hash if tamanho == TAMANHO_ORIGINAL else f'{capa.capa_hash}-{tamanho}'
+
+    # Responde 304 antes de abrir (ou gerar) o arquivo se o navegador já tem esta versão
+    validacao = Response()
+    validacao.set_etag(etag)
+    validacao.last_modified = modificado_em
+    validacao.make_conditional(request)
+    if validacao.status_code == 304:
+        return aplicar_cache_capa(validacao, versionada)
+
+    mimetype = capa.capa_tipo
+    if tamanho != TAMANHO_ORIGINAL:
+        variante = obter_variante(capa.capa_hash, tamanho)
+        if variante:
+            caminho, mimetype = variante, MIMETYPE_VARIANTE
+        else:
+            # Serve o original no lugar da miniatura, mas sem cache imutável:
+            # a URL da miniatura deve receber a variante quando ela for gerada
+            etag = capa.capa_hash
+            versionada = False
+
+    resposta = send_file(
+        caminho,
+        mimetype=mimetype,
+        etag=etag,
+        last_modified=modificado_em,
+        conditional=True,
     )
+    return aplicar_cache_capa(resposta, versionada)
+
+# Define o Cache-Control da capa: imutável quando a URL carrega o hash
+def aplicar_cache_capa(resposta, versionada):
+    if versionada:
+        resposta.cache_control.public = True
+        resposta.cache_control.max_age = current_app.config['CAPA_CACHE_MAX_AGE']
+        resposta.cache_control.immutable = True
+        resposta.cache_control.no_cache = None
     else:
-        abort(404)
-@app.route('/livros/pdf')
+        resposta.cache_control.no_cache = True
+    return resposta
+
+@livros_bp.route('/livros/pdf')
+@somente_leitura
+@orcamento_consultas(3)
 def livros_pdf():
-    """Exportar lista de livros para PDF"""
-    livros = Livro.query.all()
+    """Exportar lista de livros para PDF (gerado em segundo plano)"""
+    query = Livro.query.options(undefer(Livro.total_emprestimos))
     
-    context = {
-        'livros': livros,
-        'data_geracao': datetime.now().strftime('%d/%m/%Y às %H:%M'),
-        'ano_atual': datetime.now().year
-    }
-    
-    pdf = generate_pdf('livros/livros_pdf.html', context, filename='relatorio_livros.pdf')
+    # total_emprestimos depende dos empréstimos de cada livro
+    return solicitar_relatorio('livros', 'livros/livros_pdf.html', query, 'livros', ('livros', 'emprestimos'),
+                               TABELA_PDF_LIVROS)
+
+# Colunas do relatório em PDF no backend 'tabela' (as mesmas de livros_pdf.html)
+TABELA_PDF_LIVROS = TabelaPdf('Relatório de Livros', 'Total de Livros', 'Nenhum livro cadastrado.', [
+    ColunaPdf('Título', 28, 'LEFT', lambda livro: livro.titulo),
+    ColunaPdf('Autor', 20, 'LEFT', lambda livro: livro.autor),
+    ColunaPdf('ISBN', 16, 'LEFT', lambda livro: livro.isbn),
+    ColunaPdf('Ano', 8, 'CENTER', lambda livro: livro.ano_publicacao),
+    ColunaPdf('Categoria', 18, 'LEFT', lambda livro: livro.categoria),
+    ColunaPdf('Emp.', 10, 'CENTER', lambda livro: livro.total_emprestimos or 0),
+])
+
+# Colunas das exportações em CSV, NDJSON e XLSX
+COLUNAS_EXPORTACAO_LIVROS = [
+    ('id', lambda livro: livro.id),
+    ('titulo', lambda livro: livro.titulo),
+    ('autor', lambda livro: livro.autor),
+    ('isbn', lambda livro: livro.isbn),
+    ('ano_publicacao', lambda livro: livro.ano_publicacao),
+    ('categoria', lambda livro: livro.categoria),
+    ('exemplares', lambda livro: livro.exemplares),
+    ('disponiveis', lambda livro: livro.disponiveis),
+    ('total_emprestimos', lambda livro: livro.total_emprestimos),
+]
+
+def consulta_exportacao_livros():
+    """Todos os livros, na ordem das exportações (rota e flask catalogo exportar)"""
+    return Livro.query.options(undefer(Livro.total_emprestimos)).order_by(Livro.id)
+
+@livros_bp.route('/livros/exportar.<formato>')
+@somente_leitura
+def exportar_livros(formato):
+    """Exportar todos os livros em CSV, NDJSON ou XLSX, enviados enquanto são lidos do banco"""
+    if not formato_disponivel(formato):
+        flash('Formato de exportação indisponível!', 'danger')
+        return redirect(url_for('livros.livros'))
     
-    if pdf:
-        return pdf
-    else:
-        flash('Erro ao gerar o PDF!', 'danger')
-        return redirect(url_for('livros'))
+    return resposta_exportacao(consulta_exportacao_livros(), COLUNAS_EXPORTACAO_LIVROS, formato, 'livros')
 
-@app.route('/delete_livro/<int:id>')
+@livros_bp.route('/delete_livro/<int:id>', methods=['POST'])
 def delete_livro(id):
-    """Deletar um livro"""
-    livro = Livro.query.get_or_404(id)
+    """Excluir um livro (exclusão lógica: o registro e a capa continuam guardados)"""
+    # A linha fica travada até o commit: um empréstimo simultâneo espera a
+    # exclusão e então não encontra mais o livro (ver reservar_exemplares)
+    livro = db.session.get(Livro, id, with_for_update=True)
+    if livro is None:
+        abort(404)
+    
+    # Verificar se o livro está emprestado (pelo contador, sem carregar os empréstimos)
+    if livro.emprestados:
+        flash(f'Não é possível excluir o livro "{livro.titulo}" pois há {livro.emprestados} exemplar(es) emprestado(s)!', 'danger')
+        return redirect(url_for('livros.livros'))
     
-    # Verificar se o livro está em algum empréstimo
-    if livro.emprestimos:
-        flash(f'Não é possível excluir o livro "{livro.titulo}" pois ele está vinculado a {len(livro.emprestimos)} empréstimo(s)!', 'danger')
-        return redirect(url_for('livros'))
+    # Empréstimos já devolvidos continuam vinculados ao livro (histórico)
+    if livro.total_emprestimos:
+        flash(f'Não é possível excluir o livro "{livro.titulo}" pois ele está vinculado a {livro.total_emprestimos} empréstimo(s)!', 'danger')
+        return redirect(url_for('livros.livros'))
     
     titulo = livro.titulo
-    db.session.delete(livro)
+    excluir(livro)
     db.session.commit()
     flash(f'Livro "{titulo}" excluído com sucesso!', 'success')
-    return redirect(url_for('livros'))
+    return redirect(url_for('livros.livros'))
@@ -0,0 +1,41 @@
+from flask import Blueprint, Response
+from sqlalchemy.pool import QueuePool
+from app import db
+from app.utils.consultas import orcamento_consultas
+from app.utils.metricas import metricas_processo, formatar_rotulos
+from app.utils.cache_respostas import metricas_cache_respostas
+
+metricas_bp = Blueprint('metricas', __name__)
+
+@metricas_bp.route('/metrics')
+@orcamento_consultas(0)
+def metrics():
+    """Métricas deste processo no formato de texto do Prometheus"""
+    extras = []
+    cache = metricas_cache_respostas()
+    if cache is not None:
+        extras += ['# HELP biblioteca_cache_respostas_acertos_total Páginas e fragmentos servidos do cache',
+                   '# TYPE biblioteca_cache_respostas_acertos_total counter',
+                   f'biblioteca_cache_respostas_acertos_total {cache["acertos"]}',
+                   '# HELP biblioteca_cache_respostas_falhas_total Páginas e fragmentos ausentes do cache',
+                   '# TYPE biblioteca_cache_respostas_falhas_total counter',
+                   f'biblioteca_cache_respostas_falhas_total {cache["falhas"]}',
+                   '# HELP biblioteca_cache_respostas_itens Itens guardados no cache',
+                   '# TYPE biblioteca_cache_respostas_itens gauge',
+                   f'biblioteca_cache_respostas_itens {cache["itens"]}']
+    extras += metricas_pool()
+    return Response(metricas_processo().exportar(extras), mimetype='text/plain; version=0.0.4')
+
+def metricas_pool():
+    """Conexões de cada pool (banco principal e réplica) neste processo"""
+    pools = {'principal' if chave is None else chave: engine.pool for chave, engine in db.engines.items()
+             if isinstance(engine.pool, QueuePool)}
+    linhas = []
+    for nome, descricao, valor in (
+        ('biblioteca_db_conexoes_em_uso', 'Conexões emprestadas às requisições', lambda pool: pool.checkedout()),
+        ('biblioteca_db_conexoes_livres', 'Conexões abertas aguardando uso', lambda pool: pool.checkedin()),
+        ('biblioteca_db_conexoes_excedentes', 'Conexões além de DB_POOL_TAMANHO', lambda pool: max(pool.overflow(), 0)),
+    ):
+        linhas += [f'# HELP {nome} {descricao}', f'# TYPE {nome} gauge']
+        linhas += [f'{nome}{formatar_rotulos({"banco": banco})} {valor(pool)}' for banco, pool in sorted(pools.items())]
+    return linhas
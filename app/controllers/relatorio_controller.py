@@ -0,0 +1,42 @@
+from flask import Blueprint, current_app, render_template, send_file, abort, jsonify, url_for
+from app.utils.relatorios import (estado_relatorio, caminhos_relatorio, PADRAO_ID_RELATORIO,
+                                  CONCLUIDO)
+
+relatorios_bp = Blueprint('relatorios', __name__)
+
+def validar_id_relatorio(id):
+    """Aceita apenas ids no formato gerado por id_relatorio() (evita acesso a outros arquivos)"""
+    if not PADRAO_ID_RELATORIO.match(id):
+        abort(404)
+    return id.rsplit('-', 1)[0]
+
+@relatorios_bp.route('/relatorios/<id>')
+def relatorio(id):
+    """Página de acompanhamento de um relatório em PDF"""
+    nome = validar_id_relatorio(id)
+    estado = estado_relatorio(id)
+    if estado['estado'] is None:
+        abort(404)
+    return render_template('relatorios/relatorio.html', id=id, nome=nome, estado=estado)
+
+@relatorios_bp.route('/relatorios/<id>/status')
+def status_relatorio(id):
+    """Estado de um relatório em JSON (na_fila, processando, concluido ou erro)"""
+    validar_id_relatorio(id)
+    estado = estado_relatorio(id)
+    if estado['estado'] is None:
+        abort(404)
+    if estado['estado'] == CONCLUIDO:
+        estado['download'] = url_for('relatorios.download_relatorio', id=id)
+    return jsonify(id=id, **estado)
+
+@relatorios_bp.route('/relatorios/<id>/download')
+def download_relatorio(id):
+    """Download de um relatório já gerado"""
+    nome = validar_id_relatorio(id)
+    caminho = caminhos_relatorio(current_app.config['RELATORIOS_FOLDER'], id)['pdf']
+    try:
+        return send_file(caminho, mimetype='application/pdf', as_attachment=True,
+                         download_name=f'relatorio_{nome}.pdf', conditional=True)
+    except FileNotFoundError:
+        abort(404)
@@ -1,112 +1,160 @@
-from flask import render_template, request, redirect, url_for, flash
-from app import app, db
-from app.models.models import Usuario
-from app.utils.pdf_utils import generate_pdf
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, abort
+from app import db
+from app.models.models import Usuario, excluir
+from app.services.usuarios import validar_um_usuario, criar_usuario, atualizar_usuario
+from app.utils.relatorios import solicitar_relatorio
+from app.utils.pdf_utils import TabelaPdf, ColunaPdf
+from app.utils.exportacao import formato_disponivel, resposta_exportacao
+from app.utils.consultas import orcamento_consultas
+from app.utils.banco import somente_leitura
+from app.utils.paginacao import Listagem, paginar, parametros_paginacao, filtro_prefixo
+from app.utils.autocomplete import parametros_autocomplete, resposta_autocomplete
+from app.utils.cache import CacheTTL
+from app.utils.cache_respostas import cache_pagina
+from sqlalchemy.orm import undefer
 from datetime import datetime
-import re
 
-@app.route('/usuarios')
+usuarios_bp = Blueprint('usuarios', __name__)
+
+# Colunas aceitas no parâmetro ?ordem= da listagem
+ORDENACAO_USUARIOS = {
+    'nome': Usuario.nome,
+    'email': Usuario.email,
+}
+
+def listagem_usuarios():
+    """Consulta da listagem de usuários com o filtro e a ordenação da URL"""
+    nome = request.args.get('nome', '').strip()
+
+    query = Usuario.query.options(undefer(Usuario.total_emprestimos))
+    if nome:
+        query = query.filter(filtro_prefixo(Usuario.nome, nome))
+
+    coluna, descendente, cursor, por_pagina = parametros_paginacao(ORDENACAO_USUARIOS, 'nome')
+    return Listagem(query, coluna, Usuario.id, descendente, cursor, por_pagina)
+
+@usuarios_bp.route('/usuarios')
+@somente_leitura
+@orcamento_consultas(2)
+@cache_pagina('usuarios', 'emprestimos')
 def usuarios():
-    """Lista todos os usuários"""
-    usuarios = Usuario.query.all()
-    return render_template('usuarios/usuarios.html', usuarios=usuarios)
+    """Lista os usuários com filtro por nome, ordenação e paginação por cursor"""
+    pagina = paginar(*listagem_usuarios())
+    return render_template('usuarios/usuarios.html', usuarios=pagina.itens, pagina=pagina)
 
-@app.route('/create_usuario', methods=['GET', 'POST'])
+# Sugestões recentes do autocomplete, guardadas por alguns segundos em cada processo
+cache_autocomplete = CacheTTL()
+
+@usuarios_bp.route('/usuarios/autocomplete')
+@somente_leitura
+@orcamento_consultas(1)
+def autocomplete_usuarios():
+    """Sugestões de usuários (id e rótulo) cujo nome começa com o termo digitado"""
+    termo, limite = parametros_autocomplete()
+    chave = (termo.lower(), limite)
+    sugestoes = cache_autocomplete.get(chave)
+    if sugestoes is None:
+        query = db.session.query(Usuario.id, Usuario.nome, Usuario.email)
+        if termo:
+            query = query.filter(filtro_prefixo(Usuario.nome, termo))
+        sugestoes = [{'id': usuario.id, 'label': f'{usuario.nome} - {usuario.email}'}
+                     for usuario in query.order_by(Usuario.nome, Usuario.id).limit(limite)]
+        cache_autocomplete.set(chave, sugestoes, ttl=current_app.config['AUTOCOMPLETE_CACHE_SEGUNDOS'])
+    return resposta_autocomplete(sugestoes)
+
+@usuarios_bp.route('/create_usuario', methods=['GET', 'POST'])
 def create_usuario():
     """Criar um novo usuário"""
     if request.method == 'POST':
-        nome = request.form['nome'].strip()
-        email = request.form['email'].strip()
-        
-        # Validações
-        if not nome or not email:
-            flash('Nome e email são obrigatórios!', 'danger')
-            return redirect(url_for('create_usuario'))
-        
-        # Validar formato de email
-        email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_regex, email):
-            flash('Email inválido!', 'danger')
-            return redirect(url_for('create_usuario'))
-        
-        # Verificar email duplicado
-        if Usuario.query.filter_by(email=email).first():
-            flash('Email já cadastrado!', 'danger')
-            return redirect(url_for('create_usuario'))
+        # Validações: campos primeiro, depois uma única consulta confere o email
+        erro, dados = validar_um_usuario(request.form)
+        if erro:
+            flash(erro, 'danger')
+            return redirect(url_for('usuarios.create_usuario'))
         
-        new_usuario = Usuario(nome=nome, email=email)
-        db.session.add(new_usuario)
-        db.session.commit()
-        flash(f'Usuário "{nome}" cadastrado com sucesso!', 'success')
-        return redirect(url_for('usuarios'))
+        criar_usuario(dados)
+        flash(f'Usuário "{dados["nome"]}" cadastrado com sucesso!', 'success')
+        return redirect(url_for('usuarios.usuarios'))
     
     return render_template('usuarios/create_usuario.html')
 
-@app.route('/update_usuario/<int:id>', methods=['GET', 'POST'])
+@usuarios_bp.route('/update_usuario/<int:id>', methods=['GET', 'POST'])
 def update_usuario(id):
     """Atualizar um usuário existente"""
     usuario = Usuario.query.get_or_404(id)
     
     if request.method == 'POST':
-        nome = request.form['nome'].strip()
-        email = request.form['email'].strip()
+        # Validações (o email do próprio usuário não conta como duplicado)
+        erro, dados = validar_um_usuario(request.form, usuario_id=id)
+        if erro:
+            flash(erro, 'danger')
+            return redirect(url_for('usuarios.update_usuario', id=id))
         
-        # Validações
-        if not nome or not email:
-            flash('Nome e email são obrigatórios!', 'danger')
-            return redirect(url_for('update_usuario', id=id))
-        
-        # Validar formato de email
-        email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_regex, email):
-            flash('Email inválido!', 'danger')
-            return redirect(url_for('update_usuario', id=id))
-        
-        # Verificar email duplicado (exceto o próprio usuário)
-        existing = Usuario.query.filter_by(email=email).first()
-        if existing and existing.id != id:
-            flash('Email já cadastrado em outro usuário!', 'danger')
-            return redirect(url_for('update_usuario', id=id))
-        
-        usuario.nome = nome
-        usuario.email = email
-        db.session.commit()
-        flash(f'Usuário "{nome}" atualizado com sucesso!', 'success')
-        return redirect(url_for('usuarios'))
+        atualizar_usuario(usuario, dados)
+        flash(f'Usuário "{dados["nome"]}" atualizado com sucesso!', 'success')
+        return redirect(url_for('usuarios.usuarios'))
     
     return render_template('usuarios/update_usuario.html', usuario=usuario)
 
-@app.route('/delete_usuario/<int:id>')
+@usuarios_bp.route('/delete_usuario/<int:id>', methods=['POST'])
 def delete_usuario(id):
-    """Deletar um usuário"""
-    usuario = Usuario.query.get_or_404(id)
+    """Excluir um usuário (exclusão lógica)"""
+    # A linha fica travada até o commit: um empréstimo simultâneo termina antes
+    # (e é contado abaixo) ou espera a exclusão e não encontra mais o usuário
+    # (ver travar_usuarios)
+    usuario = db.session.get(Usuario, id, with_for_update=True)
+    if usuario is None:
+        abort(404)
     
-    # Verificar se o usuário tem empréstimos
-    if usuario.emprestimos:
-        flash(f'Não é possível excluir o usuário "{usuario.nome}" pois ele possui {len(usuario.emprestimos)} empréstimo(s) vinculado(s)!', 'danger')
-        return redirect(url_for('usuarios'))
+    # Verificar se o usuário tem empréstimos (pelo total, sem carregar a coleção).
+    # O total é lido depois do lock, em outra consulta: no PostgreSQL uma
+    # subconsulta no próprio SELECT ... FOR UPDATE usaria o snapshot de antes da espera
+    if usuario.total_emprestimos:
+        flash(f'Não é possível excluir o usuário "{usuario.nome}" pois ele possui {usuario.total_emprestimos} empréstimo(s) vinculado(s)!', 'danger')
+        return redirect(url_for('usuarios.usuarios'))
     
     nome = usuario.nome
-    db.session.delete(usuario)
+    excluir(usuario)
     db.session.commit()
     flash(f'Usuário "{nome}" excluído com sucesso!', 'success')
-    return redirect(url_for('usuarios'))
+    return redirect(url_for('usuarios.usuarios'))
 
-@app.route('/usuarios/pdf')
+@usuarios_bp.route('/usuarios/pdf')
+@somente_leitura
+@orcamento_consultas(3)
 def usuarios_pdf():
-    """Exportar lista de usuários para PDF"""
-    usuarios = Usuario.query.all()
-    
-    context = {
-        'usuarios': usuarios,
-        'data_geracao': datetime.now().strftime('%d/%m/%Y às %H:%M'),
-        'ano_atual': datetime.now().year
-    }
+    """Exportar lista de usuários para PDF (gerado em segundo plano)"""
+    query = Usuario.query.options(undefer(Usuario.total_emprestimos))
     
-    pdf = generate_pdf('usuarios/usuarios_pdf.html', context, filename='relatorio_usuarios.pdf')
+    return solicitar_relatorio('usuarios', 'usuarios/usuarios_pdf.html', query, 'usuarios',
+                               ('usuarios', 'emprestimos'), TABELA_PDF_USUARIOS)
+
+# Colunas do relatório em PDF no backend 'tabela' (as mesmas de usuarios_pdf.html)
+TABELA_PDF_USUARIOS = TabelaPdf('Relatório de Usuários', 'Total de Usuários', 'Nenhum usuário cadastrado.', [
+    ColunaPdf('ID', 8, 'CENTER', lambda usuario: usuario.id),
+    ColunaPdf('Nome', 40, 'LEFT', lambda usuario: usuario.nome),
+    ColunaPdf('Email', 38, 'LEFT', lambda usuario: usuario.email),
+    ColunaPdf('Emp.', 14, 'CENTER', lambda usuario: usuario.total_emprestimos or 0),
+])
+
+# Colunas das exportações em CSV, NDJSON e XLSX
+COLUNAS_EXPORTACAO_USUARIOS = [
+    ('id', lambda usuario: usuario.id),
+    ('nome', lambda usuario: usuario.nome),
+    ('email', lambda usuario: usuario.email),
+    ('total_emprestimos', lambda usuario: usuario.total_emprestimos),
+]
+
+def consulta_exportacao_usuarios():
+    """Todos os usuários, na ordem das exportações (rota e flask catalogo exportar)"""
+    return Usuario.query.options(undefer(Usuario.total_emprestimos)).order_by(Usuario.id)
+
+@usuarios_bp.route('/usuarios/exportar.<formato>')
+@somente_leitura
+def exportar_usuarios(formato):
+    """Exportar todos os usuários em CSV, NDJSON ou XLSX, enviados enquanto são lidos do banco"""
+    if not formato_disponivel(formato):
+        flash('Formato de exportação indisponível!', 'danger')
+        return redirect(url_for('usuarios.usuarios'))
     
-    if pdf:
-        return pdf
-    else:
-        flash('Erro ao gerar o PDF!', 'danger')
-        return redirect(url_for('usuarios'))
+    return resposta_exportacao(consulta_exportacao_usuarios(), COLUNAS_EXPORTACAO_USUARIOS, formato, 'usuarios')
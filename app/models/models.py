@@ -1,17 +1,71 @@
 from app import db
+from sqlalchemy import event
+from sqlalchemy.orm import validates, with_loader_criteria
 from datetime import datetime
 
+def normalizar_isbn(isbn):
+    """ISBN sem hífens e espaços, com o dígito X em maiúscula ('85-359-0277-x' -> '853590277X')"""
+    return ''.join(isbn.split()).replace('-', '').upper()
+
 class Livro(db.Model):
     __tablename__ = 'livros'
     
     id = db.Column(db.Integer, primary_key=True)
     titulo = db.Column(db.String(200), nullable=False)
     autor = db.Column(db.String(150), nullable=False)
-    isbn = db.Column(db.String(20), unique=True, nullable=False)
+    isbn = db.Column(db.String(20), nullable=False)
+    # Chave das buscas e da unicidade: o mesmo ISBN digitado com ou sem
+    # hífens é o mesmo livro. Preenchida a partir de isbn (ver definir_isbn)
+    isbn_normalizado = db.Column(db.String(20), nullable=False)
     ano_publicacao = db.Column(db.Integer, nullable=False)
     categoria = db.Column(db.String(100), nullable=False)
-    capa_dados = db.Column(db.LargeBinary, nullable=True)
+    # A imagem da capa fica fora da tabela (ver app/utils/capa_utils.py);
+    # aqui guardamos apenas a referência por conteúdo e os metadados
+    capa_hash = db.Column(db.String(64), nullable=True, index=True)
     capa_tipo = db.Column(db.String(50), nullable=True)
+    capa_tamanho = db.Column(db.Integer, nullable=True)
+    # Acervo do título: total de exemplares e quantos estão na estante. O
+    # contador é mantido pelas rotinas de app/utils/circulacao.py, então saber
+    # se um livro está disponível não exige percorrer os empréstimos
+    exemplares = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    disponiveis = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Exclusão lógica: preenchido quando o livro é excluído (ver EXCLUSAO_LOGICA)
+    excluido_em = db.Column(db.DateTime, nullable=True)
+
+    # Índices compostos (coluna, id) atendem à ordenação e à paginação por
+    # cursor da listagem; lower(autor) atende ao filtro por prefixo do autor.
+    # São parciais, só com os livros não excluídos, que são os consultados;
+    # o ISBN só precisa ser único entre eles
+    __table_args__ = (
+        db.Index('ix_livros_titulo_id', titulo, id,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        db.Index('ix_livros_autor_id', autor, id,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        db.Index('ix_livros_ano_publicacao_id', ano_publicacao, id,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        db.Index('ix_livros_categoria_id', categoria, id,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        db.Index('ix_livros_autor_lower', db.func.lower(autor).label('autor_lower'),
+                 postgresql_ops={'autor_lower': 'varchar_pattern_ops'},
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        db.Index('uq_livros_isbn_normalizado', isbn_normalizado, unique=True,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        # Última barreira contra emprestar mais exemplares do que existem
+        db.CheckConstraint('disponiveis >= 0 AND disponiveis <= exemplares', name='ck_livros_disponiveis'),
+    )
+
+    @validates('isbn')
+    def definir_isbn(self, chave, isbn):
+        self.isbn_normalizado = normalizar_isbn(isbn)
+        return isbn
+
+    @property
+    def has_capa(self):
+        return self.capa_hash is not None
+
+    @property
+    def emprestados(self):
+        return self.exemplares - self.disponiveis
 
     def __repr__(self):
         return f'<Livro {self.titulo}>'
@@ -21,7 +75,19 @@ class Usuario(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(150), nullable=False)
-    email = db.Column(db.String(100), unique=True, nullable=False)
+    email = db.Column(db.String(100), nullable=False)
+    excluido_em = db.Column(db.DateTime, nullable=True)
+
+    # Parciais, como os de livros: só os usuários não excluídos
+    __table_args__ = (
+        db.Index('ix_usuarios_nome_id', nome, id,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        db.Index('ix_usuarios_nome_lower', db.func.lower(nome).label('nome_lower'),
+                 postgresql_ops={'nome_lower': 'varchar_pattern_ops'},
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        db.Index('uq_usuarios_email', email, unique=True,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+    )
 
     def __repr__(self):
         return f'<Usuario {self.nome}>'
@@ -29,17 +95,40 @@ class Usuario(db.Model):
 # Tabela associativa para a relação muitos-para-muitos entre empréstimos e livros
 emprestimo_livro = db.Table('emprestimo_livro',
     db.Column('emprestimo_id', db.Integer, db.ForeignKey('emprestimos.id'), primary_key=True),
-    db.Column('livro_id', db.Integer, db.ForeignKey('livros.id'), primary_key=True)
+    db.Column('livro_id', db.Integer, db.ForeignKey('livros.id'), primary_key=True),
+    # A chave primária (emprestimo_id, livro_id) não atende buscas só por livro
+    # (empréstimos de um livro, exclusão de livro, contagem de empréstimos)
+    db.Index('ix_emprestimo_livro_livro_id', 'livro_id'),
 )
 
 class Emprestimo(db.Model):
     __tablename__ = 'emprestimos'
     
     id = db.Column(db.Integer, primary_key=True)
-    numero_emprestimo = db.Column(db.String(50), nullable=False, unique=True)
+    numero_emprestimo = db.Column(db.String(50), nullable=False)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     data_emprestimo = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     data_devolucao = db.Column(db.Date, nullable=False)
+    # Quando os livros voltaram; None enquanto o empréstimo está ativo
+    devolvido_em = db.Column(db.DateTime, nullable=True)
+    excluido_em = db.Column(db.DateTime, nullable=True)
+
+    # Os índices da listagem e o do número são parciais (só os empréstimos
+    # não excluídos); o de usuario_id é completo, pois também serve às chaves estrangeiras
+    __table_args__ = (
+        db.Index('ix_emprestimos_usuario_id', usuario_id),
+        db.Index('ix_emprestimos_data_emprestimo_id', data_emprestimo, id,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        db.Index('ix_emprestimos_data_devolucao_id', data_devolucao, id,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+        # Índice parcial só com os empréstimos ativos (os atrasados são
+        # buscados por data_devolucao entre eles)
+        db.Index('ix_emprestimos_ativos_data_devolucao', data_devolucao, id,
+                 postgresql_where=db.and_(devolvido_em.is_(None), excluido_em.is_(None)),
+                 sqlite_where=db.and_(devolvido_em.is_(None), excluido_em.is_(None))),
+        db.Index('uq_emprestimos_numero_emprestimo', numero_emprestimo, unique=True,
+                 postgresql_where=excluido_em.is_(None), sqlite_where=excluido_em.is_(None)),
+    )
     
     # Relacionamento muitos-para-um com usuários
     usuario = db.relationship('Usuario', backref='emprestimos')
@@ -47,5 +136,186 @@ class Emprestimo(db.Model):
     # Relacionamento muitos-para-muitos com livros
     livros = db.relationship('Livro', secondary='emprestimo_livro', backref='emprestimos')
 
+    # Situação no último processamento de atrasos (None se não estava atrasado)
+    atraso = db.relationship('Atraso', uselist=False, cascade='all, delete-orphan', backref='emprestimo')
+
+    notificacoes = db.relationship('Notificacao', cascade='all, delete-orphan', backref='emprestimo')
+
+    @property
+    def ativo(self):
+        return self.devolvido_em is None
+
     def __repr__(self):
         return f'<Emprestimo {self.numero_emprestimo}>'
+
+class RegistroAuditoria(db.Model):
+    """
+    Alteração de um livro, usuário ou empréstimo (ver app/utils/auditoria.py).
+
+    A tabela só recebe INSERTs, em lotes; registros antigos saem apenas pelo
+    comando flask auditoria podar.
+    """
+    __tablename__ = 'auditoria'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    registrado_em = db.Column(db.DateTime, nullable=False)
+    tabela = db.Column(db.String(50), nullable=False)
+    registro_id = db.Column(db.Integer, nullable=False)
+    # 'inserir', 'alterar', 'excluir' (exclusão lógica) ou 'remover' (DELETE)
+    operacao = db.Column(db.String(10), nullable=False)
+    # {campo: [antes, depois]} dos campos alterados
+    alteracoes = db.Column(db.JSON, nullable=False)
+    # Rota ('POST /update_livro/3') ou comando ('flask catalogo importar') que fez a alteração
+    origem = db.Column(db.String(200), nullable=True)
+    endereco_ip = db.Column(db.String(45), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_auditoria_tabela_registro', tabela, registro_id, id),
+        # Gravada em ordem de tempo: no PostgreSQL um índice BRIN ocupa poucas
+        # páginas e atende à poda por data
+        db.Index('ix_auditoria_registrado_em', registrado_em, postgresql_using='brin'),
+    )
+
+    def __repr__(self):
+        return f'<RegistroAuditoria {self.operacao} {self.tabela} {self.registro_id}>'
+
+class Atraso(db.Model):
+    """
+    Retrato de um empréstimo atrasado, gravado pelo processamento diário de
+    atrasos (ver app/utils/atrasos.py).
+
+    Dias de atraso e multa ficam prontos para a listagem, que filtra por eles
+    sem recalcular nada; a devolução do empréstimo remove o registro.
+    """
+    __tablename__ = 'atrasos'
+
+    emprestimo_id = db.Column(db.Integer, db.ForeignKey('emprestimos.id', ondelete='CASCADE'), primary_key=True)
+    dias_atraso = db.Column(db.Integer, nullable=False)
+    multa_centavos = db.Column(db.Integer, nullable=False)
+    # Dia do processamento que calculou o registro; os que não forem
+    # recalculados no processamento seguinte são descartados ao final dele
+    data_referencia = db.Column(db.Date, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_atrasos_dias_atraso', dias_atraso),
+        db.Index('ix_atrasos_data_referencia', data_referencia),
+    )
+
+    @property
+    def multa(self):
+        return self.multa_centavos / 100
+
+    def __repr__(self):
+        return f'<Atraso {self.emprestimo_id}: {self.dias_atraso} dia(s)>'
+
+class Notificacao(db.Model):
+    """Aviso a ser entregue a um usuário (ex.: empréstimo atrasado)"""
+    __tablename__ = 'notificacoes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    emprestimo_id = db.Column(db.Integer, db.ForeignKey('emprestimos.id', ondelete='CASCADE'), nullable=False)
+    tipo = db.Column(db.String(30), nullable=False)
+    mensagem = db.Column(db.String(255), nullable=False)
+    criada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Preenchido por quem entregar o aviso (e-mail, SMS...)
+    enviada_em = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_notificacoes_usuario_id', usuario_id),
+        db.Index('ix_notificacoes_emprestimo_id', emprestimo_id),
+    )
+
+    def __repr__(self):
+        return f'<Notificacao {self.tipo} {self.emprestimo_id}>'
+
+class ExecucaoTarefa(db.Model):
+    """
+    Andamento das tarefas em lote (ver app/utils/tarefas.py).
+
+    Guarda o checkpoint (última chave processada) para retomar uma execução
+    interrompida e funciona como trava: só um processo executa a tarefa por vez.
+    """
+    __tablename__ = 'execucoes_tarefas'
+
+    tarefa = db.Column(db.String(50), primary_key=True)
+    referencia = db.Column(db.Date, nullable=True)
+    checkpoint = db.Column(db.JSON(none_as_null=True), nullable=True)
+    processados = db.Column(db.Integer, nullable=False, default=0)
+    iniciada_em = db.Column(db.DateTime, nullable=True)
+    concluida_em = db.Column(db.DateTime, nullable=True)
+    # Trava: preenchido enquanto a tarefa executa e renovado a cada lote; sem
+    # renovação por TAREFAS_TEMPO_LIMITE segundos, a execução é dada como abandonada
+    ultimo_sinal = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<ExecucaoTarefa {self.tarefa}>'
+
+class VersaoDados(db.Model):
+    """
+    Contador de alterações por tabela (ver app/utils/versoes.py).
+
+    Muda a cada gravação em livros, usuários ou empréstimos e serve de chave
+    para caches de dados derivados, como os relatórios em PDF.
+    """
+    __tablename__ = 'versoes_dados'
+
+    tabela = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<VersaoDados {self.tabela}={self.versao}>'
+
+# Contagem de empréstimos calculada por subconsulta agregada, para que as
+# listagens mostrem o total sem carregar a coleção de cada registro.
+# São adiadas (deferred): só entram no SELECT quando a view pede undefer().
+# Empréstimos excluídos não contam (o JOIN com emprestimos em Livro existe
+# para que ocultar_excluidos os filtre).
+Livro.total_emprestimos = db.column_property(
+    db.select(db.func.count(emprestimo_livro.c.emprestimo_id))
+    .join(Emprestimo, Emprestimo.id == emprestimo_livro.c.emprestimo_id)
+    .where(emprestimo_livro.c.livro_id == Livro.id)
+    .correlate_except(emprestimo_livro, Emprestimo)
+    .scalar_subquery(),
+    deferred=True
+)
+
+Usuario.total_emprestimos = db.column_property(
+    db.select(db.func.count(Emprestimo.id))
+    .where(Emprestimo.usuario_id == Usuario.id)
+    .correlate_except(Emprestimo)
+    .scalar_subquery(),
+    deferred=True
+)
+
+# Modelos com exclusão lógica: excluir() preenche excluido_em e as consultas
+# do ORM (inclusive contagens e carregamento de relacionamentos) deixam de ver
+# o registro. Para incluí-los, use .execution_options(incluir_excluidos=True).
+# SQL puro (text(), tabelas do Core) não é filtrado
+EXCLUSAO_LOGICA = (Livro, Usuario, Emprestimo)
+
+def excluir(objeto):
+    """Exclui logicamente um livro, usuário ou empréstimo (gravado no próximo commit)"""
+    objeto.excluido_em = datetime.utcnow()
+
+def exclusao_pendente(objeto):
+    """Indica se excluido_em foi preenchido no objeto e ainda não foi confirmado (para eventos de flush)"""
+    historico = db.inspect(objeto).attrs.excluido_em.history
+    return bool(historico.added) and historico.added[0] is not None and not any(historico.deleted)
+
+def criterios_exclusao():
+    """Opções que restringem uma consulta do ORM aos registros não excluídos"""
+    return [with_loader_criteria(modelo, modelo.excluido_em.is_(None), include_aliases=True)
+            for modelo in EXCLUSAO_LOGICA]
+
+@event.listens_for(db.session, 'do_orm_execute')
+def ocultar_excluidos(execucao):
+    """Acrescenta 'excluido_em IS NULL' às consultas do ORM sobre os modelos de EXCLUSAO_LOGICA"""
+    # Com um ouvinte de do_orm_execute registrado, o selectinload de uma
+    # consulta lida com yield_per (relatórios, exportações) herda o yield_per,
+    # que não combina com a deduplicação feita pelo carregamento
+    if execucao.is_relationship_load and execucao.execution_options.get('yield_per'):
+        execucao.update_execution_options(yield_per=None)
+    if (execucao.is_select and not execucao.is_column_load and not execucao.is_relationship_load
+            and not execucao.execution_options.get('incluir_excluidos', False)):
+        execucao.statement = execucao.statement.options(*criterios_exclusao())
@@ -0,0 +1,2 @@
+# Services package: validação e gravação de livros, usuários e empréstimos,
+# compartilhadas pelos controllers, pela API em lote e pela importação
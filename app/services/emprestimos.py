@@ -0,0 +1,232 @@
+from collections import namedtuple
+from datetime import date, datetime
+from app import db
+from app.models.models import Emprestimo, Usuario, Livro, emprestimo_livro
+from app.utils.versoes import registrar_versoes
+from app.utils.estatisticas import registrar_variacao, TOTAIS
+from app.utils.auditoria import registrar_alteracao
+
+# Dados de um empréstimo já convertidos e com os campos obrigatórios conferidos
+DadosEmprestimo = namedtuple('DadosEmprestimo',
+                             ['numero_emprestimo', 'usuario_id', 'livro_ids', 'data_devolucao', 'data_emprestimo'])
+
+# Resultado de pre_verificacao(): o que já existe no banco para um conjunto de empréstimos
+Verificacao = namedtuple('Verificacao', ['numeros_usados', 'usuarios', 'livros', 'livros_atuais'])
+
+def converter_id(valor):
+    """Converte um id vindo do formulário/JSON em int (ou None se não for um inteiro positivo)"""
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, int):
+        return valor if valor > 0 else None
+    valor = str(valor or '').strip()
+    return int(valor) if valor.isdigit() and int(valor) > 0 else None
+
+def validar_campos(numero_emprestimo, usuario_id, livro_ids, data_devolucao, data_emprestimo=None):
+    """
+    Confere os campos de um empréstimo, sem acessar o banco.
+
+    Args:
+        data_emprestimo: Data/hora do empréstimo em ISO 8601 (opcional; usada
+            na importação de empréstimos feitos em outras unidades)
+
+    Returns:
+        Tupla (mensagem de erro, None) ou (None, DadosEmprestimo)
+    """
+    numero_emprestimo = (numero_emprestimo or '').strip()
+    if not numero_emprestimo:
+        return 'Número do empréstimo é obrigatório!', None
+
+    if not usuario_id:
+        return 'Selecione um usuário!', None
+    usuario = converter_id(usuario_id)
+    if usuario is None:
+        return 'Usuário não encontrado!', None
+
+    if not livro_ids:
+        return 'Selecione pelo menos um livro!', None
+    livros = [converter_id(livro_id) for livro_id in livro_ids]
+    if None in livros:
+        return 'Livro não encontrado!', None
+    # Remove ids repetidos mantendo a ordem
+    livros = list(dict.fromkeys(livros))
+
+    if not data_devolucao:
+        return 'Data de devolução é obrigatória!', None
+
+    # Validar data de devolução não pode ser anterior à data atual (ou do empréstimo)
+    try:
+        data_dev = datetime.strptime(data_devolucao, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return 'Data de devolução inválida!', None
+    try:
+        data_emp = datetime.fromisoformat(data_emprestimo) if data_emprestimo else None
+    except (TypeError, ValueError):
+        return 'Data do empréstimo inválida!', None
+    referencia = data_emp.date() if data_emp else datetime.now().date()
+    if data_dev < referencia:
+        if data_emp:
+            return 'Data de devolução não pode ser anterior à data do empréstimo!', None
+        return 'Data de devolução não pode ser anterior à data atual!', None
+
+    return None, DadosEmprestimo(numero_emprestimo, usuario, livros, data_dev, data_emp)
+
+def pre_verificacao(lista, emprestimo_id=None):
+    """
+    Busca em uma única consulta tudo o que a validação precisa do banco.
+
+    Une (UNION ALL) os números de empréstimo já usados, os usuários e livros
+    existentes entre os informados e, na edição, os livros atuais do
+    empréstimo, em vez de uma consulta por verificação ou por livro.
+
+    Args:
+        lista: Sequência de DadosEmprestimo
+        emprestimo_id: Id do empréstimo em edição (ignorado na verificação
+            de número duplicado)
+
+    Returns:
+        Verificacao com conjuntos de números usados e ids existentes
+    """
+    numeros = {dados.numero_emprestimo for dados in lista}
+    usuarios = {dados.usuario_id for dados in lista}
+    livros = {livro_id for dados in lista for livro_id in dados.livro_ids}
+    sem_numero = db.cast(db.null(), db.String)
+
+    duplicados = db.select(db.literal('numero').label('tipo'), Emprestimo.id.label('id'),
+                           Emprestimo.numero_emprestimo.label('numero')).where(
+        Emprestimo.numero_emprestimo.in_(numeros))
+    if emprestimo_id is not None:
+        duplicados = duplicados.where(Emprestimo.id != emprestimo_id)
+    consultas = [
+        duplicados,
+        db.select(db.literal('usuario'), Usuario.id, sem_numero).where(Usuario.id.in_(usuarios)),
+        db.select(db.literal('livro'), Livro.id, sem_numero).where(Livro.id.in_(livros)),
+    ]
+    if emprestimo_id is not None:
+        consultas.append(db.select(db.literal('atual'), emprestimo_livro.c.livro_id, sem_numero)
+                         .where(emprestimo_livro.c.emprestimo_id == emprestimo_id))
+
+    verificacao = Verificacao(set(), set(), set(), set())
+    for tipo, id, numero in db.session.execute(db.union_all(*consultas)):
+        if tipo == 'numero':
+            verificacao.numeros_usados.add(numero)
+        elif tipo == 'usuario':
+            verificacao.usuarios.add(id)
+        elif tipo == 'livro':
+            verificacao.livros.add(id)
+        else:
+            verificacao.livros_atuais.add(id)
+    return verificacao
+
+def conferir_emprestimo(dados, verificacao):
+    """Retorna a mensagem de erro do empréstimo segundo a pré-verificação (ou None se estiver ok)"""
+    if dados.numero_emprestimo in verificacao.numeros_usados:
+        return 'Número de empréstimo já cadastrado!'
+    if dados.usuario_id not in verificacao.usuarios:
+        return 'Usuário não encontrado!'
+    inexistentes = [livro_id for livro_id in dados.livro_ids if livro_id not in verificacao.livros]
+    if inexistentes:
+        return f'Livro(s) não encontrado(s): {", ".join(map(str, inexistentes))}'
+    return None
+
+def sincronizar_livros(emprestimo_id, livro_ids, livros_atuais):
+    """
+    Ajusta emprestimo_livro para conter exatamente livro_ids.
+
+    Só as associações que mudaram são inseridas ou removidas; as que
+    continuam no empréstimo não são tocadas.
+
+    Returns:
+        Tupla (ids inseridos, ids removidos)
+    """
+    novos = set(livro_ids)
+    inserir = novos - livros_atuais
+    remover = livros_atuais - novos
+
+    if remover:
+        db.session.execute(emprestimo_livro.delete().where(
+            emprestimo_livro.c.emprestimo_id == emprestimo_id,
+            emprestimo_livro.c.livro_id.in_(remover)))
+    if inserir:
+        db.session.execute(emprestimo_livro.insert(),
+                           [{'emprestimo_id': emprestimo_id, 'livro_id': livro_id} for livro_id in sorted(inserir)])
+    if inserir or remover:
+        # Gravação direta na tabela associativa: não passa pelo after_flush do ORM
+        registrar_versoes({'emprestimos'})
+        registrar_alteracao('emprestimos', emprestimo_id, 'alterar',
+                            {'livros': (sorted(livros_atuais), sorted(novos))})
+    return inserir, remover
+
+def travar_usuarios(usuario_ids):
+    """
+    Trava (SELECT ... FOR UPDATE) as linhas dos usuários informados até o commit.
+
+    delete_usuario trava a mesma linha antes de contar os empréstimos: uma
+    exclusão simultânea espera o empréstimo ser gravado (e então o encontra),
+    ou termina antes e o usuário já não aparece aqui. No SQLite o FOR UPDATE
+    é ignorado, mas chamada depois de reservar_exemplares a consulta já roda
+    com a escrita serializada.
+
+    Returns:
+        Conjunto dos ids que não existem mais (excluídos depois da
+        pré-verificação); se não estiver vazio, o chamador deve desfazer a
+        transação.
+    """
+    usuario_ids = set(usuario_ids)
+    if not usuario_ids:
+        return set()
+    encontrados = db.session.scalars(
+        db.select(Usuario.id)
+        .where(Usuario.id.in_(usuario_ids), Usuario.excluido_em.is_(None))
+        .with_for_update()
+    )
+    return usuario_ids - set(encontrados)
+
+def criar_emprestimo(dados):
+    """
+    Insere um empréstimo já validado pelo ORM e seus livros com um único
+    INSERT na tabela associativa.
+
+    Não faz commit: o chamador decide a transação (e trava antes o usuário
+    com travar_usuarios).
+    """
+    emprestimo = Emprestimo(numero_emprestimo=dados.numero_emprestimo, usuario_id=dados.usuario_id,
+                            data_devolucao=dados.data_devolucao)
+    db.session.add(emprestimo)
+    db.session.flush()
+    sincronizar_livros(emprestimo.id, dados.livro_ids, set())
+    return emprestimo
+
+def criar_emprestimos(lista):
+    """
+    Insere vários empréstimos já validados com um INSERT em lote para os
+    empréstimos e outro para as associações com livros.
+
+    Não faz commit: o chamador decide a transação (e trava antes os
+    usuários com travar_usuarios).
+
+    Returns:
+        Lista de (id, numero_emprestimo) na mesma ordem de lista
+    """
+    agora = datetime.utcnow()
+    linhas = [{'numero_emprestimo': dados.numero_emprestimo, 'usuario_id': dados.usuario_id,
+               'data_devolucao': dados.data_devolucao, 'data_emprestimo': dados.data_emprestimo or agora}
+              for dados in lista]
+    resultado = db.session.execute(
+        db.insert(Emprestimo).returning(Emprestimo.id, Emprestimo.numero_emprestimo), linhas)
+    ids = {numero: id for id, numero in resultado}
+
+    associacoes = [{'emprestimo_id': ids[dados.numero_emprestimo], 'livro_id': livro_id}
+                   for dados in lista for livro_id in dados.livro_ids]
+    db.session.execute(emprestimo_livro.insert(), associacoes)
+    registrar_versoes({'emprestimos'})
+    for linha, dados in zip(linhas, lista):
+        registrar_alteracao('emprestimos', ids[dados.numero_emprestimo], 'inserir',
+                            {**{campo: (None, valor) for campo, valor in linha.items()},
+                             'livros': (None, dados.livro_ids)})
+
+    # INSERT direto: as estatísticas não são ajustadas pelos eventos do ORM
+    hoje = date.today()
+    registrar_variacao(TOTAIS, 'emprestimos_ativos', len(lista))
+    registrar_variacao(TOTAIS, 'emprestimos_atrasados', sum(dados.data_devolucao < hoje for dados in lista))
+    return [(ids[dados.numero_emprestimo], dados.numero_emprestimo) for dados in lista]
@@ -0,0 +1,103 @@
+from app import db
+from app.models.models import Livro
+from app.services.validacao import validar_livro
+from sqlalchemy.exc import IntegrityError
+
+def isbns_em_uso(isbns, livro_id=None):
+    """
+    Quais dos ISBNs (normalizados) já pertencem a algum livro, em uma única consulta.
+
+    Args:
+        livro_id: Id do livro em edição (seu próprio ISBN não conta como repetido)
+    """
+    consulta = db.select(Livro.isbn_normalizado).where(Livro.isbn_normalizado.in_(set(isbns)))
+    if livro_id is not None:
+        consulta = consulta.where(Livro.id != livro_id)
+    return set(db.session.scalars(consulta))
+
+def validar_livros(lista, livro=None):
+    """
+    Valida vários livros e confere ISBNs repetidos com uma consulta para todos.
+
+    Args:
+        lista: Sequência de formulários ou dicionários (ver validar_livro)
+        livro: Livro em edição, quando lista tem um único item
+
+    Returns:
+        Lista de (mensagem de erro, None) ou (None, dados), na ordem de lista
+    """
+    resultados = [validar_livro(dados) for dados in lista]
+    validos = [dados for erro, dados in resultados if erro is None]
+    if not validos:
+        return resultados
+
+    em_uso = isbns_em_uso([dados['isbn_normalizado'] for dados in validos], livro.id if livro else None)
+    vistos = set()
+    conferidos = []
+    for erro, dados in resultados:
+        if erro is None:
+            if livro is not None and dados['exemplares'] < livro.emprestados:
+                # Não dá para ter menos exemplares do que os já emprestados
+                erro = (f'O livro tem {livro.emprestados} exemplar(es) emprestado(s); '
+                        f'não é possível reduzir para {dados["exemplares"]}!')
+            elif dados['isbn_normalizado'] in em_uso:
+                erro = 'ISBN já cadastrado em outro livro!' if livro else 'ISBN já cadastrado!'
+            elif dados['isbn_normalizado'] in vistos:
+                erro = 'ISBN repetido no lote!'
+            vistos.add(dados['isbn_normalizado'])
+        conferidos.append((erro, None) if erro else (None, dados))
+    return conferidos
+
+def validar_um_livro(dados, livro=None):
+    """validar_livros() de um único livro (cadastro e edição pelo formulário)"""
+    return validar_livros([dados], livro)[0]
+
+def criar_livro(dados, capa_hash=None, capa_tipo=None, capa_tamanho=None):
+    """
+    Grava um livro já validado, com todos os exemplares disponíveis.
+
+    Returns:
+        Tupla (mensagem de erro, None) ou (None, livro)
+    """
+    livro = Livro(titulo=dados['titulo'], autor=dados['autor'], isbn=dados['isbn'],
+                  ano_publicacao=dados['ano_publicacao'], categoria=dados['categoria'],
+                  exemplares=dados['exemplares'], disponiveis=dados['exemplares'],
+                  capa_hash=capa_hash, capa_tipo=capa_tipo, capa_tamanho=capa_tamanho)
+    db.session.add(livro)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # uq_livros_isbn_normalizado: outro cadastro gravou o mesmo ISBN depois da validação
+        db.session.rollback()
+        return 'ISBN já cadastrado!', None
+    return None, livro
+
+def atualizar_livro(livro, dados):
+    """
+    Grava a edição de um livro já validado.
+
+    Returns:
+        Mensagem de erro, ou None se a edição foi gravada
+    """
+    livro_id = livro.id
+    livro.titulo = dados['titulo']
+    livro.autor = dados['autor']
+    livro.isbn = dados['isbn']
+    livro.ano_publicacao = dados['ano_publicacao']
+    livro.categoria = dados['categoria']
+    if dados['exemplares'] != livro.exemplares:
+        # Ajuste relativo calculado no próprio UPDATE, para não sobrescrever
+        # retiradas feitas por empréstimos entre a leitura e a gravação
+        livro.disponiveis = Livro.disponiveis + dados['exemplares'] - Livro.exemplares
+        livro.exemplares = dados['exemplares']
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # A restrição violada não vem no mesmo formato em todos os bancos: se o
+        # ISBN passou a ser de outro livro, foi uq_livros_isbn_normalizado
+        if isbns_em_uso([dados['isbn_normalizado']], livro_id):
+            return 'ISBN já cadastrado em outro livro!'
+        # ck_livros_disponiveis: novos empréstimos ocuparam os exemplares removidos
+        return 'Os exemplares do livro mudaram durante a edição; tente novamente.'
+    return None
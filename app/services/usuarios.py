@@ -0,0 +1,61 @@
+from app import db
+from app.models.models import Usuario
+from app.services.validacao import validar_usuario
+
+def emails_em_uso(emails, usuario_id=None):
+    """
+    Quais dos emails já pertencem a algum usuário, em uma única consulta.
+
+    Args:
+        usuario_id: Id do usuário em edição (seu próprio email não conta como repetido)
+    """
+    consulta = db.select(Usuario.email).where(Usuario.email.in_(set(emails)))
+    if usuario_id is not None:
+        consulta = consulta.where(Usuario.id != usuario_id)
+    return set(db.session.scalars(consulta))
+
+def validar_usuarios(lista, usuario_id=None):
+    """
+    Valida vários usuários e confere emails repetidos com uma consulta para todos.
+
+    Args:
+        lista: Sequência de formulários ou dicionários com nome e email
+        usuario_id: Id do usuário em edição, quando lista tem um único item
+
+    Returns:
+        Lista de (mensagem de erro, None) ou (None, dados), na ordem de lista
+    """
+    resultados = [validar_usuario(dados) for dados in lista]
+    validos = [dados for erro, dados in resultados if erro is None]
+    if not validos:
+        return resultados
+
+    em_uso = emails_em_uso([dados['email'] for dados in validos], usuario_id)
+    vistos = set()
+    conferidos = []
+    for erro, dados in resultados:
+        if erro is None:
+            if dados['email'] in em_uso:
+                erro = 'Email já cadastrado em outro usuário!' if usuario_id else 'Email já cadastrado!'
+            elif dados['email'] in vistos:
+                erro = 'Email repetido no lote!'
+            vistos.add(dados['email'])
+        conferidos.append((erro, None) if erro else (None, dados))
+    return conferidos
+
+def validar_um_usuario(dados, usuario_id=None):
+    """validar_usuarios() de um único usuário (cadastro e edição pelo formulário)"""
+    return validar_usuarios([dados], usuario_id)[0]
+
+def criar_usuario(dados):
+    """Grava um usuário já validado"""
+    usuario = Usuario(nome=dados['nome'], email=dados['email'])
+    db.session.add(usuario)
+    db.session.commit()
+    return usuario
+
+def atualizar_usuario(usuario, dados):
+    """Grava a edição de um usuário já validado"""
+    usuario.nome = dados['nome']
+    usuario.email = dados['email']
+    db.session.commit()
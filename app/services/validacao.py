@@ -0,0 +1,100 @@
+from app.models.models import Livro, Usuario, normalizar_isbn
+import re
+
+# Regras montadas uma única vez, na importação do módulo, e não a cada validação
+
+# Formato aceito para e-mails
+PADRAO_EMAIL = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# Intervalo aceito para o ano de publicação
+ANO_MIN = 1000
+ANO_MAX = 2100
+
+# Limite do número de exemplares de um título
+EXEMPLARES_MAX = 1000
+
+def limites_texto(tabela, campos):
+    """Tamanho máximo de cada coluna de texto, como tupla de (campo, tamanho)"""
+    return tuple((campo, tabela.c[campo].type.length) for campo in campos)
+
+CAMPOS_LIVRO = ('titulo', 'autor', 'isbn', 'ano_publicacao', 'categoria')
+LIMITES_LIVRO = limites_texto(Livro.__table__, ('titulo', 'autor', 'isbn', 'categoria'))
+
+CAMPOS_USUARIO = ('nome', 'email')
+LIMITES_USUARIO = limites_texto(Usuario.__table__, CAMPOS_USUARIO)
+
+def isbn_valido(isbn):
+    """10 ou 13 dígitos, com ou sem hífens e espaços"""
+    isbn = normalizar_isbn(isbn)
+    return isbn.isdigit() and len(isbn) in (10, 13)
+
+def email_valido(email):
+    return PADRAO_EMAIL.match(email) is not None
+
+def ler_exemplares(valor):
+    """Converte o número de exemplares (vazio vale 1); None se for inválido"""
+    valor = str(valor or '1').strip()
+    if not valor.isdigit() or not 1 <= int(valor) <= EXEMPLARES_MAX:
+        return None
+    return int(valor)
+
+def texto_longo(campos, limites):
+    """Mensagem para o primeiro campo maior que a sua coluna, ou None"""
+    for campo, tamanho in limites:
+        if len(campos[campo]) > tamanho:
+            return f'O campo {campo} aceita no máximo {tamanho} caracteres!'
+    return None
+
+def validar_livro(dados):
+    """
+    Confere os campos de um livro, sem acessar o banco.
+
+    Args:
+        dados: Formulário ou dicionário com titulo, autor, isbn,
+            ano_publicacao, categoria e, opcionalmente, exemplares
+
+    Returns:
+        Tupla (mensagem de erro, None) ou (None, dicionário com os valores
+        limpos e convertidos, incluindo isbn_normalizado)
+    """
+    campos = {campo: str(dados.get(campo) or '').strip() for campo in CAMPOS_LIVRO}
+    if not all(campos.values()):
+        return 'Todos os campos obrigatórios devem ser preenchidos!', None
+
+    if not isbn_valido(campos['isbn']):
+        return 'ISBN inválido! Deve conter 10 ou 13 dígitos.', None
+
+    try:
+        ano = int(campos['ano_publicacao'])
+    except ValueError:
+        return 'Ano de publicação deve ser um número!', None
+    if not ANO_MIN <= ano <= ANO_MAX:
+        return 'Ano de publicação inválido!', None
+
+    exemplares = ler_exemplares(dados.get('exemplares'))
+    if exemplares is None:
+        return f'Número de exemplares inválido! Informe de 1 a {EXEMPLARES_MAX}.', None
+
+    erro = texto_longo(campos, LIMITES_LIVRO)
+    if erro:
+        return erro, None
+
+    return None, {**campos, 'isbn_normalizado': normalizar_isbn(campos['isbn']), 'ano_publicacao': ano,
+                  'exemplares': exemplares}
+
+def validar_usuario(dados):
+    """
+    Confere os campos de um usuário, sem acessar o banco.
+
+    Returns:
+        Tupla (mensagem de erro, None) ou (None, dicionário com nome e email limpos)
+    """
+    campos = {campo: str(dados.get(campo) or '').strip() for campo in CAMPOS_USUARIO}
+    if not all(campos.values()):
+        return 'Nome e email são obrigatórios!', None
+    if not email_valido(campos['email']):
+        return 'Email inválido!', None
+    erro = texto_longo(campos, LIMITES_USUARIO)
+    if erro:
+        return erro, None
+    return None, campos
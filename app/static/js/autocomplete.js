@@ -0,0 +1,119 @@
+// Campos de seleção com sugestões buscadas no servidor (usuário e livros do empréstimo).
+//
+// Marcação esperada:
+//   <div data-autocomplete="/usuarios/autocomplete" data-nome="usuario" data-multiplo="false">
+//       <input type="text" data-busca>              campo em que o usuário digita
+//       <input type="hidden" name="usuario">        (apenas seleção única) id escolhido
+//       <div data-sugestoes></div>                  lista de sugestões
+//       <div data-selecionados></div>               (apenas seleção múltipla) itens escolhidos
+//   </div>
+(function () {
+    const ATRASO_MS = 200;
+
+    function criarSelecionado(nome, id, label) {
+        const item = document.createElement('span');
+        item.className = 'badge badge-destaque d-inline-flex align-items-center';
+        item.dataset.id = id;
+        item.textContent = label;
+
+        const remover = document.createElement('button');
+        remover.type = 'button';
+        remover.className = 'btn-close ms-2';
+        remover.setAttribute('aria-label', 'Remover');
+        remover.dataset.remover = '';
+
+        const oculto = document.createElement('input');
+        oculto.type = 'hidden';
+        oculto.name = nome;
+        oculto.value = id;
+
+        item.append(remover, oculto);
+        return item;
+    }
+
+    function iniciar(campo) {
+        const url = campo.dataset.autocomplete;
+        const nome = campo.dataset.nome;
+        const multiplo = campo.dataset.multiplo === 'true';
+        const busca = campo.querySelector('[data-busca]');
+        const lista = campo.querySelector('[data-sugestoes]');
+        const selecionados = campo.querySelector('[data-selecionados]');
+        const oculto = multiplo ? null : campo.querySelector(`input[type=hidden][name="${nome}"]`);
+        let temporizador = null;
+        let ultimaConsulta = null;
+
+        function fecharLista() {
+            lista.replaceChildren();
+        }
+
+        function escolher(sugestao) {
+            if (multiplo) {
+                if (!selecionados.querySelector(`[data-id="${sugestao.id}"]`)) {
+                    selecionados.append(criarSelecionado(nome, sugestao.id, sugestao.label));
+                }
+                busca.value = '';
+            } else {
+                oculto.value = sugestao.id;
+                busca.value = sugestao.label;
+            }
+            fecharLista();
+        }
+
+        async function sugerir() {
+            const termo = busca.value.trim();
+            const consulta = `${url}?q=${encodeURIComponent(termo)}`;
+            ultimaConsulta = consulta;
+            const resposta = await fetch(consulta, { headers: { 'Accept': 'application/json' } });
+            if (!resposta.ok || consulta !== ultimaConsulta) {
+                return;
+            }
+            const sugestoes = await resposta.json();
+            lista.replaceChildren(...sugestoes.map((sugestao) => {
+                const opcao = document.createElement('button');
+                opcao.type = 'button';
+                opcao.className = 'list-group-item list-group-item-action';
+                opcao.textContent = sugestao.label;
+                opcao.addEventListener('click', () => escolher(sugestao));
+                return opcao;
+            }));
+        }
+
+        busca.addEventListener('input', () => {
+            if (oculto) {
+                oculto.value = '';
+            }
+            clearTimeout(temporizador);
+            temporizador = setTimeout(sugerir, ATRASO_MS);
+        });
+        busca.addEventListener('focus', () => {
+            clearTimeout(temporizador);
+            temporizador = setTimeout(sugerir, ATRASO_MS);
+        });
+        busca.addEventListener('keydown', (evento) => {
+            // Enter escolhe a primeira sugestão em vez de enviar o formulário
+            if (evento.key === 'Enter') {
+                evento.preventDefault();
+                const primeira = lista.querySelector('button');
+                if (primeira) {
+                    primeira.click();
+                }
+            } else if (evento.key === 'Escape') {
+                fecharLista();
+            }
+        });
+        document.addEventListener('click', (evento) => {
+            if (!campo.contains(evento.target)) {
+                fecharLista();
+            }
+        });
+        if (selecionados) {
+            selecionados.addEventListener('click', (evento) => {
+                if (evento.target.matches('[data-remover]')) {
+                    evento.target.closest('[data-id]').remove();
+                }
+            });
+        }
+    }
+
+    document.querySelectorAll('[data-autocomplete]').forEach(iniciar);
+})();
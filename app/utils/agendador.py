@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+from app import db
+import threading
+
+def proxima_execucao(agenda, agora):
+    """
+    Próximo instante de execução de uma tarefa depois de agora.
+
+    Args:
+        agenda: Horário diário 'HH:MM' ou intervalo em segundos entre execuções
+    """
+    if not isinstance(agenda, str):
+        return agora + timedelta(seconds=agenda)
+    hora, minuto = (int(parte) for parte in agenda.split(':'))
+    alvo = agora.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+    return alvo if alvo > agora else alvo + timedelta(days=1)
+
+def iniciar_agendador(app, tarefas):
+    """
+    Executa tarefas periódicas em uma thread do próprio processo da aplicação.
+
+    Cada tarefa roda dentro de um contexto da aplicação e com sua própria
+    sessão do banco. Se vários processos iniciarem o agendador, as tarefas
+    em lote usam a trava de execucoes_tarefas (ver app/utils/tarefas.py)
+    para que só um deles faça o trabalho.
+
+    Args:
+        app: Aplicação Flask
+        tarefas: Lista de (nome, agenda, função sem argumentos), com a agenda
+            no formato de proxima_execucao()
+
+    Returns:
+        threading.Event que encerra o agendador quando acionado
+    """
+    parar = threading.Event()
+
+    def executar():
+        agora = datetime.now()
+        proximas = {nome: proxima_execucao(agenda, agora) for nome, agenda, _ in tarefas}
+        while True:
+            nome, agenda, funcao = min(tarefas, key=lambda tarefa: proximas[tarefa[0]])
+            if parar.wait(max((proximas[nome] - datetime.now()).total_seconds(), 0)):
+                return
+            with app.app_context():
+                try:
+                    funcao()
+                except Exception:
+                    app.logger.exception('Falha na tarefa agendada %s', nome)
+                finally:
+                    db.session.remove()
+            proximas[nome] = proxima_execucao(agenda, datetime.now())
+
+    threading.Thread(target=executar, name='agendador', daemon=True).start()
+    return parar
@@ -0,0 +1,154 @@
+from flask import Response, abort, current_app, request
+from functools import wraps
+from datetime import date, datetime
+from app.utils.cache_respostas import backend_cache_respostas, chave_cache
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:  # A compressão brotli é opcional (pip install brotli); sem ela, só gzip
+    brotli = None
+
+def ler_lista(*nomes):
+    """Nomes separados por vírgula do primeiro parâmetro da query string presente, sem repetições"""
+    for nome in nomes:
+        if nome in request.args:
+            itens = (item.strip() for item in request.args[nome].split(','))
+            return list(dict.fromkeys(item for item in itens if item))
+    return []
+
+def ler_campos(colunas, padrao):
+    """
+    Campos pedidos em ?campos= (ou ?fields=), na ordem pedida.
+
+    O id vem sempre primeiro, mesmo que não tenha sido pedido. Responde 400
+    se algum campo não existir no recurso.
+
+    Args:
+        colunas: Dicionário {nome do campo: coluna ou expressão SQL}
+        padrao: Campos devolvidos quando nenhum é pedido
+    """
+    campos = ler_lista('campos', 'fields') or list(padrao)
+    desconhecidos = [campo for campo in campos if campo not in colunas]
+    if desconhecidos:
+        abort(400, description=f'Campo(s) desconhecido(s): {", ".join(desconhecidos)}')
+    return ['id'] + [campo for campo in campos if campo != 'id']
+
+def ler_inclusoes(disponiveis):
+    """Relações pedidas em ?incluir= (ou ?embed=); responde 400 se alguma não existir"""
+    inclusoes = ler_lista('incluir', 'embed')
+    desconhecidas = [nome for nome in inclusoes if nome not in disponiveis]
+    if desconhecidas:
+        abort(400, description=f'Relação(ões) desconhecida(s): {", ".join(desconhecidas)}')
+    return inclusoes
+
+def selecao(colunas, campos, *extras):
+    """
+    Expressões do SELECT: os campos pedidos, rotulados com o nome do campo,
+    seguidos das colunas extras que ainda não estiverem entre eles (chave de
+    ordenação do cursor, chaves estrangeiras das relações incluídas).
+
+    Como os campos vêm primeiro, dicionarios() descarta as extras com zip.
+    """
+    expressoes = [colunas[campo].label(campo) for campo in campos]
+    expressoes += [coluna.label(coluna.key) for coluna in extras if coluna.key not in campos]
+    return expressoes
+
+def dicionarios(linhas, campos):
+    """Converte linhas (Row) em dicionários com os campos pedidos, sem montar objetos do ORM"""
+    return [dict(zip(campos, linha)) for linha in linhas]
+
+def agrupar(linhas, campos):
+    """{chave: [dicionário, ...]} a partir de linhas (chave, *campos)"""
+    grupos = {}
+    for chave, *valores in linhas:
+        grupos.setdefault(chave, []).append(dict(zip(campos, valores)))
+    return grupos
+
+def serializar_valor(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    raise TypeError(f'Valor não serializável em JSON: {type(valor).__name__}')
+
+def serializar(dados):
+    """JSON compacto (sem espaços e sem escapar acentos) em UTF-8"""
+    return json.dumps(dados, separators=(',', ':'), ensure_ascii=False, default=serializar_valor).encode('utf-8')
+
+def escolher_codificacao(tamanho):
+    """
+    Compressão a aplicar ao corpo, conforme o Accept-Encoding: 'br' (se o
+    pacote brotli estiver instalado), 'gzip' ou None. Corpos menores que
+    API_COMPRESSAO_MIN_BYTES vão sem compressão.
+    """
+    if tamanho < current_app.config['API_COMPRESSAO_MIN_BYTES']:
+        return None
+    return request.accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+
+def comprimir(corpo, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(corpo, quality=current_app.config['API_COMPRESSAO_NIVEL_BROTLI'])
+    if codificacao == 'gzip':
+        return gzip.compress(corpo, compresslevel=current_app.config['API_COMPRESSAO_NIVEL_GZIP'])
+    return corpo
+
+def resposta_api(*tabelas, por_campo=None):
+    """
+    Serializa em JSON o dicionário devolvido por uma view da API, com ETag,
+    cache e compressão.
+
+    Como em cache_pagina, a chave é a URL completa mais a versão das tabelas
+    informadas: um cliente que reenviar o ETag em If-None-Match recebe 304
+    sem que nenhuma consulta além de versoes_dados seja feita, e o JSON já
+    serializado fica no cache de respostas até as tabelas mudarem. O ETag é
+    fraco porque o mesmo conteúdo pode ir com ou sem compressão.
+
+    Args:
+        por_campo: {campo: tabelas} de campos opcionais que dependem de
+            outras tabelas; elas só entram na chave quando o campo é pedido
+            em ?campos=
+
+    Exemplo:
+        @api_bp.route('/livros')
+        @somente_leitura
+        @orcamento_consultas(2)
+        @resposta_api('livros')
+        def livros():
+            return {'dados': [...]}
+    """
+    def decorador(view):
+        @wraps(view)
+        def envolvida(*args, **kwargs):
+            pedidos = ler_lista('campos', 'fields') if por_campo else ()
+            dependencias = tabelas + tuple(tabela for campo, extras in (por_campo or {}).items()
+                                           if campo in pedidos for tabela in extras)
+            chave = chave_cache('api', request.full_path, dependencias)
+            etag = hashlib.sha256(repr(chave).encode('utf-8')).hexdigest()[:32]
+            backend = backend_cache_respostas()
+            if request.if_none_match.contains_weak(etag):
+                resposta = Response(status=304)
+                estado = 'HIT'
+            else:
+                corpo = backend.get(chave) if backend is not None else None
+                estado = 'HIT'
+                if corpo is None:
+                    corpo = serializar(view(*args, **kwargs))
+                    if backend is not None:
+                        backend.set(chave, corpo)
+                    estado = 'MISS'
+                codificacao = escolher_codificacao(len(corpo))
+                resposta = Response(comprimir(corpo, codificacao), mimetype='application/json')
+                resposta.content_encoding = codificacao
+
+            resposta.set_etag(etag, weak=True)
+            resposta.vary.add('Accept-Encoding')
+            resposta.cache_control.no_cache = True
+            resposta.headers['X-Cache'] = estado
+            return resposta
+        return envolvida
+    return decorador
+
+def erro_api(erro):
+    """Erros HTTP da API em JSON, no lugar da página HTML padrão"""
+    return Response(serializar({'erro': erro.description}), status=erro.code, mimetype='application/json')
@@ -0,0 +1,150 @@
+from flask import current_app
+from collections import namedtuple
+from datetime import date, datetime
+from app import db
+from app.models.models import Emprestimo, Atraso, Notificacao, emprestimo_livro
+from app.utils.tarefas import (iniciar_execucao, salvar_checkpoint, concluir_execucao, liberar_execucao,
+                               OCUPADA, CONCLUIDA)
+from app.utils.versoes import registrar_versoes
+import time
+
+# Nome da tarefa em execucoes_tarefas
+TAREFA_ATRASOS = 'atrasos'
+
+# Resultado de processar_atrasos()
+ResultadoAtrasos = namedtuple('ResultadoAtrasos',
+                              ['estado', 'processados', 'nesta_execucao', 'novos', 'removidos', 'segundos'])
+
+def buscar_lote_atrasados(referencia, ultimo, lote):
+    """
+    Busca o próximo lote de empréstimos ativos vencidos antes de referencia.
+
+    A ordem (data_devolucao, id) e o filtro devolvido_em IS NULL são os do
+    índice parcial ix_emprestimos_ativos_data_devolucao, então cada lote é
+    uma leitura contínua do índice a partir da última chave processada.
+
+    Args:
+        ultimo: Chave (data_devolucao, id) do último empréstimo processado, ou None
+    """
+    quantidade_livros = (db.select(db.func.count())
+                         .where(emprestimo_livro.c.emprestimo_id == Emprestimo.id)
+                         .scalar_subquery())
+    consulta = (db.select(Emprestimo.id, Emprestimo.usuario_id, Emprestimo.numero_emprestimo,
+                          Emprestimo.data_devolucao, quantidade_livros.label('quantidade_livros'))
+                .where(Emprestimo.devolvido_em.is_(None), Emprestimo.data_devolucao < referencia))
+    if ultimo is not None:
+        consulta = consulta.where(db.tuple_(Emprestimo.data_devolucao, Emprestimo.id) > db.tuple_(*ultimo))
+    consulta = consulta.order_by(Emprestimo.data_devolucao, Emprestimo.id).limit(lote)
+    return db.session.execute(consulta).all()
+
+def gravar_atrasos(linhas, referencia, multa_diaria_centavos):
+    """
+    Grava o retrato de um lote de empréstimos atrasados.
+
+    Os registros que ainda não existiam são inseridos de uma vez, junto com
+    uma notificação para o usuário; os demais são atualizados com um
+    único executemany.
+
+    Returns:
+        Quantidade de empréstimos que passaram a constar como atrasados
+    """
+    existentes = set(db.session.scalars(
+        db.select(Atraso.emprestimo_id).where(Atraso.emprestimo_id.in_([linha.id for linha in linhas]))
+    ))
+
+    novos = []
+    atualizados = []
+    notificacoes = []
+    agora = datetime.utcnow()
+    for linha in linhas:
+        dias = (referencia - linha.data_devolucao).days
+        registro = {'dias_atraso': dias, 'data_referencia': referencia,
+                    'multa_centavos': dias * max(linha.quantidade_livros, 1) * multa_diaria_centavos}
+        if linha.id in existentes:
+            atualizados.append({'id_emprestimo': linha.id, **registro})
+        else:
+            novos.append({'emprestimo_id': linha.id, **registro})
+            notificacoes.append({
+                'usuario_id': linha.usuario_id, 'emprestimo_id': linha.id, 'tipo': 'atraso', 'criada_em': agora,
+                'mensagem': (f'O empréstimo {linha.numero_emprestimo} está atrasado: a devolução '
+                             f'era em {linha.data_devolucao.strftime("%d/%m/%Y")}.'),
+            })
+
+    atrasos = Atraso.__table__
+    if novos:
+        db.session.execute(atrasos.insert(), novos)
+        db.session.execute(Notificacao.__table__.insert(), notificacoes)
+    if atualizados:
+        db.session.execute(
+            atrasos.update().where(atrasos.c.emprestimo_id == db.bindparam('id_emprestimo')),
+            atualizados
+        )
+    return len(novos)
+
+def processar_atrasos(referencia=None, lote=None, reiniciar=False):
+    """
+    Processa os empréstimos atrasados: dias de atraso, multa e notificação.
+
+    Os empréstimos são lidos e gravados em lotes de tamanho fixo, cada um
+    em sua própria transação junto com o checkpoint, então a memória usada
+    não depende do total de atrasados e uma execução interrompida continua
+    do último lote gravado. Ao final, descarta do retrato os empréstimos
+    que deixaram de estar atrasados.
+
+    Args:
+        referencia: Data considerada como "hoje" (padrão: data atual)
+        lote: Empréstimos por lote (padrão: ATRASOS_LOTE)
+        reiniciar: Ignora o checkpoint de uma execução interrompida
+
+    Returns:
+        ResultadoAtrasos; em estado OCUPADA ou CONCLUIDA nada foi processado
+    """
+    referencia = referencia or date.today()
+    lote = lote or current_app.config['ATRASOS_LOTE']
+    multa_diaria = current_app.config['MULTA_DIARIA_CENTAVOS']
+
+    execucao = iniciar_execucao(TAREFA_ATRASOS, referencia, reiniciar)
+    if execucao.estado in (OCUPADA, CONCLUIDA):
+        return ResultadoAtrasos(execucao.estado, execucao.processados, 0, 0, 0, 0.0)
+
+    inicio = time.perf_counter()
+    ultimo = execucao.checkpoint
+    if ultimo is not None:
+        ultimo = (date.fromisoformat(ultimo[0]), ultimo[1])
+    processados = execucao.processados
+    nesta_execucao = novos = 0
+    try:
+        while linhas := buscar_lote_atrasados(referencia, ultimo, lote):
+            novos += gravar_atrasos(linhas, referencia, multa_diaria)
+            ultimo = (linhas[-1].data_devolucao, linhas[-1].id)
+            processados += len(linhas)
+            nesta_execucao += len(linhas)
+            salvar_checkpoint(TAREFA_ATRASOS, [ultimo[0].isoformat(), ultimo[1]], processados)
+            registrar_versoes({'atrasos'})
+            db.session.commit()
+
+        # Registros não recalculados nesta execução não estão mais atrasados
+        atrasos = Atraso.__table__
+        removidos = db.session.execute(atrasos.delete().where(atrasos.c.data_referencia != referencia)).rowcount
+        if removidos:
+            registrar_versoes({'atrasos'})
+        concluir_execucao(TAREFA_ATRASOS)
+        db.session.commit()
+    except BaseException:
+        liberar_execucao(TAREFA_ATRASOS)
+        raise
+
+    return ResultadoAtrasos(execucao.estado, processados, nesta_execucao, novos, removidos,
+                            time.perf_counter() - inicio)
+
+def tarefa_atrasos():
+    """Execução agendada de processar_atrasos(), com o resultado no log da aplicação"""
+    resultado = processar_atrasos()
+    if resultado.estado in (OCUPADA, CONCLUIDA):
+        current_app.logger.info('Processamento de atrasos ignorado: %s', resultado.estado)
+        return
+    current_app.logger.info(
+        'Atrasos processados: %d empréstimo(s) em %.1fs (%.0f/s), %d novo(s), %d removido(s)',
+        resultado.nesta_execucao, resultado.segundos,
+        resultado.nesta_execucao / resultado.segundos if resultado.segundos else 0,
+        resultado.novos, resultado.removidos)
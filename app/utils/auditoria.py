@@ -0,0 +1,335 @@
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import Column, event, inspect
+from sqlalchemy.orm.attributes import NO_VALUE
+from sqlalchemy.sql import ClauseElement
+from collections import deque
+from datetime import date, datetime, timedelta
+from app import db
+from app.models.models import RegistroAuditoria, exclusao_pendente
+import atexit
+import click
+import json
+import os
+import threading
+
+# Tabelas auditadas e campos que ficam de fora do registro: os contadores
+# mantidos pela circulação e os derivados de outros campos
+TABELAS_AUDITADAS = {
+    'livros': {'disponiveis', 'isbn_normalizado'},
+    'usuarios': set(),
+    'emprestimos': set(),
+}
+
+def configurar_auditoria(app):
+    """
+    Cria o buffer da auditoria com o destino escolhido em AUDITORIA_BACKEND:
+    'banco' (tabela auditoria), 'arquivo' (JSONL em AUDITORIA_ARQUIVO, com
+    rotação) ou 'nenhum'.
+    """
+    nome = app.config['AUDITORIA_BACKEND']
+    if nome == 'banco':
+        gravar = GravadorBanco(app)
+    elif nome == 'arquivo':
+        gravar = GravadorArquivo(app.config['AUDITORIA_ARQUIVO'], app.config['AUDITORIA_ARQUIVO_MAX_BYTES'],
+                                 app.config['AUDITORIA_ARQUIVO_COPIAS'])
+    elif nome == 'nenhum':
+        app.extensions['auditoria'] = None
+        return
+    else:
+        raise RuntimeError(f'AUDITORIA_BACKEND inválido: {nome}')
+    buffer = BufferAuditoria(gravar, app.config['AUDITORIA_LOTE'], app.config['AUDITORIA_INTERVALO_SEGUNDOS'],
+                             app.config['AUDITORIA_BUFFER_MAXIMO'], app.logger)
+    app.extensions['auditoria'] = buffer
+    # O que ainda estiver no buffer é gravado quando o processo termina normalmente
+    atexit.register(buffer.descarregar)
+
+def buffer_auditoria():
+    return current_app.extensions.get('auditoria') if has_app_context() else None
+
+class BufferAuditoria:
+    """
+    Fila em memória dos registros de auditoria das transações confirmadas.
+
+    A requisição só acrescenta os registros à fila; uma thread do processo
+    os grava em lotes a cada intervalo segundos, ou assim que a fila chega a
+    lote registros, então a auditoria não soma escritas ao tempo de resposta.
+    Se a gravação falhar, os registros voltam para a fila e são tentados de
+    novo no ciclo seguinte; acima de maximo registros os mais antigos são
+    descartados (e contados em descartados), para não esgotar a memória com
+    o destino fora do ar.
+
+    Registros ainda na fila se perdem se o processo for encerrado à força.
+    """
+
+    def __init__(self, gravar, lote, intervalo, maximo, logger):
+        self.gravar = gravar
+        self.lote = lote
+        self.intervalo = intervalo
+        self.maximo = maximo
+        self.logger = logger
+        self.descartados = 0
+        self._fila = deque()
+        self._trava = threading.Lock()
+        self._trava_gravacao = threading.Lock()
+        self._sinal = threading.Event()
+        self._pid = None
+
+    def adicionar(self, registros):
+        with self._trava:
+            self._fila.extend(registros)
+            excesso = len(self._fila) - self.maximo
+            for _ in range(max(excesso, 0)):
+                self._fila.popleft()
+            self.descartados += max(excesso, 0)
+            cheia = len(self._fila) >= self.lote
+        self._iniciar_thread()
+        if cheia:
+            self._sinal.set()
+
+    def pendentes(self):
+        with self._trava:
+            return len(self._fila)
+
+    def _iniciar_thread(self):
+        # Uma thread por processo: após um fork (workers do gunicorn com
+        # --preload) a thread do processo pai não existe no filho
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._executar, name='auditoria', daemon=True).start()
+
+    def _executar(self):
+        while True:
+            self._sinal.wait(self.intervalo)
+            self._sinal.clear()
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava tudo o que estiver na fila, em lotes; retorna a quantidade gravada"""
+        gravados = 0
+        with self._trava_gravacao:
+            while True:
+                with self._trava:
+                    registros = [self._fila.popleft() for _ in range(min(self.lote, len(self._fila)))]
+                if not registros:
+                    return gravados
+                try:
+                    self.gravar(registros)
+                except Exception:
+                    self.logger.exception('Falha ao gravar %d registro(s) de auditoria', len(registros))
+                    with self._trava:
+                        self._fila.extendleft(reversed(registros))
+                    return gravados
+                gravados += len(registros)
+
+class GravadorBanco:
+    """Insere os registros na tabela auditoria, um lote por transação (executemany)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, registros):
+        with self.app.app_context():
+            with db.engine.begin() as conexao:
+                conexao.execute(RegistroAuditoria.__table__.insert(), registros)
+
+class GravadorArquivo:
+    """
+    Acrescenta os registros, um JSON por linha, ao arquivo informado.
+
+    Quando o arquivo passa de max_bytes, ele vira <arquivo>.1 (o .1 vira .2,
+    e assim por diante) e um novo é iniciado; só as últimas copias rotações
+    são mantidas.
+    """
+
+    def __init__(self, caminho, max_bytes, copias):
+        self.caminho = caminho
+        self.max_bytes = max_bytes
+        self.copias = copias
+
+    def __call__(self, registros):
+        os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+        linhas = ''.join(json.dumps(registro, ensure_ascii=False, default=serializar_valor) + '\n'
+                         for registro in registros)
+        with open(self.caminho, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(linhas)
+            tamanho = arquivo.tell()
+        if tamanho >= self.max_bytes:
+            self.rotacionar()
+
+    def rotacionar(self):
+        for numero in range(self.copias - 1, 0, -1):
+            anterior = f'{self.caminho}.{numero}'
+            if os.path.exists(anterior):
+                os.replace(anterior, f'{self.caminho}.{numero + 1}')
+        if self.copias > 0:
+            os.replace(self.caminho, f'{self.caminho}.1')
+        else:
+            os.remove(self.caminho)
+
+def serializar_valor(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return str(valor)
+
+def valor_registrado(valor):
+    """Valor de um campo como fica no registro (JSON)"""
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+def origem_alteracao():
+    """Rota ou comando que está fazendo a alteração, e o IP do cliente (se houver)"""
+    if has_request_context():
+        return f'{request.method} {request.path}'[:200], request.remote_addr
+    contexto = click.get_current_context(silent=True)
+    return (contexto.command_path[:200] if contexto else None), None
+
+def alteracoes_objeto(objeto, tabela, removido=False):
+    """
+    Campos alterados de um objeto no flush, como {campo: [antes, depois]}.
+
+    Num objeto removido (DELETE) vão os valores que estavam carregados.
+    Campos cujo novo valor é uma expressão SQL (ex.: incrementos relativos)
+    ficam com o depois None, pois o valor só é conhecido pelo banco.
+    """
+    estado = inspect(objeto)
+    ignorados = TABELAS_AUDITADAS[tabela]
+    alteracoes = {}
+    for atributo in estado.mapper.column_attrs:
+        campo = atributo.key
+        # Só colunas da tabela (não as subconsultas como total_emprestimos)
+        if campo in ignorados or not isinstance(atributo.columns[0], Column):
+            continue
+        if removido:
+            valor = estado.attrs[campo].loaded_value
+            if valor is not NO_VALUE and valor is not None:
+                alteracoes[campo] = [valor_registrado(valor), None]
+            continue
+        historico = estado.attrs[campo].history
+        if not historico.added:
+            continue
+        antes = historico.deleted[0] if historico.deleted else None
+        depois = historico.added[0]
+        if isinstance(depois, ClauseElement):
+            depois = None
+        if antes != depois:
+            alteracoes[campo] = [valor_registrado(antes), valor_registrado(depois)]
+    return alteracoes
+
+@event.listens_for(db.session, 'after_flush')
+def registrar_auditoria(session, contexto):
+    """Guarda na sessão os registros das alterações do flush; só vão para a fila após o commit"""
+    if buffer_auditoria() is None:
+        return
+    agora = datetime.utcnow()
+    origem, endereco_ip = origem_alteracao()
+    registros = session.info.setdefault('auditoria', [])
+    for operacao, objetos in (('inserir', session.new), ('alterar', session.dirty), ('remover', session.deleted)):
+        for objeto in objetos:
+            tabela = getattr(objeto, '__tablename__', None)
+            if tabela not in TABELAS_AUDITADAS:
+                continue
+            alteracoes = alteracoes_objeto(objeto, tabela, removido=operacao == 'remover')
+            if not alteracoes and operacao == 'alterar':
+                continue
+            operacao_objeto = 'excluir' if operacao == 'alterar' and exclusao_pendente(objeto) else operacao
+            registros.append({'registrado_em': agora, 'tabela': tabela, 'registro_id': objeto.id,
+                              'operacao': operacao_objeto, 'alteracoes': alteracoes,
+                              'origem': origem, 'endereco_ip': endereco_ip})
+
+def registrar_alteracao(tabela, registro_id, operacao, alteracoes, session=None):
+    """
+    Guarda na sessão o registro de uma gravação feita com SQL direto
+    (devoluções, livros de um empréstimo, empréstimos em lote, importação),
+    que não passa pelo after_flush do ORM; como os demais, só vai para a
+    fila após o commit.
+
+    Uma alteração de um registro inserido pelo ORM na mesma transação (ex.:
+    os livros de um empréstimo novo) é juntada ao registro da inserção.
+
+    Args:
+        alteracoes: {campo: (antes, depois)}; campos ignorados da tabela
+            (TABELAS_AUDITADAS) ficam de fora
+    """
+    if buffer_auditoria() is None:
+        return
+    session = session or db.session()
+    ignorados = TABELAS_AUDITADAS[tabela]
+    alteracoes = {campo: [valor_registrado(antes), valor_registrado(depois)]
+                  for campo, (antes, depois) in alteracoes.items() if campo not in ignorados}
+    registros = session.info.setdefault('auditoria', [])
+    if operacao == 'alterar':
+        for registro in registros:
+            if (registro['tabela'], registro['registro_id'], registro['operacao']) == (tabela, registro_id, 'inserir'):
+                registro['alteracoes'].update({campo: [None, depois] for campo, (_, depois) in alteracoes.items()})
+                return
+    origem, endereco_ip = origem_alteracao()
+    registros.append({'registrado_em': datetime.utcnow(), 'tabela': tabela, 'registro_id': registro_id,
+                      'operacao': operacao, 'alteracoes': alteracoes,
+                      'origem': origem, 'endereco_ip': endereco_ip})
+
+@event.listens_for(db.session, 'after_commit')
+def enfileirar_auditoria(session):
+    """Passa ao buffer os registros da transação confirmada"""
+    registros = session.info.pop('auditoria', None)
+    buffer = buffer_auditoria()
+    if registros and buffer is not None:
+        buffer.adicionar(registros)
+
+@event.listens_for(db.session, 'after_rollback')
+def descartar_auditoria(session):
+    """Descarta os registros de uma transação desfeita"""
+    session.info.pop('auditoria', None)
+
+def podar_auditoria(antes_de=None, manter=None, lote=5000, arquivar=None):
+    """
+    Remove da tabela auditoria os registros anteriores a antes_de e/ou além
+    dos manter mais recentes, em lotes de lote registros (uma transação por
+    lote, para não travar a tabela por muito tempo).
+
+    Args:
+        antes_de: datetime; registros mais antigos são removidos
+        manter: Quantidade de registros mais recentes a manter
+        arquivar: Arquivo aberto em modo texto onde os registros removidos
+            são gravados (um JSON por linha) antes da remoção
+
+    Returns:
+        Quantidade de registros removidos
+    """
+    tabela = RegistroAuditoria.__table__
+    condicoes = []
+    if antes_de is not None:
+        condicoes.append(tabela.c.registrado_em < antes_de)
+    if manter is not None:
+        corte = db.session.execute(
+            db.select(tabela.c.id).order_by(tabela.c.id.desc()).offset(manter).limit(1)).scalar()
+        if corte is not None:
+            condicoes.append(tabela.c.id <= corte)
+        elif antes_de is None:
+            return 0
+    if not condicoes:
+        return 0
+
+    removidos = 0
+    while True:
+        consulta = db.select(tabela).where(db.or_(*condicoes)).order_by(tabela.c.id).limit(lote)
+        if arquivar is None:
+            consulta = consulta.with_only_columns(tabela.c.id)
+        linhas = db.session.execute(consulta).all()
+        if not linhas:
+            return removidos
+        if arquivar is not None:
+            for linha in linhas:
+                arquivar.write(json.dumps(linha._asdict(), ensure_ascii=False, default=serializar_valor) + '\n')
+            arquivar.flush()
+        db.session.execute(tabela.delete().where(tabela.c.id.in_([linha.id for linha in linhas])))
+        db.session.commit()
+        removidos += len(linhas)
+
+def tarefa_auditoria():
+    """Tarefa agendada: aplica a retenção de AUDITORIA_RETENCAO_DIAS"""
+    dias = current_app.config['AUDITORIA_RETENCAO_DIAS']
+    removidos = podar_auditoria(antes_de=datetime.utcnow() - timedelta(days=dias))
+    if removidos:
+        current_app.logger.info('Auditoria: %d registro(s) com mais de %d dia(s) removido(s)', removidos, dias)
+    return removidos
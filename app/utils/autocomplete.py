@@ -0,0 +1,20 @@
+from flask import request, jsonify, current_app
+
+def parametros_autocomplete():
+    """Lê o termo digitado (?q=) e o limite de sugestões (?limite=), respeitando o máximo configurado"""
+    termo = request.args.get('q', '').strip()
+    limite = request.args.get('limite', type=int) or current_app.config['AUTOCOMPLETE_LIMITE']
+    limite = max(1, min(limite, current_app.config['AUTOCOMPLETE_LIMITE_MAX']))
+    return termo, limite
+
+def resposta_autocomplete(sugestoes):
+    """
+    Monta a resposta JSON das sugestões ([{"id": ..., "label": ...}, ...]).
+
+    O navegador pode reaproveitá-la por AUTOCOMPLETE_CACHE_SEGUNDOS, evitando
+    uma nova requisição quando o usuário apaga e redigita o mesmo termo.
+    """
+    resposta = jsonify(sugestoes)
+    resposta.cache_control.private = True
+    resposta.cache_control.max_age = current_app.config['AUTOCOMPLETE_CACHE_SEGUNDOS']
+    return resposta
@@ -0,0 +1,102 @@
+from flask import current_app, g, request, session, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+import time
+
+# Chave do banco de leitura em SQLALCHEMY_BINDS
+REPLICA = 'replica'
+
+def opcoes_engine(config, url):
+    """
+    Opções do create_engine() a partir das configurações DB_*.
+
+    O tamanho do pool só vale para servidores de banco (no SQLite o
+    Flask-SQLAlchemy escolhe o pool); o tempo limite das instruções e o
+    application_name são parâmetros de conexão do PostgreSQL.
+    """
+    opcoes = {'pool_pre_ping': config['DB_POOL_PRE_PING'], 'pool_recycle': config['DB_POOL_RECICLAR']}
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        return opcoes
+
+    opcoes.update(pool_size=config['DB_POOL_TAMANHO'], max_overflow=config['DB_POOL_EXCEDENTE'],
+                  pool_timeout=config['DB_POOL_ESPERA'])
+    if backend == 'postgresql':
+        parametros = {'application_name': config['DB_NOME_APLICACAO']}
+        if config['DB_TEMPO_LIMITE_CONSULTA_MS']:
+            parametros['options'] = f"-c statement_timeout={config['DB_TEMPO_LIMITE_CONSULTA_MS']}"
+        opcoes['connect_args'] = parametros
+    return opcoes
+
+def configurar_banco(app):
+    """
+    Monta as opções dos engines e o banco de leitura, antes de db.init_app().
+
+    Opções passadas diretamente em SQLALCHEMY_ENGINE_OPTIONS prevalecem sobre
+    as calculadas. Com REPLICA_DATABASE_URL, as rotas marcadas com
+    @somente_leitura leem da réplica (ver SessaoRoteada).
+    """
+    url = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if url:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**opcoes_engine(app.config, url),
+                                                   **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+    replica = app.config['REPLICA_DATABASE_URL']
+    if not replica:
+        return
+    app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}),
+                                      REPLICA: {'url': replica, **opcoes_engine(app.config, replica)}}
+
+    @app.before_request
+    def escolher_banco():
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, 'somente_leitura', False):
+            return
+        # Logo após uma gravação, o mesmo cliente lê do principal até a réplica alcançá-lo
+        if session.get('ler_principal_ate', 0) > time.time():
+            return
+        from app import db
+        db.session.info[REPLICA] = True
+
+    @app.after_request
+    def lembrar_gravacao(response):
+        if g.get('gravou_no_banco'):
+            session['ler_principal_ate'] = time.time() + current_app.config['REPLICA_ATRASO_SEGUNDOS']
+        return response
+
+def somente_leitura(view):
+    """
+    Marca uma view que só lê dados: com uma réplica configurada
+    (REPLICA_DATABASE_URL), suas consultas vão para ela.
+
+    Exemplo:
+        @livros_bp.route('/livros')
+        @somente_leitura
+        def livros(): ...
+    """
+    view.somente_leitura = True
+    return view
+
+class SessaoRoteada(Session):
+    """
+    Sessão do Flask-SQLAlchemy que envia à réplica as leituras das rotas
+    somente de leitura.
+
+    Flushes e instruções de escrita (INSERT, UPDATE, DELETE) vão sempre para
+    o banco principal, mesmo que uma dessas rotas acabe gravando algo.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get(REPLICA) and not self._flushing
+                and not getattr(clause, 'is_dml', False)):
+            engine = self._db.engines.get(REPLICA)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(SessaoRoteada, 'after_commit')
+def registrar_gravacao(sessao):
+    """Marca a requisição que confirmou uma transação (ver lembrar_gravacao)"""
+    if has_request_context():
+        g.gravou_no_banco = True
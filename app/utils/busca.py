@@ -0,0 +1,180 @@
+from sqlalchemy import event, text
+from sqlalchemy.orm import undefer
+from app import db
+from app.models.models import Livro, exclusao_pendente
+import re
+import unicodedata
+
+# Peso de cada campo no ranking: título > autor > categoria
+PESOS_BUSCA = {'titulo': 'A', 'autor': 'B', 'categoria': 'C'}
+PESOS_BM25 = (10.0, 5.0, 1.0)
+
+# Quantidade de livros reindexados por lote em reindexar()
+LOTE_REINDEXACAO = 1000
+
+def normalizar(texto):
+    """Remove acentos e converte para minúsculas ('Ficção' -> 'ficcao')"""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+def termos_busca(consulta):
+    """Quebra a consulta em termos alfanuméricos já normalizados"""
+    return re.findall(r'\w+', normalizar(consulta))
+
+def criar_estrutura_busca(conexao):
+    """
+    Cria (se ainda não existir) a estrutura do índice de busca.
+
+    PostgreSQL: coluna livros.busca (tsvector) com índice GIN.
+    SQLite: tabela virtual FTS5 livros_busca, com rowid igual ao id do livro.
+    """
+    dialeto = conexao.dialect.name
+    if dialeto == 'postgresql':
+        conexao.execute(text('ALTER TABLE livros ADD COLUMN IF NOT EXISTS busca tsvector'))
+        conexao.execute(text('CREATE INDEX IF NOT EXISTS ix_livros_busca ON livros USING gin (busca)'))
+    elif dialeto == 'sqlite':
+        conexao.execute(text(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS livros_busca '
+            "USING fts5(titulo, autor, categoria, tokenize='unicode61 remove_diacritics 2')"
+        ))
+
+def remover_estrutura_busca(conexao):
+    """Remove a estrutura criada por criar_estrutura_busca()"""
+    dialeto = conexao.dialect.name
+    if dialeto == 'postgresql':
+        conexao.execute(text('DROP INDEX IF EXISTS ix_livros_busca'))
+        conexao.execute(text('ALTER TABLE livros DROP COLUMN IF EXISTS busca'))
+    elif dialeto == 'sqlite':
+        conexao.execute(text('DROP TABLE IF EXISTS livros_busca'))
+
+def indexar_livros(conexao, livros):
+    """
+    Atualiza o índice de busca de uma lista de livros.
+
+    Args:
+        conexao: Conexão SQLAlchemy (a mesma da transação que gravou os livros)
+        livros: Sequência de dicionários com id, titulo, autor e categoria
+    """
+    if not livros:
+        return
+    parametros = [
+        {'id': livro['id'], 'titulo': normalizar(livro['titulo']),
+         'autor': normalizar(livro['autor']), 'categoria': normalizar(livro['categoria'])}
+        for livro in livros
+    ]
+    dialeto = conexao.dialect.name
+    if dialeto == 'postgresql':
+        conexao.execute(text(
+            "UPDATE livros SET busca = "
+            f"setweight(to_tsvector('simple', :titulo), '{PESOS_BUSCA['titulo']}') || "
+            f"setweight(to_tsvector('simple', :autor), '{PESOS_BUSCA['autor']}') || "
+            f"setweight(to_tsvector('simple', :categoria), '{PESOS_BUSCA['categoria']}') "
+            "WHERE id = :id"
+        ), parametros)
+    elif dialeto == 'sqlite':
+        conexao.execute(text('DELETE FROM livros_busca WHERE rowid = :id'), parametros)
+        conexao.execute(text(
+            'INSERT INTO livros_busca (rowid, titulo, autor, categoria) '
+            'VALUES (:id, :titulo, :autor, :categoria)'
+        ), parametros)
+
+def remover_do_indice(conexao, livro_id):
+    """Remove um livro do índice (no PostgreSQL a coluna sai junto com a linha)"""
+    if conexao.dialect.name == 'sqlite':
+        conexao.execute(text('DELETE FROM livros_busca WHERE rowid = :id'), {'id': livro_id})
+
+def reindexar(conexao):
+    """
+    Reconstrói o índice de busca de todo o acervo (sem os livros excluídos), em lotes por id.
+
+    Returns:
+        Quantidade de livros indexados
+    """
+    if conexao.dialect.name == 'sqlite':
+        conexao.execute(text('DELETE FROM livros_busca'))
+
+    total = 0
+    ultimo_id = 0
+    while True:
+        lote = conexao.execute(
+            text('SELECT id, titulo, autor, categoria FROM livros '
+                 'WHERE id > :ultimo_id AND excluido_em IS NULL ORDER BY id LIMIT :lote'),
+            {'ultimo_id': ultimo_id, 'lote': LOTE_REINDEXACAO}
+        ).mappings().all()
+        if not lote:
+            break
+        indexar_livros(conexao, lote)
+        total += len(lote)
+        ultimo_id = lote[-1]['id']
+    return total
+
+def buscar_livros(consulta, limite=50, colunas=None):
+    """
+    Busca livros por título, autor e categoria, ordenados por relevância.
+
+    A busca ignora acentos e maiúsculas, e cada termo casa por prefixo
+    ('dom casm' encontra 'Dom Casmurro'). Todos os termos precisam aparecer.
+
+    Args:
+        consulta: Texto digitado pelo usuário
+        limite: Quantidade máxima de resultados
+        colunas: Colunas a selecionar em vez do objeto Livro completo
+            (deve incluir Livro.id); útil para respostas leves como o autocomplete
+
+    Returns:
+        Lista de Livro (ou de linhas com as colunas pedidas) em ordem de relevância
+    """
+    termos = termos_busca(consulta)
+    if not termos:
+        return []
+
+    if colunas:
+        query = db.session.query(*colunas)
+    else:
+        query = Livro.query.options(undefer(Livro.total_emprestimos))
+    dialeto = db.session.get_bind().dialect.name
+
+    if dialeto == 'postgresql':
+        tsquery = db.func.to_tsquery('simple', ' & '.join(f'{termo}:*' for termo in termos))
+        busca = db.literal_column('livros.busca')
+        return (query.filter(busca.op('@@')(tsquery))
+                .order_by(db.func.ts_rank_cd(busca, tsquery).desc(), Livro.id)
+                .limit(limite).all())
+
+    if dialeto == 'sqlite':
+        ids = db.session.execute(text(
+            'SELECT rowid FROM livros_busca WHERE livros_busca MATCH :consulta '
+            f'ORDER BY bm25(livros_busca, {", ".join(map(str, PESOS_BM25))}) LIMIT :limite'
+        ), {'consulta': ' '.join(f'"{termo}"*' for termo in termos), 'limite': limite}).scalars().all()
+        if not ids:
+            return []
+        livros = {livro.id: livro for livro in query.filter(Livro.id.in_(ids))}
+        return [livros[id] for id in ids if id in livros]
+
+    # Outros bancos: sem índice de texto, cada termo precisa aparecer em algum campo
+    for termo in termos:
+        padrao = f'%{termo}%'
+        query = query.filter(db.or_(Livro.titulo.ilike(padrao), Livro.autor.ilike(padrao),
+                                    Livro.categoria.ilike(padrao)))
+    return query.order_by(Livro.titulo, Livro.id).limit(limite).all()
+
+# Mantém o índice atualizado a cada livro gravado, na mesma transação
+@event.listens_for(Livro, 'after_insert')
+def indexar_livro_inserido(mapper, conexao, livro):
+    indexar_livros(conexao, [{'id': livro.id, 'titulo': livro.titulo,
+                              'autor': livro.autor, 'categoria': livro.categoria}])
+
+@event.listens_for(Livro, 'after_update')
+def indexar_livro_atualizado(mapper, conexao, livro):
+    # Livro excluído sai do índice; nos demais, só reindexa se algum campo
+    # pesquisável mudou (trocar a capa não reindexa)
+    if exclusao_pendente(livro):
+        remover_do_indice(conexao, livro.id)
+        return
+    estado = db.inspect(livro)
+    if any(estado.attrs[campo].history.has_changes() for campo in PESOS_BUSCA):
+        indexar_livro_inserido(mapper, conexao, livro)
+
+@event.listens_for(Livro, 'after_delete')
+def remover_indice_livro(mapper, conexao, livro):
+    remover_do_indice(conexao, livro.id)
@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from app.utils.capa_utils import gravar_arquivo_atomico, podar_pasta
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+class CacheTTL:
+    """
+    Cache em memória com expiração por tempo e tamanho máximo.
+
+    Quando o limite de itens é atingido, descarta o item usado há mais tempo
+    (LRU). É local a cada processo: serve para respostas pequenas e baratas de
+    recalcular, em que alguns segundos de atraso após uma alteração são aceitáveis.
+    """
+
+    def __init__(self, ttl=60, maximo=1024):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def get(self, chave):
+        """Retorna o valor guardado ou None se não existir ou tiver expirado"""
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is None:
+                self.falhas += 1
+                return None
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def set(self, chave, valor, ttl=None):
+        """Guarda um valor por ttl segundos (padrão: o ttl do cache)"""
+        with self._trava:
+            self._itens[chave] = (time.monotonic() + (ttl or self.ttl), valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        """Remove todos os itens"""
+        with self._trava:
+            self._itens.clear()
+
+    def metricas(self):
+        """Acertos, falhas e itens guardados desde a criação do cache"""
+        with self._trava:
+            return {'acertos': self.acertos, 'falhas': self.falhas, 'itens': len(self._itens)}
+
+class CacheArquivos:
+    """
+    Cache de bytes em disco, com a mesma interface do CacheTTL.
+
+    Sobrevive a reinícios e é compartilhado pelos processos que usam a mesma
+    pasta. Não há expiração por tempo: as chaves devem mudar quando o
+    conteúdo muda (ex.: incluir a versão dos dados). O tamanho total é
+    mantido abaixo de maximo_bytes removendo os arquivos lidos há mais tempo.
+    """
+
+    # Gravações entre duas verificações do tamanho total da pasta
+    GRAVACOES_POR_PODA = 100
+
+    def __init__(self, pasta, maximo_bytes):
+        self.pasta = pasta
+        self.maximo_bytes = maximo_bytes
+        self._gravacoes = 0
+        # Arquivos na pasta: contados a cada poda e somados às gravações
+        # deste processo entre duas podas (None até a primeira contagem)
+        self._itens = None
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def caminho(self, chave):
+        nome = hashlib.sha256(repr(chave).encode('utf-8')).hexdigest()
+        return os.path.join(self.pasta, nome[:2], nome)
+
+    def get(self, chave):
+        """Retorna os bytes guardados ou None se não existirem"""
+        caminho = self.caminho(chave)
+        try:
+            with open(caminho, 'rb') as f:
+                valor = f.read()
+            # A data de modificação marca o último uso (ver podar_pasta)
+            os.utime(caminho)
+        except FileNotFoundError:
+            with self._trava:
+                self.falhas += 1
+            return None
+        with self._trava:
+            self.acertos += 1
+        return valor
+
+    def set(self, chave, valor, ttl=None):
+        """Guarda os bytes (ttl é ignorado; existe para manter a interface do CacheTTL)"""
+        caminho = self.caminho(chave)
+        novo = not os.path.exists(caminho)
+        gravar_arquivo_atomico(caminho, valor)
+        with self._trava:
+            self._gravacoes += 1
+            if novo and self._itens is not None:
+                self._itens += 1
+            podar = self._gravacoes % self.GRAVACOES_POR_PODA == 0
+        if podar:
+            _, restantes = podar_pasta(self.pasta, self.maximo_bytes)
+            with self._trava:
+                self._itens = restantes
+
+    def limpar(self):
+        """Remove todos os itens"""
+        shutil.rmtree(self.pasta, ignore_errors=True)
+        with self._trava:
+            self._itens = 0
+
+    def metricas(self):
+        """
+        Acertos e falhas deste processo e arquivos guardados na pasta.
+
+        A contagem vem da última poda (ou, antes dela, de uma leitura da pasta
+        na primeira chamada) mais os itens gravados depois por este processo;
+        os gravados por outros processos só entram na poda seguinte.
+        """
+        with self._trava:
+            itens = self._itens
+        if itens is None:
+            itens = sum(len(nomes) for _, _, nomes in os.walk(self.pasta))
+            with self._trava:
+                if self._itens is None:
+                    self._itens = itens
+        with self._trava:
+            return {'acertos': self.acertos, 'falhas': self.falhas, 'itens': self._itens}
@@ -0,0 +1,130 @@
+from flask import current_app, g, request, session, has_request_context, make_response
+from markupsafe import Markup
+from sqlalchemy import event
+from datetime import date
+from functools import wraps
+from app import db
+from app.utils.cache import CacheTTL, CacheArquivos
+from app.utils.versoes import versoes_dados, TABELAS_VERSIONADAS
+import hashlib
+
+def configurar_cache_respostas(app):
+    """
+    Cria o backend do cache de páginas e fragmentos escolhido em
+    RESPOSTAS_CACHE_BACKEND: 'memoria' (LRU por processo), 'arquivos'
+    (pasta compartilhada entre processos) ou 'nenhum'.
+    """
+    nome = app.config['RESPOSTAS_CACHE_BACKEND']
+    if nome == 'memoria':
+        backend = CacheTTL(ttl=app.config['RESPOSTAS_CACHE_SEGUNDOS'], maximo=app.config['RESPOSTAS_CACHE_ITENS'])
+    elif nome == 'arquivos':
+        backend = CacheArquivos(app.config['RESPOSTAS_CACHE_FOLDER'], app.config['RESPOSTAS_CACHE_MAX_BYTES'])
+    elif nome == 'nenhum':
+        backend = None
+    else:
+        raise RuntimeError(f'RESPOSTAS_CACHE_BACKEND inválido: {nome}')
+    app.extensions['cache_respostas'] = backend
+    app.jinja_env.globals['cache_fragmento'] = cache_fragmento
+
+def backend_cache_respostas():
+    return current_app.extensions.get('cache_respostas')
+
+def metricas_cache_respostas():
+    """Acertos, falhas e itens do cache de respostas (None se estiver desligado)"""
+    backend = backend_cache_respostas()
+    return backend.metricas() if backend is not None else None
+
+def versoes_requisicao():
+    """Versão de todas as tabelas, lida uma única vez por requisição"""
+    versoes = g.get('versoes_dados')
+    if versoes is None:
+        versoes = g.versoes_dados = versoes_dados(*TABELAS_VERSIONADAS)
+    return versoes
+
+@event.listens_for(db.session, 'after_commit')
+def descartar_versoes_requisicao(session):
+    """Após um commit as versões lidas na requisição podem estar desatualizadas"""
+    if has_request_context():
+        g.pop('versoes_dados', None)
+
+def chave_cache(tipo, identificacao, tabelas):
+    """
+    Chave de uma página ou fragmento: muda sempre que uma das tabelas das
+    quais o conteúdo depende é alterada, e também a cada dia (a situação
+    "atrasado" depende da data atual).
+    """
+    versoes = versoes_requisicao()
+    return (tipo, identificacao, tuple((tabela, versoes[tabela]) for tabela in tabelas), date.today().isoformat())
+
+def cache_pagina(*tabelas):
+    """
+    Guarda o HTML de uma view GET enquanto as tabelas informadas não mudarem.
+
+    A chave é a URL completa (com os filtros e o cursor) mais a versão das
+    tabelas, então nenhuma gravação precisa apagar o cache: a próxima
+    leitura simplesmente usa outra chave. A resposta leva um ETag derivado
+    da chave; um navegador que o reenviar em If-None-Match recebe 304 sem
+    que a página seja montada. Respostas com mensagens flash pendentes não
+    são servidas nem guardadas no cache.
+
+    Custa uma consulta (versoes_dados) por requisição, inclusive nos acertos.
+
+    Exemplo:
+        @livros_bp.route('/livros')
+        @orcamento_consultas(2)
+        @cache_pagina('livros', 'emprestimos')
+        def livros(): ...
+    """
+    def decorador(view):
+        @wraps(view)
+        def envolvida(*args, **kwargs):
+            backend = backend_cache_respostas()
+            if backend is None or request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            chave = chave_cache('pagina', request.full_path, tabelas)
+            etag = hashlib.sha256(repr(chave).encode('utf-8')).hexdigest()[:32]
+            if request.if_none_match.contains(etag):
+                resposta = make_response('', 304)
+                estado = 'HIT'
+            elif (html := backend.get(chave)) is not None:
+                resposta = make_response(html)
+                estado = 'HIT'
+            else:
+                resposta = make_response(view(*args, **kwargs))
+                if (resposta.status_code != 200 or resposta.mimetype != 'text/html'
+                        or resposta.direct_passthrough or session.modified):
+                    return resposta
+                backend.set(chave, resposta.get_data())
+                estado = 'MISS'
+
+            resposta.set_etag(etag)
+            # O navegador guarda a página, mas sempre confirma com o servidor se o ETag ainda vale
+            resposta.cache_control.no_cache = True
+            resposta.headers['X-Cache'] = estado
+            return resposta
+        return envolvida
+    return decorador
+
+def cache_fragmento(*partes, tabelas=(), caller=None):
+    """
+    Guarda o HTML de um trecho de template enquanto as tabelas informadas
+    não mudarem. Para uso com {% call %}; as partes identificam o trecho
+    (ex.: o id da linha), de modo que a mesma linha renderizada em outra
+    página, filtro ou ordenação reaproveita o HTML.
+
+    Exemplo:
+        {% call cache_fragmento('livros_emprestimo', emprestimo.id, tabelas=('emprestimos', 'livros')) %}
+            ...
+        {% endcall %}
+    """
+    backend = backend_cache_respostas()
+    if backend is None:
+        return caller()
+
+    chave = chave_cache('fragmento', partes, tabelas)
+    html = backend.get(chave)
+    if html is None:
+        html = str(caller()).encode('utf-8')
+        backend.set(chave, html)
+    return Markup(html.decode('utf-8'))
@@ -0,0 +1,356 @@
+from flask import current_app
+from PIL import Image, ImageOps
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import hashlib
+import os
+import tempfile
+import threading
+
+# Tamanhos pré-gerados das capas (largura, altura máximas).
+# 'original' não está aqui: é servido direto do arquivo enviado.
+TAMANHOS_CAPA = {
+    'thumb': (120, 180),
+    'medium': (480, 720),
+}
+TAMANHO_ORIGINAL = 'original'
+
+# Formato das variantes redimensionadas
+FORMATO_VARIANTE = 'WEBP'
+MIMETYPE_VARIANTE = 'image/webp'
+QUALIDADE_VARIANTE = 80
+
+# Assinaturas (primeiros bytes do arquivo) dos formatos aceitos no upload
+ASSINATURAS_CAPA = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+)
+
+# Tamanho dos blocos lidos do upload e gravados em disco
+BLOCO_UPLOAD = 64 * 1024
+
+# Maior imagem (em pixels) que as variantes decodificam. Um PNG/JPEG pequeno
+# pode declarar dimensões enormes (decompression bomb); acima disto a capa
+# é recusada antes de ser decodificada
+MAX_PIXELS_CAPA = 25_000_000
+
+class CapaInvalida(ValueError):
+    """O arquivo enviado não é uma imagem PNG ou JPEG"""
+
+_executor = None
+_trava_executor = threading.Lock()
+
+# Variantes gravadas por este processo entre duas podas do cache de variantes
+# (podar_pasta percorre a pasta inteira; ver também CacheArquivos)
+GRAVACOES_POR_PODA = 100
+_gravacoes_variantes = 0
+_trava_gravacoes = threading.Lock()
+
+def caminho_capa(capa_hash, pasta=None):
+    """
+    Retorna o caminho em disco de uma capa a partir do seu hash.
+
+    As capas são armazenadas por conteúdo (SHA-256) dentro de UPLOAD_FOLDER,
+    em subpastas com os dois primeiros caracteres do hash para não acumular
+    milhares de arquivos em um único diretório.
+
+    Args:
+        capa_hash: Hash SHA-256 (hexadecimal) do conteúdo da imagem
+        pasta: Pasta base (padrão: UPLOAD_FOLDER da aplicação)
+
+    Returns:
+        Caminho absoluto do arquivo
+    """
+    pasta = pasta or current_app.config['UPLOAD_FOLDER']
+    return os.path.join(pasta, capa_hash[:2], capa_hash)
+
+def salvar_capa(dados, pasta=None):
+    """
+    Grava os bytes de uma capa no armazenamento endereçado por conteúdo.
+
+    Imagens idênticas geram o mesmo hash e são gravadas uma única vez.
+    A escrita é feita em arquivo temporário e movida atomicamente, para que
+    uma leitura concorrente nunca encontre um arquivo incompleto.
+
+    Args:
+        dados: Bytes da imagem
+        pasta: Pasta base (padrão: UPLOAD_FOLDER da aplicação)
+
+    Returns:
+        Tupla (hash, tamanho em bytes)
+    """
+    capa_hash = hashlib.sha256(dados).hexdigest()
+    destino = caminho_capa(capa_hash, pasta)
+
+    if not os.path.exists(destino):
+        gravar_arquivo_atomico(destino, dados)
+
+    return capa_hash, len(dados)
+
+def tipo_imagem(inicio):
+    """Tipo (mimetype) da imagem pelos primeiros bytes do arquivo, ou None se não for PNG nem JPEG"""
+    for assinatura, tipo in ASSINATURAS_CAPA:
+        if inicio.startswith(assinatura):
+            return tipo
+    return None
+
+def salvar_capa_stream(arquivo, pasta=None):
+    """
+    Grava uma capa lida de um arquivo aberto (ex.: request.files['capa'].stream)
+    em blocos de BLOCO_UPLOAD, sem carregar a imagem inteira na memória.
+
+    O formato é conferido pelos primeiros bytes (não pela extensão nem pelo
+    tipo informado pelo navegador), e o hash é calculado enquanto o arquivo
+    é copiado para um temporário na própria pasta das capas, que depois é
+    movido atomicamente para o destino. Se a mesma imagem já estiver
+    armazenada, o temporário é descartado.
+
+    Args:
+        arquivo: Objeto com read(tamanho), posicionado no início
+        pasta: Pasta base (padrão: UPLOAD_FOLDER da aplicação)
+
+    Returns:
+        Tupla (hash, tamanho em bytes, mimetype)
+
+    Raises:
+        CapaInvalida: se o arquivo não for PNG nem JPEG
+    """
+    pasta = pasta or current_app.config['UPLOAD_FOLDER']
+    bloco = arquivo.read(BLOCO_UPLOAD)
+    tipo = tipo_imagem(bloco)
+    if tipo is None:
+        raise CapaInvalida('O arquivo enviado não é uma imagem PNG ou JPEG')
+
+    os.makedirs(pasta, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=pasta, prefix='.upload-')
+    resumo = hashlib.sha256()
+    tamanho = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while bloco:
+                resumo.update(bloco)
+                f.write(bloco)
+                tamanho += len(bloco)
+                bloco = arquivo.read(BLOCO_UPLOAD)
+        capa_hash = resumo.hexdigest()
+        destino = caminho_capa(capa_hash, pasta)
+        if os.path.exists(destino):
+            os.unlink(temporario)
+        else:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(temporario, destino)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.unlink(temporario)
+        raise
+
+    return capa_hash, tamanho, tipo
+
+def gravar_arquivo_atomico(destino, dados):
+    """Grava em arquivo temporário e move para o destino de forma atômica"""
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dados)
+        os.replace(temporario, destino)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+def ler_capa(capa_hash, pasta=None):
+    """Lê os bytes de uma capa armazenada (ou None se o arquivo não existir)"""
+    try:
+        with open(caminho_capa(capa_hash, pasta), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def remover_capa(capa_hash, pasta=None, pasta_variantes=None):
+    """Remove o arquivo de uma capa e suas variantes, ignorando os que já não existirem"""
+    caminhos = [caminho_capa(capa_hash, pasta)]
+    caminhos += [caminho_variante(capa_hash, tamanho, pasta_variantes) for tamanho in TAMANHOS_CAPA]
+    for caminho in caminhos:
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+def caminho_variante(capa_hash, tamanho, pasta_variantes=None):
+    """Retorna o caminho em disco de uma variante redimensionada da capa"""
+    pasta_variantes = pasta_variantes or current_app.config['CAPA_VARIANTES_FOLDER']
+    return os.path.join(pasta_variantes, capa_hash[:2], f'{capa_hash}_{tamanho}.webp')
+
+def gerar_variante(capa_hash, tamanho, pasta=None, pasta_variantes=None):
+    """
+    Gera (ou regera) uma variante redimensionada e recomprimida da capa.
+
+    Args:
+        capa_hash: Hash da capa original
+        tamanho: Chave de TAMANHOS_CAPA (ex: 'thumb', 'medium')
+        pasta: Pasta das capas originais (padrão: UPLOAD_FOLDER)
+        pasta_variantes: Pasta das variantes (padrão: CAPA_VARIANTES_FOLDER)
+
+    Returns:
+        Caminho da variante gerada
+
+    Raises:
+        OSError: se a capa original não existir, não for uma imagem válida
+            ou tiver mais de MAX_PIXELS_CAPA pixels
+    """
+    try:
+        imagem = Image.open(caminho_capa(capa_hash, pasta))
+    except Image.DecompressionBombError as erro:
+        # Acima do limite do próprio Pillow: tratada como as demais imagens inválidas
+        raise OSError(f'Capa grande demais: {erro}') from erro
+    with imagem:
+        # Image.open só leu o cabeçalho: confere as dimensões antes de decodificar
+        if imagem.width * imagem.height > MAX_PIXELS_CAPA:
+            raise OSError(f'Capa grande demais: {imagem.width}x{imagem.height} pixels')
+        imagem = ImageOps.exif_transpose(imagem)
+        if imagem.mode not in ('RGB', 'RGBA'):
+            imagem = imagem.convert('RGBA' if 'A' in imagem.getbands() else 'RGB')
+        imagem.thumbnail(TAMANHOS_CAPA[tamanho], Image.LANCZOS)
+
+        buffer = BytesIO()
+        imagem.save(buffer, FORMATO_VARIANTE, quality=QUALIDADE_VARIANTE, method=4)
+
+    destino = caminho_variante(capa_hash, tamanho, pasta_variantes)
+    gravar_arquivo_atomico(destino, buffer.getvalue())
+    return destino
+
+def gerar_variantes(capa_hash, pasta=None, pasta_variantes=None, forcar=False):
+    """
+    Gera todas as variantes de uma capa que ainda não existem em disco.
+
+    Não depende do contexto da aplicação quando as pastas são informadas,
+    o que permite chamá-la a partir de um pool de processos.
+
+    Args:
+        forcar: Regera também as variantes que já existem
+
+    Returns:
+        Quantidade de variantes geradas
+    """
+    geradas = 0
+    for tamanho in TAMANHOS_CAPA:
+        if forcar or not os.path.exists(caminho_variante(capa_hash, tamanho, pasta_variantes)):
+            gerar_variante(capa_hash, tamanho, pasta, pasta_variantes)
+            geradas += 1
+    return geradas
+
+def executor_capas():
+    """Retorna o pool de threads que processa as capas enviadas, criando-o no primeiro uso"""
+    global _executor
+    with _trava_executor:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=current_app.config['CAPAS_THREADS'],
+                                           thread_name_prefix='capas')
+        return _executor
+
+def contar_gravacoes(quantidade, pasta_variantes, limite):
+    """Conta as variantes gravadas e poda o cache a cada GRAVACOES_POR_PODA (sem contexto da aplicação)"""
+    global _gravacoes_variantes
+    with _trava_gravacoes:
+        anteriores = _gravacoes_variantes
+        _gravacoes_variantes += quantidade
+        podar = anteriores // GRAVACOES_POR_PODA != _gravacoes_variantes // GRAVACOES_POR_PODA
+    if podar:
+        podar_pasta(pasta_variantes, limite)
+
+def processar_capa(capa_hash, pasta, pasta_variantes, limite):
+    """Gera as variantes de uma capa e conta as gravações para a poda do cache (sem contexto da aplicação)"""
+    contar_gravacoes(gerar_variantes(capa_hash, pasta, pasta_variantes), pasta_variantes, limite)
+
+def agendar_variantes(capa_hash):
+    """
+    Gera as variantes de uma capa recém-enviada em segundo plano, para que a
+    requisição do upload não espere o redimensionamento (o Pillow libera o
+    GIL enquanto processa a imagem). Se falhar, as variantes são geradas sob
+    demanda no primeiro acesso (obter_variante).
+
+    Returns:
+        Future da geração
+    """
+    config = current_app.config
+    logger = current_app.logger
+    futuro = executor_capas().submit(processar_capa, capa_hash, config['UPLOAD_FOLDER'],
+                                     config['CAPA_VARIANTES_FOLDER'], config['CAPA_VARIANTES_MAX_BYTES'])
+
+    def verificar(futuro):
+        if not futuro.cancelled() and futuro.exception() is not None:
+            logger.warning('Não foi possível gerar as variantes da capa %s: %r', capa_hash, futuro.exception())
+    futuro.add_done_callback(verificar)
+    return futuro
+
+def obter_variante(capa_hash, tamanho):
+    """
+    Retorna o caminho de uma variante, gerando-a sob demanda se estiver ausente.
+
+    Cada acesso atualiza a data de modificação do arquivo, que é usada como
+    critério de LRU na poda do cache, feita a cada GRAVACOES_POR_PODA
+    variantes geradas. Se a imagem original não puder ser processada,
+    retorna None para que o chamador sirva o original.
+    """
+    caminho = caminho_variante(capa_hash, tamanho)
+    try:
+        os.utime(caminho)
+    except FileNotFoundError:
+        try:
+            gerar_variante(capa_hash, tamanho)
+        except OSError as erro:
+            current_app.logger.warning('Não foi possível gerar a variante %s da capa %s: %r', tamanho, capa_hash, erro)
+            return None
+        config = current_app.config
+        contar_gravacoes(1, config['CAPA_VARIANTES_FOLDER'], config['CAPA_VARIANTES_MAX_BYTES'])
+    return caminho
+
+def podar_variantes(pasta_variantes=None, limite=None):
+    """
+    Mantém o cache de variantes abaixo do limite de tamanho.
+
+    Remove as variantes acessadas há mais tempo (menor data de modificação)
+    até que o total em disco caiba em CAPA_VARIANTES_MAX_BYTES. As variantes
+    removidas são regeradas sob demanda no próximo acesso.
+
+    Returns:
+        Quantidade de arquivos removidos
+    """
+    pasta_variantes = pasta_variantes or current_app.config['CAPA_VARIANTES_FOLDER']
+    limite = limite if limite is not None else current_app.config['CAPA_VARIANTES_MAX_BYTES']
+    removidos, _ = podar_pasta(pasta_variantes, limite)
+    return removidos
+
+def podar_pasta(pasta, limite):
+    """
+    Remove os arquivos da pasta (e subpastas) modificados há mais tempo até
+    que o total caiba em limite bytes.
+
+    Returns:
+        Tupla (arquivos removidos, arquivos que ficaram na pasta)
+    """
+    arquivos = []
+    total = 0
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            arquivos.append((info.st_mtime, info.st_size, caminho))
+            total += info.st_size
+
+    removidos = 0
+    if total > limite:
+        arquivos.sort()
+        for _, tamanho, caminho in arquivos:
+            if total <= limite:
+                break
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+            removidos += 1
+    return removidos, len(arquivos) - removidos
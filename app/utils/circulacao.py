@@ -0,0 +1,108 @@
+from collections import Counter
+from datetime import date, datetime
+from app import db
+from app.models.models import Livro, Emprestimo, Atraso, emprestimo_livro
+from app.utils.versoes import registrar_versoes
+from app.utils.estatisticas import registrar_variacao, TOTAIS
+from app.utils.auditoria import registrar_alteracao
+
+def reservar_exemplares(livro_ids):
+    """
+    Retira da estante um exemplar de cada livro informado.
+
+    A retirada é um único UPDATE condicional (... WHERE disponiveis >=
+    quantidade). No PostgreSQL, duas retiradas simultâneas do mesmo livro
+    disputam o lock da linha e a segunda reavalia a condição já com o valor
+    decrementado; no SQLite as escritas são serializadas. Assim o mesmo
+    exemplar nunca é emprestado duas vezes, sem um SELECT ... FOR UPDATE antes.
+    Livros excluídos (logicamente) depois da validação também não são
+    retirados, e voltam como indisponíveis.
+
+    Args:
+        livro_ids: Ids dos livros (um id repetido retira mais de um exemplar)
+
+    Returns:
+        Conjunto dos ids sem exemplares suficientes (vazio se deu tudo certo).
+        Se não estiver vazio, o chamador deve desfazer a transação, pois os
+        demais livros já foram decrementados.
+    """
+    quantidades = Counter(livro_ids)
+    if not quantidades:
+        return set()
+
+    livros = Livro.__table__
+    quantidade = db.case(quantidades, value=livros.c.id)
+    resultado = db.session.execute(
+        livros.update()
+        .where(livros.c.id.in_(quantidades), livros.c.disponiveis >= quantidade, livros.c.excluido_em.is_(None))
+        .values(disponiveis=livros.c.disponiveis - quantidade)
+        .returning(livros.c.id)
+    )
+    reservados = set(resultado.scalars())
+    if reservados:
+        registrar_versoes({'livros'})
+    return set(quantidades) - reservados
+
+def liberar_exemplares(livro_ids):
+    """Devolve à estante um exemplar de cada livro informado (a restrição ck_livros_disponiveis impede passar do total)"""
+    quantidades = Counter(livro_ids)
+    if not quantidades:
+        return
+
+    livros = Livro.__table__
+    db.session.execute(
+        livros.update()
+        .where(livros.c.id.in_(quantidades))
+        .values(disponiveis=livros.c.disponiveis + db.case(quantidades, value=livros.c.id))
+    )
+    registrar_versoes({'livros'})
+
+def mensagem_indisponiveis(livro_ids):
+    """Mensagem de erro com os títulos dos livros sem exemplares disponíveis"""
+    # Inclui os excluídos: reservar_exemplares também os recusa
+    titulos = db.session.scalars(
+        db.select(Livro.titulo).where(Livro.id.in_(livro_ids)).order_by(Livro.titulo)
+        .execution_options(incluir_excluidos=True)
+    ).all()
+    return f'Sem exemplares disponíveis: {", ".join(titulos)}'
+
+def registrar_devolucao(emprestimo_id, quando=None):
+    """
+    Marca o empréstimo como devolvido, devolve seus livros à estante e o
+    retira do retrato de atrasos.
+
+    O UPDATE só afeta empréstimos ainda ativos, então duas devoluções
+    simultâneas do mesmo empréstimo não liberam os exemplares duas vezes.
+    Não faz commit: o chamador decide a transação.
+
+    Returns:
+        Lista com os ids dos livros devolvidos, ou None se o empréstimo não
+        existir ou já tiver sido devolvido
+    """
+    emprestimos = Emprestimo.__table__
+    quando = quando or datetime.utcnow()
+    devolvido = db.session.execute(
+        emprestimos.update()
+        .where(emprestimos.c.id == emprestimo_id, emprestimos.c.devolvido_em.is_(None))
+        .values(devolvido_em=quando)
+        .returning(emprestimos.c.data_devolucao)
+    ).first()
+    if devolvido is None:
+        return None
+    # UPDATE direto: a auditoria não passa pelo after_flush do ORM
+    registrar_alteracao('emprestimos', emprestimo_id, 'alterar', {'devolvido_em': (None, quando)})
+
+    livro_ids = db.session.scalars(
+        db.select(emprestimo_livro.c.livro_id).where(emprestimo_livro.c.emprestimo_id == emprestimo_id)
+    ).all()
+    liberar_exemplares(livro_ids)
+    tabelas = {'emprestimos'}
+    atrasos = Atraso.__table__
+    if db.session.execute(atrasos.delete().where(atrasos.c.emprestimo_id == emprestimo_id)).rowcount:
+        tabelas.add('atrasos')
+    registrar_versoes(tabelas)
+
+    registrar_variacao(TOTAIS, 'emprestimos_ativos', -1)
+    if devolvido.data_devolucao < date.today():
+        registrar_variacao(TOTAIS, 'emprestimos_atrasados', -1)
+    return livro_ids
@@ -0,0 +1,80 @@
+from flask import g, has_request_context, request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+import threading
+
+# Contadores abertos por contar_consultas() na thread atual
+_local = threading.local()
+
+class OrcamentoConsultasExcedido(RuntimeError):
+    """A requisição executou mais consultas SQL do que o orçamento permitido"""
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def registrar_consulta(conn, cursor, statement, parameters, context, executemany):
+    """Conta cada instrução SQL enviada ao banco na requisição atual"""
+    if has_request_context():
+        g.consultas_sql = g.get('consultas_sql', 0) + 1
+    for contador in getattr(_local, 'contadores', ()):
+        contador.append(statement)
+
+def orcamento_consultas(limite):
+    """
+    Define o número máximo de consultas SQL de uma view.
+
+    Só tem efeito quando a verificação está ligada (ORCAMENTO_CONSULTAS > 0);
+    nesse caso substitui o limite global para esta rota. Use None para rotas
+    que leem os dados em lotes, em que o número de consultas cresce com o volume.
+
+    Exemplo:
+        @emprestimos_bp.route('/emprestimos')
+        @orcamento_consultas(3)
+        def emprestimos(): ...
+    """
+    def decorador(view):
+        view.orcamento_consultas = limite
+        return view
+    return decorador
+
+def configurar_orcamento_consultas(app):
+    """
+    Registra a verificação do orçamento de consultas por requisição.
+
+    Com ORCAMENTO_CONSULTAS > 0 (desenvolvimento e testes), uma requisição que
+    ultrapassar o limite falha com OrcamentoConsultasExcedido, o que torna
+    visíveis regressões N+1 antes de chegarem à produção.
+    """
+    @app.after_request
+    def verificar_orcamento_consultas(response):
+        limite_global = current_app.config.get('ORCAMENTO_CONSULTAS')
+        if not limite_global:
+            return response
+
+        view = current_app.view_functions.get(request.endpoint)
+        limite = getattr(view, 'orcamento_consultas', limite_global)
+        total = g.get('consultas_sql', 0)
+        if limite is not None and total > limite:
+            # Zera o contador para que a resposta de erro não dispare a verificação de novo
+            g.consultas_sql = 0
+            raise OrcamentoConsultasExcedido(
+                f'{request.endpoint} executou {total} consultas SQL (limite: {limite})'
+            )
+        return response
+
+@contextmanager
+def contar_consultas():
+    """
+    Conta as consultas SQL executadas dentro do bloco.
+
+    Exemplo:
+        with contar_consultas() as consultas:
+            client.get('/emprestimos')
+        assert len(consultas) <= 3
+    """
+    consultas = []
+    contadores = _local.__dict__.setdefault('contadores', [])
+    contadores.append(consultas)
+    try:
+        yield consultas
+    finally:
+        contadores.pop()
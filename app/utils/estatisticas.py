@@ -0,0 +1,226 @@
+from flask import current_app, has_app_context
+from collections import Counter, namedtuple
+from datetime import date
+from sqlalchemy import event, inspect
+from app import db
+from app.models.models import Livro, Usuario, Emprestimo, EXCLUSAO_LOGICA, exclusao_pendente
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # O backend Redis é opcional (pip install redis)
+    redis = None
+
+# Chaves (hashes) onde as estatísticas ficam guardadas no backend
+TOTAIS = 'estatisticas:totais'
+CATEGORIAS = 'estatisticas:categorias'
+AUTORES = 'estatisticas:autores'
+META = 'estatisticas:meta'
+CHAVES = (TOTAIS, CATEGORIAS, AUTORES, META)
+
+# Estatísticas exibidas na página inicial
+Estatisticas = namedtuple('Estatisticas', ['livros', 'usuarios', 'emprestimos_ativos', 'emprestimos_atrasados',
+                                           'categorias', 'autores'])
+
+class BackendMemoria:
+    """
+    Guarda as estatísticas em dicionários do próprio processo.
+
+    Tem a mesma interface do BackendRedis (hashes com campos inteiros), então
+    serve de substituto local quando não há um Redis disponível. Cada processo
+    tem sua cópia: gravações feitas por outros processos só aparecem após o
+    próximo recálculo completo.
+    """
+
+    def __init__(self):
+        self._hashes = {}
+        self._trava = threading.Lock()
+
+    def ler(self, chaves):
+        """Retorna {chave: {campo: valor}} (dicionário vazio para chaves inexistentes)"""
+        with self._trava:
+            return {chave: dict(self._hashes.get(chave, {})) for chave in chaves}
+
+    def substituir(self, valores):
+        """Troca de uma vez o conteúdo das chaves informadas"""
+        with self._trava:
+            for chave, campos in valores.items():
+                self._hashes[chave] = dict(campos)
+
+    def incrementar(self, variacoes):
+        """Soma cada delta de {(chave, campo): delta} aos hashes já existentes"""
+        with self._trava:
+            for (chave, campo), delta in variacoes.items():
+                campos = self._hashes.get(chave)
+                if campos is not None:
+                    campos[campo] = int(campos.get(campo, 0)) + delta
+
+class BackendRedis:
+    """Guarda as estatísticas em hashes do Redis, compartilhadas por todos os processos"""
+
+    def __init__(self, url):
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def ler(self, chaves):
+        pipeline = self._redis.pipeline(transaction=False)
+        for chave in chaves:
+            pipeline.hgetall(chave)
+        return dict(zip(chaves, pipeline.execute()))
+
+    def substituir(self, valores):
+        pipeline = self._redis.pipeline(transaction=True)
+        for chave, campos in valores.items():
+            pipeline.delete(chave)
+            if campos:
+                pipeline.hset(chave, mapping=campos)
+        pipeline.execute()
+
+    def incrementar(self, variacoes):
+        # Só ajusta estatísticas já calculadas (META existe); senão o próximo acesso recalcula
+        if not self._redis.exists(META):
+            return
+        pipeline = self._redis.pipeline(transaction=True)
+        for (chave, campo), delta in variacoes.items():
+            pipeline.hincrby(chave, campo, delta)
+        pipeline.execute()
+
+def configurar_estatisticas(app):
+    """Cria o backend das estatísticas escolhido em ESTATISTICAS_BACKEND ('memoria' ou 'redis')"""
+    if app.config['ESTATISTICAS_BACKEND'] == 'redis':
+        if redis is None:
+            raise RuntimeError('ESTATISTICAS_BACKEND=redis exige o pacote redis (pip install redis).')
+        backend = BackendRedis(app.config['ESTATISTICAS_REDIS_URL'])
+    else:
+        backend = BackendMemoria()
+    app.extensions['estatisticas'] = backend
+
+def backend_estatisticas():
+    return current_app.extensions['estatisticas']
+
+def recalcular_estatisticas():
+    """
+    Recalcula todas as estatísticas no banco e as grava no backend.
+
+    São três consultas: os totais em um único SELECT de subconsultas (as
+    de empréstimos usam o índice parcial dos ativos) e um GROUP BY para
+    categorias e outro para autores, atendidos pelos índices (coluna, id).
+    """
+    hoje = date.today()
+    ativos = db.select(db.func.count()).select_from(Emprestimo).where(Emprestimo.devolvido_em.is_(None))
+    totais = db.session.execute(db.select(
+        db.select(db.func.count()).select_from(Livro).scalar_subquery().label('livros'),
+        db.select(db.func.count()).select_from(Usuario).scalar_subquery().label('usuarios'),
+        ativos.scalar_subquery().label('emprestimos_ativos'),
+        ativos.where(Emprestimo.data_devolucao < hoje).scalar_subquery().label('emprestimos_atrasados'),
+    )).one()
+    categorias = db.session.execute(
+        db.select(Livro.categoria, db.func.count()).group_by(Livro.categoria)).all()
+    autores = db.session.execute(
+        db.select(Livro.autor, db.func.count()).group_by(Livro.autor)).all()
+
+    valores = {
+        TOTAIS: totais._asdict(),
+        CATEGORIAS: dict(categorias),
+        AUTORES: dict(autores),
+        META: {'calculado_em': time.time(), 'dia': hoje.isoformat()},
+    }
+    backend_estatisticas().substituir(valores)
+    return valores
+
+def mais_frequentes(contagens, quantidade):
+    """Os itens de maior contagem, como lista de (nome, total)"""
+    itens = ((nome, int(total)) for nome, total in contagens.items())
+    return sorted((item for item in itens if item[1] > 0), key=lambda item: (-item[1], item[0]))[:quantidade]
+
+def obter_estatisticas():
+    """
+    Retorna as estatísticas da página inicial a partir do cache.
+
+    Recalcula tudo quando ainda não há nada no backend, quando o último
+    cálculo tem mais de ESTATISTICAS_RECALCULO_SEGUNDOS (corrigindo
+    eventuais desvios dos ajustes incrementais) ou quando o dia mudou, já
+    que empréstimos passam a estar atrasados com a simples passagem do tempo.
+    """
+    valores = backend_estatisticas().ler(CHAVES)
+    meta = valores[META]
+    expirado = not meta or (
+        float(meta['calculado_em']) < time.time() - current_app.config['ESTATISTICAS_RECALCULO_SEGUNDOS']
+        or meta['dia'] != date.today().isoformat())
+    if expirado:
+        valores = recalcular_estatisticas()
+
+    totais = {campo: int(valor) for campo, valor in valores[TOTAIS].items()}
+    quantidade = current_app.config['ESTATISTICAS_TOP']
+    return Estatisticas(totais.get('livros', 0), totais.get('usuarios', 0),
+                        totais.get('emprestimos_ativos', 0), totais.get('emprestimos_atrasados', 0),
+                        mais_frequentes(valores[CATEGORIAS], quantidade),
+                        mais_frequentes(valores[AUTORES], quantidade))
+
+def registrar_variacao(chave, campo, delta, session=None):
+    """
+    Acumula um ajuste das estatísticas, aplicado no backend só após o commit.
+
+    Gravações feitas pelo ORM são registradas automaticamente; use esta
+    função em gravações com SQL direto (ex.: empréstimos em lote, devoluções).
+    """
+    session = session or db.session()
+    variacoes = session.info.setdefault('estatisticas', Counter())
+    variacoes[(chave, campo)] += delta
+
+def variacao_emprestimo(emprestimo, sinal, hoje, session):
+    """Ajusta ativos/atrasados pela entrada (sinal=1) ou saída (sinal=-1) de um empréstimo"""
+    if emprestimo.devolvido_em is not None:
+        return
+    registrar_variacao(TOTAIS, 'emprestimos_ativos', sinal, session)
+    if emprestimo.data_devolucao is not None and emprestimo.data_devolucao < hoje:
+        registrar_variacao(TOTAIS, 'emprestimos_atrasados', sinal, session)
+
+@event.listens_for(db.session, 'after_flush')
+def registrar_alteracoes(session, contexto):
+    """Converte os registros inseridos, alterados ou removidos no flush em ajustes das estatísticas"""
+    hoje = date.today()
+    # A exclusão lógica (excluido_em preenchido) conta como remoção
+    excluidos = {objeto for objeto in session.dirty
+                 if isinstance(objeto, EXCLUSAO_LOGICA) and exclusao_pendente(objeto)}
+    for sinal, objetos in ((1, session.new), (-1, (*session.deleted, *excluidos))):
+        for objeto in objetos:
+            if isinstance(objeto, Livro):
+                registrar_variacao(TOTAIS, 'livros', sinal, session)
+                registrar_variacao(CATEGORIAS, objeto.categoria, sinal, session)
+                registrar_variacao(AUTORES, objeto.autor, sinal, session)
+            elif isinstance(objeto, Usuario):
+                registrar_variacao(TOTAIS, 'usuarios', sinal, session)
+            elif isinstance(objeto, Emprestimo):
+                variacao_emprestimo(objeto, sinal, hoje, session)
+
+    for objeto in session.dirty:
+        if objeto in excluidos:
+            continue
+        if isinstance(objeto, Livro):
+            estado = inspect(objeto)
+            for chave, atributo in ((CATEGORIAS, 'categoria'), (AUTORES, 'autor')):
+                historico = estado.attrs[atributo].history
+                if historico.added and historico.deleted:
+                    registrar_variacao(chave, historico.deleted[0], -1, session)
+                    registrar_variacao(chave, historico.added[0], 1, session)
+        elif isinstance(objeto, Emprestimo) and objeto.devolvido_em is None:
+            historico = inspect(objeto).attrs.data_devolucao.history
+            if historico.added and historico.deleted:
+                atrasado_antes = historico.deleted[0] < hoje
+                atrasado_agora = historico.added[0] < hoje
+                if atrasado_antes != atrasado_agora:
+                    registrar_variacao(TOTAIS, 'emprestimos_atrasados', 1 if atrasado_agora else -1, session)
+
+@event.listens_for(db.session, 'after_commit')
+def aplicar_variacoes(session):
+    """Aplica no backend os ajustes acumulados na transação confirmada"""
+    variacoes = session.info.pop('estatisticas', None)
+    variacoes = {chave: delta for chave, delta in (variacoes or {}).items() if delta}
+    if variacoes and has_app_context() and 'estatisticas' in current_app.extensions:
+        backend_estatisticas().incrementar(variacoes)
+
+@event.listens_for(db.session, 'after_rollback')
+def descartar_variacoes(session):
+    """Descarta os ajustes de uma transação desfeita"""
+    session.info.pop('estatisticas', None)
@@ -0,0 +1,114 @@
+from flask import Response, current_app, stream_with_context
+from datetime import date, datetime
+import csv
+import io
+import json
+import tempfile
+
+try:
+    import openpyxl
+except ImportError:  # A exportação em XLSX é opcional (pip install openpyxl)
+    openpyxl = None
+
+# Formatos aceitos e seus tipos de conteúdo
+FORMATOS_EXPORTACAO = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Tamanho aproximado de cada pedaço enviado ao cliente
+TAMANHO_BLOCO = 64 * 1024
+
+def formato_disponivel(formato):
+    """Indica se o formato é conhecido e se suas dependências estão instaladas"""
+    if formato == 'xlsx':
+        return openpyxl is not None
+    return formato in FORMATOS_EXPORTACAO
+
+def linhas_exportacao(query, colunas, lote):
+    """
+    Percorre a consulta em lotes e gera uma lista de valores por registro.
+
+    yield_per() faz o banco entregar os registros aos poucos (cursor no
+    servidor, no PostgreSQL), então só um lote fica em memória por vez.
+    """
+    for item in query.yield_per(lote):
+        yield [valor(item) for _, valor in colunas]
+
+def gerar_csv(linhas, cabecalho):
+    """Gera o CSV em pedaços de até TAMANHO_BLOCO caracteres"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # BOM para que o Excel reconheça o arquivo como UTF-8 (acentos)
+    buffer.write('\ufeff')
+    escritor.writerow(cabecalho)
+    for linha in linhas:
+        escritor.writerow(linha)
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def gerar_ndjson(linhas, cabecalho):
+    """Gera um objeto JSON por linha (NDJSON), em pedaços de até TAMANHO_BLOCO caracteres"""
+    def serializar(valor):
+        if isinstance(valor, (date, datetime)):
+            return valor.isoformat()
+        raise TypeError(f'Tipo não serializável: {type(valor).__name__}')
+
+    bloco = []
+    tamanho = 0
+    for linha in linhas:
+        texto = json.dumps(dict(zip(cabecalho, linha)), ensure_ascii=False, default=serializar) + '\n'
+        bloco.append(texto)
+        tamanho += len(texto)
+        if tamanho >= TAMANHO_BLOCO:
+            yield ''.join(bloco)
+            bloco = []
+            tamanho = 0
+    yield ''.join(bloco)
+
+def gerar_xlsx(linhas, cabecalho):
+    """
+    Gera a planilha XLSX.
+
+    O formato é um arquivo zip que só fica completo no final, então a
+    planilha é montada em modo write_only (linhas gravadas direto em disco)
+    em um arquivo temporário, que depois é enviado em pedaços.
+    """
+    planilhas = openpyxl.Workbook(write_only=True)
+    planilha = planilhas.create_sheet()
+    planilha.append(cabecalho)
+    for linha in linhas:
+        planilha.append(linha)
+
+    with tempfile.TemporaryFile() as arquivo:
+        planilhas.save(arquivo)
+        arquivo.seek(0)
+        while bloco := arquivo.read(TAMANHO_BLOCO):
+            yield bloco
+
+GERADORES_EXPORTACAO = {'csv': gerar_csv, 'ndjson': gerar_ndjson, 'xlsx': gerar_xlsx}
+
+def resposta_exportacao(query, colunas, formato, nome_arquivo):
+    """
+    Monta uma resposta que envia a exportação enquanto ela é gerada.
+
+    Args:
+        query: Consulta dos registros a exportar
+        colunas: Lista de (nome da coluna, função que extrai o valor do registro)
+        formato: 'csv', 'ndjson' ou 'xlsx' (ver formato_disponivel())
+        nome_arquivo: Nome do arquivo, sem extensão
+
+    Returns:
+        Response com o conteúdo gerado sob demanda (memória constante)
+    """
+    cabecalho = [nome for nome, _ in colunas]
+    linhas = linhas_exportacao(query, colunas, current_app.config['EXPORTACAO_LOTE'])
+    gerador = GERADORES_EXPORTACAO[formato](linhas, cabecalho)
+
+    # stream_with_context mantém a sessão do banco aberta enquanto o corpo é enviado
+    return Response(stream_with_context(gerador), content_type=FORMATOS_EXPORTACAO[formato],
+                    headers={'Content-Disposition': f'attachment; filename={nome_arquivo}.{formato}'})
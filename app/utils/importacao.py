@@ -0,0 +1,214 @@
+from flask import current_app
+from collections import namedtuple
+from app import db
+from app.models.models import Livro, Usuario
+from app.services.validacao import validar_livro, validar_usuario
+from app.utils.busca import indexar_livros
+from app.utils.estatisticas import recalcular_estatisticas
+from app.utils.versoes import registrar_versoes
+from app.utils.auditoria import registrar_alteracao, buffer_auditoria
+from sqlalchemy import Column, MetaData, Table
+from sqlalchemy.dialects import postgresql, sqlite
+import csv
+import io
+import json
+import time
+
+# Como gravar cada tipo de registro importado:
+#   chave: coluna única que identifica um registro já cadastrado (upsert)
+#   atualizadas: colunas sobrescritas quando o registro já existe
+#   validar: função que devolve (erro, None) ou (None, registro limpo)
+Entidade = namedtuple('Entidade', ['tabela', 'chave', 'atualizadas', 'validar'])
+
+# Os exemplares só são gravados em livros novos: nos já cadastrados, o
+# acervo é ajustado pelo formulário, que respeita os exemplares emprestados
+ENTIDADES_IMPORTACAO = {
+    'livros': Entidade(Livro.__table__, 'isbn_normalizado',
+                       ('titulo', 'autor', 'isbn', 'ano_publicacao', 'categoria'), validar_livro),
+    'usuarios': Entidade(Usuario.__table__, 'email', ('nome',), validar_usuario),
+}
+
+FORMATOS_IMPORTACAO = ('csv', 'ndjson')
+
+# Resultado de importar()
+ResultadoImportacao = namedtuple('ResultadoImportacao',
+                                 ['lidos', 'inseridos', 'atualizados', 'rejeitados', 'segundos'])
+
+def ler_registros(arquivo, formato):
+    """
+    Lê o arquivo aos poucos, gerando (número da linha, registro).
+
+    O registro é None quando a linha do NDJSON não é um objeto JSON.
+    O CSV precisa de cabeçalho com os nomes dos campos. Abra o arquivo com
+    encoding='utf-8-sig' para descartar o BOM que o Excel (e a própria
+    exportação) coloca no início.
+    """
+    if formato == 'csv':
+        leitor = csv.DictReader(arquivo)
+        for registro in leitor:
+            yield leitor.line_num, registro
+        return
+
+    for numero, linha in enumerate(arquivo, 1):
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            registro = json.loads(linha)
+        except ValueError:
+            registro = None
+        yield numero, registro if isinstance(registro, dict) else None
+
+def gravar_lote_copy(conexao, entidade, registros, colunas):
+    """
+    PostgreSQL: COPY do lote para uma tabela temporária e um único
+    INSERT ... SELECT ... ON CONFLICT DO UPDATE a partir dela.
+
+    A tabela temporária é descartada no commit do lote (ON COMMIT DROP).
+    """
+    temporaria = Table(f'importacao_{entidade.tabela.name}', MetaData(),
+                       *[Column(coluna, entidade.tabela.c[coluna].type) for coluna in colunas],
+                       prefixes=['TEMPORARY'], postgresql_on_commit='DROP')
+    temporaria.create(conexao)
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for registro in registros:
+        escritor.writerow([registro[coluna] for coluna in colunas])
+    buffer.seek(0)
+    cursor = conexao.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {temporaria.name} ({", ".join(colunas)}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+    insercao = postgresql.insert(entidade.tabela).from_select(colunas, db.select(temporaria))
+    conexao.execute(insercao.on_conflict_do_update(
+        index_elements=[entidade.chave],
+        # A chave é única só entre os registros não excluídos (índice parcial)
+        index_where=entidade.tabela.c.excluido_em.is_(None),
+        set_={coluna: insercao.excluded[coluna] for coluna in entidade.atualizadas},
+    ))
+
+def gravar_lote_executemany(conexao, entidade, registros):
+    """SQLite: INSERT ... ON CONFLICT DO UPDATE enviado com executemany"""
+    insercao = sqlite.insert(entidade.tabela)
+    conexao.execute(insercao.on_conflict_do_update(
+        index_elements=[entidade.chave],
+        # A chave é única só entre os registros não excluídos (índice parcial)
+        index_where=entidade.tabela.c.excluido_em.is_(None),
+        set_={coluna: insercao.excluded[coluna] for coluna in entidade.atualizadas},
+    ), registros)
+
+def auditar_lote(conexao, entidade, registros, anteriores, chaves):
+    """Registros de auditoria do lote: inserção dos novos e campos alterados dos já cadastrados"""
+    if buffer_auditoria() is None:
+        return
+    ids = dict(conexao.execute(db.select(entidade.tabela.c[entidade.chave], entidade.tabela.c.id).where(chaves)).all())
+    for registro in registros:
+        anterior = anteriores.get(registro[entidade.chave])
+        if anterior is None:
+            registrar_alteracao(entidade.tabela.name, ids[registro[entidade.chave]], 'inserir',
+                                {campo: (None, valor) for campo, valor in registro.items()})
+            continue
+        alteracoes = {coluna: (anterior[coluna], registro[coluna]) for coluna in entidade.atualizadas
+                      if anterior[coluna] != registro[coluna]}
+        if alteracoes:
+            registrar_alteracao(entidade.tabela.name, anterior['id'], 'alterar', alteracoes)
+
+def gravar_lote(nome, registros):
+    """
+    Grava um lote já validado e sem chaves repetidas, em uma transação.
+
+    Returns:
+        Quantidade de registros que já existiam (atualizados)
+    """
+    entidade = ENTIDADES_IMPORTACAO[nome]
+    tabela = entidade.tabela
+    chave = tabela.c[entidade.chave]
+    if nome == 'livros':
+        for registro in registros:
+            registro['disponiveis'] = registro['exemplares']
+
+    conexao = db.session.connection()
+    # Consultas com a tabela do Core não passam por ocultar_excluidos: o filtro vai explícito
+    chaves = chave.in_([registro[entidade.chave] for registro in registros]) & tabela.c.excluido_em.is_(None)
+    # Valores atuais dos já cadastrados, para a auditoria das atualizações
+    anteriores = {linha[entidade.chave]: linha for linha in conexao.execute(
+        db.select(tabela.c.id, chave, *(tabela.c[coluna] for coluna in entidade.atualizadas)).where(chaves)
+    ).mappings()}
+    existentes = len(anteriores)
+
+    if conexao.dialect.name == 'postgresql':
+        gravar_lote_copy(conexao, entidade, registros, list(registros[0]))
+    else:
+        gravar_lote_executemany(conexao, entidade, registros)
+
+    # Gravação com SQL puro: índice de busca, versões dos dados e auditoria
+    # não passam pelos eventos do ORM
+    if nome == 'livros':
+        livros = conexao.execute(
+            db.select(tabela.c.id, tabela.c.titulo, tabela.c.autor, tabela.c.categoria).where(chaves)
+        ).mappings().all()
+        indexar_livros(conexao, livros)
+    registrar_versoes({tabela.name})
+    auditar_lote(conexao, entidade, registros, anteriores, chaves)
+    db.session.commit()
+    return existentes
+
+def importar(nome, arquivo, formato, lote=None, ao_rejeitar=None, ao_progresso=None):
+    """
+    Importa livros ou usuários de um arquivo CSV ou NDJSON.
+
+    Cada registro passa pelas mesmas regras dos formulários (ver
+    app/services/validacao.py); os inválidos são ignorados e informados a
+    ao_rejeitar. Os válidos são gravados por lote: quem já existe (mesmo
+    ISBN, com ou sem hífens, ou mesmo email) é atualizado, os demais são
+    inseridos. Dentro de um lote, a última ocorrência de uma chave vale.
+
+    Args:
+        nome: 'livros' ou 'usuarios'
+        arquivo: Arquivo de texto aberto (lido em sequência, uma vez)
+        formato: 'csv' ou 'ndjson'
+        lote: Registros por transação (padrão: IMPORTACAO_LOTE)
+        ao_rejeitar: Função chamada com (número da linha, mensagem de erro)
+        ao_progresso: Função chamada com (lidos, gravados, segundos) após cada lote
+
+    Returns:
+        ResultadoImportacao
+    """
+    entidade = ENTIDADES_IMPORTACAO[nome]
+    lote = lote or current_app.config['IMPORTACAO_LOTE']
+    inicio = time.perf_counter()
+    lidos = gravados = atualizados = rejeitados = 0
+    pendentes = {}
+
+    def gravar():
+        nonlocal gravados, atualizados
+        atualizados += gravar_lote(nome, list(pendentes.values()))
+        gravados += len(pendentes)
+        pendentes.clear()
+        if ao_progresso:
+            ao_progresso(lidos, gravados, time.perf_counter() - inicio)
+
+    for numero, dados in ler_registros(arquivo, formato):
+        lidos += 1
+        if dados is None:
+            erro, registro = 'A linha não é um objeto JSON.', None
+        else:
+            erro, registro = entidade.validar(dados)
+        if erro:
+            rejeitados += 1
+            if ao_rejeitar:
+                ao_rejeitar(numero, erro)
+            continue
+        pendentes[registro[entidade.chave]] = registro
+        if len(pendentes) >= lote:
+            gravar()
+    if pendentes:
+        gravar()
+
+    if gravados:
+        recalcular_estatisticas()
+    return ResultadoImportacao(lidos, gravados - atualizados, atualizados, rejeitados,
+                               time.perf_counter() - inicio)
@@ -0,0 +1,259 @@
+from flask import current_app, g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import Counter
+from datetime import datetime
+from app.utils.capa_utils import gravar_arquivo_atomico
+import bisect
+import os
+import sys
+import threading
+import time
+
+# Limites (em segundos) das faixas dos histogramas
+FAIXAS_REQUISICAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAIXAS_PDF = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Consultas guardadas por requisição para o log de requisições lentas
+CONSULTAS_GUARDADAS = 200
+CONSULTAS_NO_LOG = 5
+
+class Histograma:
+    """Contagens por faixa, soma e total de observações, no formato dos histogramas do Prometheus"""
+
+    def __init__(self, faixas):
+        self.faixas = faixas
+        self.contagens = [0] * (len(faixas) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect.bisect_left(self.faixas, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def linhas(self, nome, rotulos):
+        acumulado = 0
+        for limite, contagem in zip((*self.faixas, '+Inf'), self.contagens):
+            acumulado += contagem
+            yield f'{nome}_bucket{formatar_rotulos({**rotulos, "le": limite})} {acumulado}'
+        yield f'{nome}_sum{formatar_rotulos(rotulos)} {self.soma}'
+        yield f'{nome}_count{formatar_rotulos(rotulos)} {self.total}'
+
+def formatar_rotulos(rotulos):
+    """{'rota': 'livros.livros'} -> '{rota="livros.livros"}'"""
+    if not rotulos:
+        return ''
+    pares = (f'{chave}="{escapar_rotulo(valor)}"' for chave, valor in rotulos.items())
+    return '{' + ','.join(pares) + '}'
+
+def escapar_rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metricas:
+    """
+    Métricas acumuladas pelo processo desde a inicialização.
+
+    Cada worker tem as suas: com vários processos, o Prometheus deve coletar
+    cada um separadamente (ou somar as séries por instância).
+    """
+
+    # Contadores por rota: nome da métrica -> descrição
+    CONTADORES = {
+        'biblioteca_sql_consultas_total': 'Instruções SQL executadas',
+        'biblioteca_sql_segundos_total': 'Tempo gasto no banco de dados',
+        'biblioteca_render_segundos_total': 'Tempo gasto renderizando templates',
+        'biblioteca_resposta_bytes_total': 'Bytes enviados no corpo das respostas (exceto respostas em streaming)',
+    }
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.requisicoes = Counter()
+        self.contadores = Counter()
+        self.latencia = {}
+        self.pdf = {}
+
+    def registrar_requisicao(self, rota, status, segundos, consultas, segundos_sql, segundos_render, tamanho):
+        with self._trava:
+            self.requisicoes[(rota, status)] += 1
+            self.latencia.setdefault(rota, Histograma(FAIXAS_REQUISICAO)).observar(segundos)
+            self.contadores[('biblioteca_sql_consultas_total', rota)] += consultas
+            self.contadores[('biblioteca_sql_segundos_total', rota)] += segundos_sql
+            self.contadores[('biblioteca_render_segundos_total', rota)] += segundos_render
+            if tamanho is not None:
+                self.contadores[('biblioteca_resposta_bytes_total', rota)] += tamanho
+
+    def registrar_pdf(self, relatorio, segundos):
+        """Tempo de conversão de um relatório para PDF (no pool de processos)"""
+        with self._trava:
+            self.pdf.setdefault(relatorio, Histograma(FAIXAS_PDF)).observar(segundos)
+
+    def exportar(self, extras=()):
+        """
+        Texto no formato de exposição do Prometheus.
+
+        Args:
+            extras: Linhas adicionais (ex.: métricas do cache), já formatadas
+        """
+        with self._trava:
+            linhas = ['# HELP biblioteca_requisicoes_total Requisições atendidas',
+                      '# TYPE biblioteca_requisicoes_total counter']
+            for (rota, status), total in sorted(self.requisicoes.items()):
+                linhas.append(f'biblioteca_requisicoes_total{formatar_rotulos({"rota": rota, "status": status})} {total}')
+
+            linhas += ['# HELP biblioteca_requisicao_segundos Duração das requisições',
+                       '# TYPE biblioteca_requisicao_segundos histogram']
+            for rota, histograma in sorted(self.latencia.items()):
+                linhas.extend(histograma.linhas('biblioteca_requisicao_segundos', {'rota': rota}))
+
+            for nome, descricao in self.CONTADORES.items():
+                linhas += [f'# HELP {nome} {descricao}', f'# TYPE {nome} counter']
+                for (metrica, rota), valor in sorted(self.contadores.items()):
+                    if metrica == nome:
+                        linhas.append(f'{nome}{formatar_rotulos({"rota": rota})} {valor}')
+
+            linhas += ['# HELP biblioteca_pdf_segundos Duração da conversão dos relatórios para PDF',
+                       '# TYPE biblioteca_pdf_segundos histogram']
+            for relatorio, histograma in sorted(self.pdf.items()):
+                linhas.extend(histograma.linhas('biblioteca_pdf_segundos', {'relatorio': relatorio}))
+
+        linhas.extend(extras)
+        return '\n'.join(linhas) + '\n'
+
+class AmostradorPerfil:
+    """
+    Profiler por amostragem de uma única thread.
+
+    A cada intervalo, outra thread lê a pilha atual da thread observada
+    (sys._current_frames) e conta quantas vezes cada pilha apareceu. O
+    resultado sai no formato "folded" (uma pilha por linha, funções
+    separadas por ';' e a contagem no fim), aceito pelo flamegraph.pl,
+    speedscope e similares. Não altera o código observado.
+    """
+
+    def __init__(self, thread_id, intervalo):
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, name='perfil', daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append(f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})')
+                frame = frame.f_back
+            if pilha:
+                self.pilhas[';'.join(reversed(pilha))] += 1
+
+    def folded(self):
+        return ''.join(f'{pilha} {total}\n' for pilha, total in self.pilhas.most_common())
+
+def configurar_metricas(app):
+    """
+    Registra a instrumentação das requisições.
+
+    Para cada requisição mede o tempo total, as instruções SQL e o tempo no
+    banco (eventos do Engine), o tempo de renderização dos templates (sinais
+    before_render_template/template_rendered) e o tamanho da resposta, e
+    acumula por rota em app.extensions['metricas'] (exposto em /metrics).
+    Respostas em streaming (exportações) contam só até o início do envio.
+
+    Requisições acima de METRICAS_REQUISICAO_LENTA_SEGUNDOS vão para o log
+    com as consultas mais demoradas. Com PERFIL_ATIVO, as requisições com o
+    cabeçalho X-Perfil: 1 ou de uma rota em PERFIL_ROTAS são amostradas e
+    as pilhas gravadas em PERFIL_FOLDER.
+    """
+    metricas = app.extensions['metricas'] = Metricas()
+
+    @app.before_request
+    def iniciar_medicao():
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_sql = []
+        g.metricas_consultas = 0
+        g.metricas_tempo_sql = 0.0
+        g.metricas_tempo_render = 0.0
+        g.metricas_render_inicio = []
+        if current_app.config['PERFIL_ATIVO'] and (request.headers.get('X-Perfil') == '1'
+                                                   or request.endpoint in current_app.config['PERFIL_ROTAS']):
+            g.perfil = AmostradorPerfil(threading.get_ident(), current_app.config['PERFIL_INTERVALO']).iniciar()
+
+    @app.after_request
+    def registrar_medicao(response):
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is None:
+            return response
+        segundos = time.perf_counter() - inicio
+        rota = request.endpoint or 'sem_rota'
+        tamanho = response.content_length
+        if tamanho is None and not response.is_streamed:
+            tamanho = response.calculate_content_length()
+        metricas.registrar_requisicao(rota, response.status_code, segundos, g.metricas_consultas,
+                                      g.metricas_tempo_sql, g.metricas_tempo_render, tamanho)
+
+        limite = current_app.config['METRICAS_REQUISICAO_LENTA_SEGUNDOS']
+        if limite and segundos >= limite:
+            registrar_requisicao_lenta(rota, segundos)
+
+        perfil = g.pop('perfil', None)
+        if perfil is not None:
+            perfil.parar()
+            response.headers['X-Perfil'] = gravar_perfil(perfil, rota)
+        return response
+
+    before_render_template.connect(iniciar_render, app)
+    template_rendered.connect(concluir_render, app)
+
+def iniciar_render(sender, template, context, **extra):
+    if 'metricas_render_inicio' in g:
+        g.metricas_render_inicio.append(time.perf_counter())
+
+def concluir_render(sender, template, context, **extra):
+    if g.get('metricas_render_inicio'):
+        g.metricas_tempo_render += time.perf_counter() - g.metricas_render_inicio.pop()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def iniciar_consulta(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metricas_sql' in g:
+        conn.info.setdefault('metricas_inicio', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def concluir_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get('metricas_inicio')
+    if not inicios or not has_request_context() or 'metricas_sql' not in g:
+        return
+    segundos = time.perf_counter() - inicios.pop()
+    g.metricas_consultas += 1
+    g.metricas_tempo_sql += segundos
+    if len(g.metricas_sql) < CONSULTAS_GUARDADAS:
+        g.metricas_sql.append((segundos, statement))
+
+def registrar_requisicao_lenta(rota, segundos):
+    """Escreve no log uma requisição lenta, com as consultas SQL que mais demoraram"""
+    consultas = sorted(g.metricas_sql, key=lambda consulta: consulta[0], reverse=True)[:CONSULTAS_NO_LOG]
+    detalhes = ''.join(f'\n  {tempo * 1000:8.1f} ms  {" ".join(sql.split())[:500]}' for tempo, sql in consultas)
+    current_app.logger.warning(
+        'Requisição lenta: %s %s (%s) em %.3fs; %d consulta(s) SQL em %.3fs, templates em %.3fs%s',
+        request.method, request.full_path, rota, segundos, g.metricas_consultas, g.metricas_tempo_sql,
+        g.metricas_tempo_render, detalhes)
+
+def gravar_perfil(perfil, rota):
+    """Grava as pilhas amostradas em PERFIL_FOLDER e retorna o nome do arquivo"""
+    nome = f'{datetime.now().strftime("%Y%m%d-%H%M%S-%f")}-{rota}.folded'
+    gravar_arquivo_atomico(os.path.join(current_app.config['PERFIL_FOLDER'], nome), perfil.folded().encode('utf-8'))
+    current_app.logger.info('Perfil de %s gravado em %s (%d amostras)', rota, nome, sum(perfil.pilhas.values()))
+    return nome
+
+def metricas_processo():
+    return current_app.extensions['metricas']
@@ -0,0 +1,142 @@
+from flask import request, current_app
+from collections import namedtuple
+from datetime import date, datetime
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from app import db
+import binascii
+import json
+
+# Resultado de uma página: itens e cursores para a próxima/anterior (None se não houver)
+Pagina = namedtuple('Pagina', ['itens', 'proximo', 'anterior'])
+
+# Consulta de uma listagem já filtrada e os argumentos de paginar() lidos da URL
+Listagem = namedtuple('Listagem', ['query', 'coluna', 'id_coluna', 'descendente', 'cursor', 'por_pagina'])
+
+def codificar_cursor(direcao, valor, id):
+    """
+    Gera um cursor opaco a partir da chave de ordenação de um registro.
+
+    Args:
+        direcao: 'p' (próxima página) ou 'a' (página anterior)
+        valor: Valor da coluna de ordenação no registro de referência
+        id: Id do registro de referência (desempate)
+    """
+    if isinstance(valor, (date, datetime)):
+        valor = valor.isoformat()
+    dados = json.dumps([direcao, valor, id], separators=(',', ':')).encode('utf-8')
+    return urlsafe_b64encode(dados).decode('ascii').rstrip('=')
+
+def decodificar_cursor(cursor, coluna):
+    """Converte o cursor de volta em (direcao, valor, id); retorna None se for inválido"""
+    try:
+        dados = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direcao, valor, id = json.loads(dados)
+        tipo = coluna.type.python_type
+        if tipo is datetime:
+            valor = datetime.fromisoformat(valor)
+        elif tipo is date:
+            valor = date.fromisoformat(valor)
+        elif not isinstance(valor, tipo):
+            valor = tipo(valor)
+        if direcao not in ('p', 'a') or not isinstance(id, int):
+            return None
+        return direcao, valor, id
+    except (binascii.Error, ValueError, TypeError, NotImplementedError):
+        return None
+
+def parametros_paginacao(colunas_ordenacao, ordem_padrao):
+    """
+    Lê da query string os parâmetros de ordenação e paginação.
+
+    Apenas colunas presentes em colunas_ordenacao são aceitas; valores
+    desconhecidos voltam para o padrão, evitando ordenar por colunas sem índice.
+
+    Args:
+        colunas_ordenacao: Dicionário {nome na URL: coluna do modelo}
+        ordem_padrao: Nome da coluna usada quando 'ordem' não é informado
+
+    Returns:
+        Tupla (coluna, descendente, cursor, por_pagina)
+    """
+    ordem = request.args.get('ordem', ordem_padrao)
+    coluna = colunas_ordenacao.get(ordem, colunas_ordenacao[ordem_padrao])
+    descendente = request.args.get('direcao') == 'desc'
+    cursor = request.args.get('cursor') or None
+
+    por_pagina = request.args.get('por_pagina', type=int) or current_app.config['ITENS_POR_PAGINA']
+    por_pagina = max(1, min(por_pagina, current_app.config['ITENS_POR_PAGINA_MAX']))
+
+    return coluna, descendente, cursor, por_pagina
+
+def paginar(query, coluna, id_coluna, descendente=False, cursor=None, por_pagina=25):
+    """
+    Pagina uma consulta por keyset (cursor) em vez de OFFSET.
+
+    A ordenação é sempre (coluna, id), então cada página é buscada com um
+    filtro "(coluna, id) > (valor, id)" que usa o índice composto da coluna,
+    e o custo não cresce com a posição da página no conjunto.
+
+    Args:
+        query: Consulta já filtrada
+        coluna: Coluna de ordenação (não nula)
+        id_coluna: Coluna de desempate (chave primária)
+        descendente: Ordena de forma decrescente
+        cursor: Cursor recebido da página anterior (ou None para a primeira)
+        por_pagina: Quantidade de registros por página
+
+    Returns:
+        Pagina com os itens e os cursores de navegação
+    """
+    chave = decodificar_cursor(cursor, coluna) if cursor else None
+    voltando = chave is not None and chave[0] == 'a'
+
+    itens = consulta_pagina(query, coluna, id_coluna, descendente, chave, por_pagina).all()
+    tem_mais = len(itens) > por_pagina
+    itens = itens[:por_pagina]
+    if voltando:
+        itens.reverse()
+
+    def chave_de(item):
+        return getattr(item, coluna.key), getattr(item, id_coluna.key)
+
+    proximo = anterior = None
+    if itens:
+        if tem_mais or voltando:
+            proximo = codificar_cursor('p', *chave_de(itens[-1]))
+        if (tem_mais and voltando) or (chave is not None and not voltando):
+            anterior = codificar_cursor('a', *chave_de(itens[0]))
+
+    return Pagina(itens, proximo, anterior)
+
+def consulta_pagina(query, coluna, id_coluna, descendente, chave, por_pagina):
+    """
+    Acrescenta à consulta o filtro do cursor, a ordenação (coluna, id) e o
+    LIMIT de uma página, como paginar() a executa.
+
+    Args:
+        chave: Cursor decodificado (direcao, valor, id) ou None na primeira página
+    """
+    voltando = chave is not None and chave[0] == 'a'
+
+    # Ao voltar, percorre o índice no sentido inverso e depois desinverte
+    crescente = descendente == voltando
+    if chave is not None:
+        referencia = db.tuple_(coluna, id_coluna)
+        limite = db.tuple_(chave[1], chave[2])
+        query = query.filter(referencia > limite if crescente else referencia < limite)
+
+    if crescente:
+        query = query.order_by(coluna.asc(), id_coluna.asc())
+    else:
+        query = query.order_by(coluna.desc(), id_coluna.desc())
+    return query.limit(por_pagina + 1)
+
+def filtro_prefixo(coluna, texto):
+    """
+    Monta um filtro "começa com" sem diferenciar maiúsculas de minúsculas.
+
+    Compara lower(coluna) com LIKE 'texto%', que pode usar o índice
+    funcional em lower(coluna); os curingas digitados pelo usuário são escapados.
+    """
+    texto = texto.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return db.func.lower(coluna).like(texto + '%', escape='\\')
@@ -1,5 +1,6 @@
 from flask import render_template, make_response
-from xhtml2pdf import pisa
+from collections import namedtuple
+from html import escape
 from io import BytesIO
 
 def generate_pdf(template_name, context, filename='relatorio.pdf'):
@@ -15,6 +16,32 @@ def generate_pdf(template_name, context, filename='relatorio.pdf'):
         Response do Flask com o PDF ou None em caso de erro
     """
     html = render_template(template_name, **context)
+    pdf = html_para_pdf(html)
+    
+    # Verificar se houve erro
+    if pdf is None:
+        return None
+    
+    # Preparar resposta
+    response = make_response(pdf)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    
+    return response
+
+def html_para_pdf(html):
+    """
+    Converte um HTML já renderizado em PDF.
+    
+    Não depende do contexto da aplicação, o que permite chamá-la a partir
+    de um pool de processos (ver app/utils/relatorios.py).
+    
+    Returns:
+        Bytes do PDF ou None em caso de erro
+    """
+    # Importado aqui para que o xhtml2pdf e o reportlab só sejam carregados
+    # no processo que gera o PDF, e não na inicialização de cada worker
+    from xhtml2pdf import pisa
     
     # Criar buffer para armazenar o PDF
     pdf_buffer = BytesIO()
@@ -25,14 +52,169 @@ def generate_pdf(template_name, context, filename='relatorio.pdf'):
         dest=pdf_buffer
     )
     
-    # Verificar se houve erro
     if pisa_status.err:
         return None
-    
-    # Preparar resposta
-    pdf_buffer.seek(0)
-    response = make_response(pdf_buffer.read())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-    
-    return response
\ No newline at end of file
+    return pdf_buffer.getvalue()
+
+# Relatórios em tabela gerados direto com o reportlab (RELATORIOS_BACKEND =
+# 'tabela'), sem passar por HTML: as colunas, cores e fontes dos templates
+# *_pdf.html, sem o custo de interpretar o HTML e o CSS de cada linha. As
+# linhas saem mais baixas que no xhtml2pdf, então cabem mais por página.
+#
+# Uma coluna tem o título do cabeçalho, a largura em % da tabela, o
+# alinhamento ('LEFT' ou 'CENTER') e a função que extrai o texto da célula
+# de cada registro (executada no processo da aplicação, que lê o banco).
+ColunaPdf = namedtuple('ColunaPdf', ['titulo', 'largura', 'alinhamento', 'valor'])
+
+# Título do relatório, rótulo do total ('Total de Livros'), texto para
+# quando não há registros e as colunas (ColunaPdf)
+TabelaPdf = namedtuple('TabelaPdf', ['titulo', 'rotulo_total', 'vazio', 'colunas'])
+
+# Medidas dos templates convertidas para pontos (1px = 0,75pt), como o
+# xhtml2pdf faz: margem da página de 1cm, fonte de 8px nas células e de 9px
+# no cabeçalho da tabela
+MARGEM_PAGINA = 28.35
+FONTE = 'Helvetica'
+FONTE_NEGRITO = 'Helvetica-Bold'
+TAMANHO_CELULA = 6
+ENTRELINHA_CELULA = 9
+TAMANHO_CABECALHO = 6.75
+PADDING_HORIZONTAL = 3.75
+PADDING_CELULA = 4.5
+PADDING_CABECALHO = 6
+
+def layout_tabela(tabela):
+    """Definição da tabela sem as funções das colunas, para enviá-la ao pool de processos"""
+    return tabela._replace(colunas=[coluna._replace(valor=None) for coluna in tabela.colunas])
+
+def celulas_tabela(tabela, itens):
+    """Texto de cada célula dos registros, linha a linha"""
+    return [['' if valor is None else str(valor) for valor in (coluna.valor(item) for coluna in tabela.colunas)]
+            for item in itens]
+
+def quebrar_texto(texto, largura):
+    """
+    Quebra o texto de uma célula em linhas que cabem na largura (em pontos).
+
+    simpleSplit só quebra nos espaços; uma palavra mais larga que a coluna
+    (um e-mail, um ISBN sem hífens) é partida entre caracteres, como
+    word-wrap: break-word no HTML.
+    """
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    linhas = []
+    for linha in simpleSplit(texto, FONTE, TAMANHO_CELULA, largura):
+        if stringWidth(linha, FONTE, TAMANHO_CELULA) <= largura:
+            linhas.append(linha)
+            continue
+        atual, ocupado = '', 0
+        for caractere in linha:
+            largura_caractere = stringWidth(caractere, FONTE, TAMANHO_CELULA)
+            if atual and ocupado + largura_caractere > largura:
+                linhas.append(atual)
+                atual, ocupado = '', 0
+            atual += caractere
+            ocupado += largura_caractere
+        linhas.append(atual)
+    return linhas
+
+def tabela_para_pdf(layout, linhas, total, data_geracao, ano_atual, primeira_parte=True, ultima_parte=True):
+    """
+    Gera o PDF de uma parte de um relatório em tabela.
+
+    As células vão como texto simples, quebrado em linhas pela largura da
+    coluna (quebrar_texto), em vez de um Paragraph por célula: é o que torna
+    este caminho mais rápido que o HTML. Assim como html_para_pdf, não
+    depende do contexto da aplicação.
+
+    Args:
+        layout: TabelaPdf (ver layout_tabela)
+        linhas: Listas com o texto das células (ver celulas_tabela)
+        primeira_parte, ultima_parte: Incluem o cabeçalho e o rodapé do relatório
+
+    Returns:
+        Bytes do PDF
+    """
+    # Importado aqui pelo mesmo motivo que o xhtml2pdf em html_para_pdf
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    largura_util = A4[0] - 2 * MARGEM_PAGINA
+    larguras = [largura_util * coluna.largura / 100 for coluna in layout.colunas]
+    cinza_escuro = colors.HexColor('#333333')
+    cinza = colors.HexColor('#666666')
+
+    elementos = []
+    if primeira_parte:
+        titulo = ParagraphStyle('titulo', fontName=FONTE_NEGRITO, fontSize=10.4, leading=15.6,
+                                alignment=TA_CENTER, textColor=cinza_escuro)
+        subtitulo = ParagraphStyle('subtitulo', fontName=FONTE, fontSize=7.5, leading=11.25,
+                                   alignment=TA_CENTER, textColor=cinza)
+        cabecalho = Table([[Paragraph(escape(layout.titulo), titulo)],
+                           [Paragraph('Sistema de Biblioteca', subtitulo)],
+                           [Paragraph(escape(data_geracao), subtitulo)]],
+                          colWidths=[largura_util])
+        cabecalho.setStyle(TableStyle([
+            ('LINEBELOW', (0, -1), (-1, -1), 2.25, cinza_escuro),
+            ('BOTTOMPADDING', (0, -1), (-1, -1), 7.5),
+        ]))
+        informacao = Table([[f'{layout.rotulo_total}: {total}']], colWidths=[largura_util])
+        informacao.setStyle(TableStyle([
+            ('FONT', (0, 0), (-1, -1), FONTE_NEGRITO, 7.5),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f0f0f0')),
+            ('TOPPADDING', (0, 0), (-1, -1), 7.5),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 7.5),
+        ]))
+        elementos += [cabecalho, Spacer(0, 22.5), informacao, Spacer(0, 15)]
+
+    if total:
+        dados = [[coluna.titulo for coluna in layout.colunas]]
+        larguras_texto = [largura - 2 * PADDING_HORIZONTAL for largura in larguras]
+        for linha in linhas:
+            dados.append(['\n'.join(quebrar_texto(texto, largura))
+                          for texto, largura in zip(linha, larguras_texto)])
+        estilo = [
+            ('FONT', (0, 0), (-1, 0), FONTE_NEGRITO, TAMANHO_CABECALHO),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('BACKGROUND', (0, 0), (-1, 0), cinza_escuro),
+            ('TOPPADDING', (0, 0), (-1, 0), PADDING_CABECALHO),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), PADDING_CABECALHO),
+            ('FONT', (0, 1), (-1, -1), FONTE, TAMANHO_CELULA, ENTRELINHA_CELULA),
+            ('TOPPADDING', (0, 1), (-1, -1), PADDING_CELULA),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), PADDING_CELULA),
+            ('LINEBELOW', (0, 1), (-1, -1), 0.75, colors.HexColor('#dddddd')),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
+            ('LEFTPADDING', (0, 0), (-1, -1), PADDING_HORIZONTAL),
+            ('RIGHTPADDING', (0, 0), (-1, -1), PADDING_HORIZONTAL),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]
+        estilo += [('ALIGN', (numero, 0), (numero, -1), coluna.alinhamento)
+                   for numero, coluna in enumerate(layout.colunas) if coluna.alinhamento != 'LEFT']
+        tabela = Table(dados, colWidths=larguras, repeatRows=1)
+        tabela.setStyle(TableStyle(estilo))
+        elementos.append(tabela)
+    elif primeira_parte:
+        elementos.append(Paragraph(escape(layout.vazio), ParagraphStyle('vazio', fontName=FONTE, fontSize=7.5,
+                                                                        alignment=TA_CENTER)))
+
+    if ultima_parte:
+        rodape = Table([[f'© {ano_atual} - Sistema de Biblioteca']], colWidths=[largura_util])
+        rodape.setStyle(TableStyle([
+            ('FONT', (0, 0), (-1, -1), FONTE, 7.5),
+            ('TEXTCOLOR', (0, 0), (-1, -1), cinza),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('LINEABOVE', (0, 0), (-1, -1), 0.75, colors.HexColor('#dddddd')),
+            ('TOPPADDING', (0, 0), (-1, -1), 7.5),
+        ]))
+        elementos += [Spacer(0, 22.5), rodape]
+
+    pdf_buffer = BytesIO()
+    documento = SimpleDocTemplate(pdf_buffer, pagesize=A4, leftMargin=MARGEM_PAGINA, rightMargin=MARGEM_PAGINA,
+                                  topMargin=MARGEM_PAGINA, bottomMargin=MARGEM_PAGINA)
+    documento.build(elementos)
+    return pdf_buffer.getvalue()
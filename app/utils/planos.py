@@ -0,0 +1,146 @@
+from collections import namedtuple
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from app import db
+from app.models.models import Livro, Usuario, Emprestimo, Notificacao, emprestimo_livro, criterios_exclusao
+from app.utils.paginacao import consulta_pagina
+from app.controllers.livro_controller import listagem_livros
+from app.controllers.usuario_controller import listagem_usuarios
+from app.controllers.emprestimo_controller import listagem_emprestimos
+
+# Consulta conferida por verificar_indices(); dialetos=None vale para todos os bancos
+ConsultaVerificada = namedtuple('ConsultaVerificada', ['descricao', 'tabela', 'consulta', 'dialetos'])
+
+# Resultado de uma conferência: varreduras completas encontradas e o plano do banco
+ResultadoPlano = namedtuple('ResultadoPlano', ['descricao', 'tabela', 'varreduras', 'plano'])
+
+class Explicar(Executable, ClauseElement):
+    """EXPLAIN de uma consulta, com os parâmetros tratados como na execução normal"""
+    inherit_cache = False
+
+    def __init__(self, consulta):
+        self.consulta = consulta
+
+@compiles(Explicar, 'postgresql')
+def compilar_explicar_postgresql(elemento, compilador, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compilador.process(elemento.consulta, **kw)
+
+@compiles(Explicar, 'sqlite')
+def compilar_explicar_sqlite(elemento, compilador, **kw):
+    return 'EXPLAIN QUERY PLAN ' + compilador.process(elemento.consulta, **kw)
+
+# Listagens conferidas: (descrição, tabela, função que monta a consulta, URL, dialetos).
+# O SQLite não usa índices de expressão em LIKE; os filtros por início de nome
+# só são atendidos pelo índice no PostgreSQL
+LISTAGENS_VERIFICADAS = [
+    ('livros por título', 'livros', listagem_livros, '/livros', None),
+    ('livros por autor', 'livros', listagem_livros, '/livros?ordem=autor', None),
+    ('livros por ano', 'livros', listagem_livros, '/livros?ordem=ano', None),
+    ('livros de uma categoria', 'livros', listagem_livros, '/livros?ordem=categoria&categoria=Romance', None),
+    ('livros por início do autor', 'livros', listagem_livros, '/livros?autor=mach', ('postgresql',)),
+    ('usuários por nome', 'usuarios', listagem_usuarios, '/usuarios', None),
+    ('usuários por e-mail', 'usuarios', listagem_usuarios, '/usuarios?ordem=email', None),
+    ('usuários por início do nome', 'usuarios', listagem_usuarios, '/usuarios?nome=ana', ('postgresql',)),
+    ('empréstimos por data', 'emprestimos', listagem_emprestimos, '/emprestimos?direcao=desc', None),
+    ('empréstimos por devolução', 'emprestimos', listagem_emprestimos, '/emprestimos?ordem=data_devolucao', None),
+    ('empréstimos de um usuário', 'emprestimos', listagem_emprestimos, '/emprestimos?usuario=1', None),
+    ('empréstimos atrasados', 'emprestimos', listagem_emprestimos, '/emprestimos?atrasados=1', None),
+    ('atrasos a partir de N dias', 'atrasos', listagem_emprestimos, '/emprestimos?dias_min=30', None),
+]
+
+# Valor de exemplo do cursor, pelo tipo da coluna de ordenação
+VALORES_CURSOR = {str: 'm', int: 1, date: date(2000, 1, 1), datetime: datetime(2000, 1, 1)}
+
+def consulta_listagem(listagem):
+    """
+    SELECT de uma página intermediária da listagem: o que paginar() executa
+    depois de receber um cursor, com o filtro dos excluídos que
+    ocultar_excluidos acrescentaria na execução pelo ORM.
+    """
+    chave = ('p', VALORES_CURSOR[listagem.coluna.type.python_type], 1)
+    query = consulta_pagina(listagem.query, listagem.coluna, listagem.id_coluna, listagem.descendente,
+                            chave, listagem.por_pagina)
+    return query.statement.options(*criterios_exclusao())
+
+def consultas_verificadas():
+    """
+    As consultas das listagens, montadas pelas mesmas funções das rotas a
+    partir de URLs de exemplo (filtros, subconsultas, cursor, ordenação e
+    LIMIT da página), e as buscas pontuais da aplicação, escritas aqui.
+    """
+    consultas = []
+    for descricao, tabela, listagem, url, dialetos in LISTAGENS_VERIFICADAS:
+        with current_app.test_request_context(url):
+            consultas.append(ConsultaVerificada(descricao, tabela, consulta_listagem(listagem()), dialetos))
+
+    # As buscas pontuais vão pelo Core, sem ocultar_excluidos; o filtro dos
+    # excluídos vai explícito, como o ORM o acrescenta nas rotas
+    livros = Livro.excluido_em.is_(None)
+    usuarios = Usuario.excluido_em.is_(None)
+    emprestimos = Emprestimo.excluido_em.is_(None)
+    return consultas + [
+        ConsultaVerificada('livro por ISBN', 'livros',
+                           db.select(Livro.id).where(livros, Livro.isbn_normalizado == '9788535902777'), None),
+        ConsultaVerificada('livros com a mesma capa', 'livros',
+                           db.select(Livro.id).where(livros, Livro.capa_hash == '0' * 64), None),
+        ConsultaVerificada('usuário por e-mail', 'usuarios',
+                           db.select(Usuario.id).where(usuarios, Usuario.email == 'ana@exemplo.com'), None),
+        ConsultaVerificada('empréstimo por número', 'emprestimos',
+                           db.select(Emprestimo.id).where(emprestimos, Emprestimo.numero_emprestimo == 'EMP-1'), None),
+        ConsultaVerificada('livros de um empréstimo', 'emprestimo_livro',
+                           db.select(emprestimo_livro.c.livro_id).where(emprestimo_livro.c.emprestimo_id == 1), None),
+        ConsultaVerificada('empréstimos de um livro', 'emprestimo_livro',
+                           db.select(emprestimo_livro.c.emprestimo_id).where(emprestimo_livro.c.livro_id == 1), None),
+        ConsultaVerificada('notificações de um usuário', 'notificacoes',
+                           db.select(Notificacao.id).where(Notificacao.usuario_id == 1), None),
+    ]
+
+def varreduras_postgresql(plano, tabela):
+    """Nós 'Seq Scan' sobre a tabela no plano em JSON do PostgreSQL"""
+    encontrados = []
+    pendentes = [plano[0]['Plan']]
+    while pendentes:
+        no = pendentes.pop()
+        if no['Node Type'] == 'Seq Scan' and no.get('Relation Name') == tabela:
+            encontrados.append(f"Seq Scan on {tabela}")
+        pendentes.extend(no.get('Plans', ()))
+    return encontrados
+
+def varreduras_sqlite(linhas, tabela):
+    """Passos 'SCAN tabela' sem índice no EXPLAIN QUERY PLAN do SQLite"""
+    return [linha.detail for linha in linhas
+            if linha.detail.split()[:2] == ['SCAN', tabela] and 'USING' not in linha.detail]
+
+def verificar_indices():
+    """
+    Confere, com EXPLAIN, que nenhuma das consultas_verificadas() lê a tabela
+    inteira.
+
+    No PostgreSQL a varredura sequencial é desencorajada (enable_seqscan =
+    off, só nesta transação): em um banco pequeno o planejador a prefere mesmo
+    havendo índice, e o que se quer saber é se existe um índice utilizável.
+    O SQLite, sem estatísticas (ANALYZE), já planeja como se as tabelas
+    fossem grandes.
+
+    Returns:
+        Lista de ResultadoPlano, uma por consulta aplicável ao banco atual
+    """
+    dialeto = db.engine.dialect.name
+    resultados = []
+    with db.engine.connect() as conexao, conexao.begin():
+        if dialeto == 'postgresql':
+            conexao.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        for item in consultas_verificadas():
+            if item.dialetos is not None and dialeto not in item.dialetos:
+                continue
+            linhas = conexao.execute(Explicar(item.consulta)).all()
+            if dialeto == 'postgresql':
+                plano = linhas[0][0]
+                varreduras = varreduras_postgresql(plano, item.tabela)
+            else:
+                plano = [linha.detail for linha in linhas]
+                varreduras = varreduras_sqlite(linhas, item.tabela)
+            resultados.append(ResultadoPlano(item.descricao, item.tabela, varreduras, plano))
+    return resultados
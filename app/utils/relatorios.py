@@ -0,0 +1,330 @@
+from flask import current_app, render_template, redirect, url_for
+from concurrent.futures import ProcessPoolExecutor
+from app.utils.capa_utils import gravar_arquivo_atomico
+from app.utils.pdf_utils import html_para_pdf, tabela_para_pdf, layout_tabela, celulas_tabela
+from app.utils.versoes import versoes_dados
+from datetime import datetime
+from io import BytesIO
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+# Estados de um relatório
+NA_FILA = 'na_fila'
+PROCESSANDO = 'processando'
+CONCLUIDO = 'concluido'
+ERRO = 'erro'
+
+# Formato do id de um relatório: '<nome>-<hash da versão dos dados>'
+PADRAO_ID_RELATORIO = re.compile(r'^[a-z_]+-[0-9a-f]{16}$')
+
+_executor = None
+_trava_executor = threading.Lock()
+
+def executor_relatorios():
+    """Retorna o pool de processos dos relatórios, criando-o no primeiro uso"""
+    global _executor
+    with _trava_executor:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=current_app.config['RELATORIOS_PROCESSOS'])
+        return _executor
+
+def descartar_executor():
+    """Descarta o pool (ex.: após um processo filho morrer) para que o próximo uso crie outro"""
+    global _executor
+    with _trava_executor:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def caminhos_relatorio(pasta, id):
+    """Arquivos de um relatório: PDF pronto, marcador de andamento e mensagem de erro"""
+    base = os.path.join(pasta, id)
+    return {'pdf': base + '.pdf', 'pendente': base + '.pendente', 'erro': base + '.erro'}
+
+def id_relatorio(nome, template, tabelas, backend='html'):
+    """
+    Gera o id (e chave de cache) de um relatório.
+
+    O id muda quando qualquer tabela usada pelo relatório é alterada, quando
+    o template é editado ou quando o backend muda, então um PDF já gerado
+    para o mesmo id continua válido.
+    """
+    versoes = versoes_dados(*tabelas)
+    caminho_template = os.path.join(current_app.root_path, current_app.template_folder, template)
+    chave = json.dumps([template, backend, os.path.getmtime(caminho_template), sorted(versoes.items())])
+    return f'{nome}-{hashlib.sha256(chave.encode()).hexdigest()[:16]}'
+
+def estado_relatorio(id, pasta=None):
+    """
+    Lê o estado de um relatório a partir dos arquivos em RELATORIOS_FOLDER.
+
+    O estado fica em disco (e não na memória do processo) para que qualquer
+    worker da aplicação consiga responder sobre um relatório iniciado por outro.
+
+    Returns:
+        Dicionário com 'estado' (None se o relatório não existir), 'segundos'
+        desde o início, 'mensagem' de erro e, durante a conversão, o total de
+        'partes' e quantas já foram 'concluidas'
+    """
+    pasta = pasta or current_app.config['RELATORIOS_FOLDER']
+    caminhos = caminhos_relatorio(pasta, id)
+
+    if os.path.exists(caminhos['pdf']):
+        return {'estado': CONCLUIDO, 'segundos': None, 'mensagem': None}
+
+    try:
+        with open(caminhos['erro'], encoding='utf-8') as f:
+            return {'estado': ERRO, 'segundos': None, 'mensagem': f.read()}
+    except FileNotFoundError:
+        pass
+
+    try:
+        with open(caminhos['pendente'], encoding='utf-8') as f:
+            marcador = json.loads(f.read() or '{}')
+    except FileNotFoundError:
+        return {'estado': None, 'segundos': None, 'mensagem': None}
+    except ValueError:
+        # Marcador recém-criado e ainda vazio
+        marcador = {}
+
+    segundos = time.time() - marcador.get('inicio', time.time())
+    if segundos > current_app.config['RELATORIOS_TEMPO_LIMITE']:
+        return {'estado': ERRO, 'segundos': segundos, 'mensagem': 'Tempo limite excedido'}
+    return {'estado': marcador.get('estado', NA_FILA), 'segundos': segundos, 'mensagem': None,
+            'partes': marcador.get('partes'), 'concluidas': marcador.get('concluidas')}
+
+def solicitar_relatorio(nome, template, query, chave_itens, tabelas, tabela=None):
+    """
+    Devolve um relatório em PDF, gerando-o em segundo plano se necessário.
+
+    Se já existir um PDF para a versão atual dos dados, redireciona direto
+    para o download. Caso contrário, lê os registros em lotes e renderiza o
+    HTML em partes de até RELATORIOS_LINHAS_POR_PARTE linhas, gravadas em
+    disco; a conversão para PDF, que é a parte lenta, vai para o pool de
+    processos. O usuário é levado para a página de acompanhamento, que
+    redireciona ao download quando terminar.
+
+    Com RELATORIOS_BACKEND = 'tabela' e a definição da tabela informada, as
+    partes guardam só o texto das células (JSON, até
+    RELATORIOS_TABELA_LINHAS_POR_PARTE linhas) e o PDF é montado direto com
+    o reportlab, sem o template.
+
+    Args:
+        nome: Nome do relatório (ex: 'livros'), usado no id e no nome do arquivo
+        template: Template HTML do relatório
+        query: Consulta dos registros (só é executada quando o PDF precisa ser gerado)
+        chave_itens: Nome da variável do template com os registros (ex: 'livros')
+        tabelas: Tabelas das quais o relatório depende
+        tabela: TabelaPdf com as colunas do relatório (ver pdf_utils), para o backend 'tabela'
+    """
+    pasta = current_app.config['RELATORIOS_FOLDER']
+    if current_app.config['RELATORIOS_BACKEND'] != 'tabela':
+        tabela = None
+    id = id_relatorio(nome, template, tabelas, 'tabela' if tabela is not None else 'html')
+    estado = estado_relatorio(id, pasta)['estado']
+
+    if estado == CONCLUIDO:
+        return redirect(url_for('relatorios.download_relatorio', id=id))
+    if estado in (NA_FILA, PROCESSANDO):
+        return redirect(url_for('relatorios.relatorio', id=id))
+
+    caminhos = caminhos_relatorio(pasta, id)
+    if estado == ERRO:
+        # Nova tentativa após falha ou tempo esgotado
+        for chave in ('erro', 'pendente'):
+            try:
+                os.remove(caminhos[chave])
+            except FileNotFoundError:
+                pass
+
+    # O marcador é criado de forma exclusiva: se duas requisições pedirem o
+    # mesmo relatório ao mesmo tempo, só uma delas envia o trabalho ao pool
+    os.makedirs(pasta, exist_ok=True)
+    try:
+        fd = os.open(caminhos['pendente'], os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return redirect(url_for('relatorios.relatorio', id=id))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'estado': NA_FILA, 'inicio': time.time()}, f)
+
+    try:
+        if tabela is not None:
+            partes = gravar_partes_tabela(tabela, query, pasta, id)
+            futuro = executor_relatorios().submit(gerar_relatorio_pdf, partes, pasta, id, layout_tabela(tabela))
+        else:
+            partes = renderizar_partes(template, query, chave_itens, pasta, id)
+            futuro = executor_relatorios().submit(gerar_relatorio_pdf, partes, pasta, id)
+    except BaseException as erro:
+        registrar_erro(pasta, id, f'Não foi possível iniciar o relatório: {erro}')
+        raise
+    metricas = current_app.extensions.get('metricas')
+    futuro.add_done_callback(lambda f: verificar_execucao(f, pasta, id, metricas))
+
+    return redirect(url_for('relatorios.relatorio', id=id))
+
+def contexto_relatorio(query):
+    """Total de registros e data de geração, comuns aos dois backends"""
+    agora = datetime.now()
+    return {
+        'total': query.order_by(None).count(),
+        'data_geracao': agora.strftime('%d/%m/%Y às %H:%M'),
+        'ano_atual': agora.year,
+    }
+
+def renderizar_partes(template, query, chave_itens, pasta, id):
+    """
+    Renderiza o relatório em arquivos HTML de tamanho limitado.
+
+    Cada parte recebe no template apenas os seus registros, além de
+    'total', 'primeira_parte' e 'ultima_parte' (o cabeçalho sai só na
+    primeira e o rodapé só na última). Os registros são lidos com
+    yield_per(), então nem a consulta nem o HTML ficam inteiros em memória.
+
+    Returns:
+        Lista com os caminhos das partes, em ordem
+    """
+    linhas_por_parte = current_app.config['RELATORIOS_LINHAS_POR_PARTE']
+    contexto = contexto_relatorio(query)
+
+    partes = []
+
+    def gravar_parte(itens, ultima):
+        html = render_template(template, **{chave_itens: itens}, **contexto,
+                               primeira_parte=not partes, ultima_parte=ultima)
+        caminho = os.path.join(pasta, f'{id}.parte-{len(partes):05d}.html')
+        gravar_arquivo_atomico(caminho, html.encode('utf-8'))
+        partes.append(caminho)
+
+    itens = []
+    for item in query.yield_per(linhas_por_parte):
+        if len(itens) == linhas_por_parte:
+            gravar_parte(itens, ultima=False)
+            itens = []
+        itens.append(item)
+    gravar_parte(itens, ultima=True)
+    return partes
+
+def gravar_partes_tabela(tabela, query, pasta, id):
+    """
+    Grava o texto das células do relatório em partes JSON, como
+    renderizar_partes() faz com o HTML (registros lidos com yield_per()).
+
+    Returns:
+        Lista com os caminhos das partes, em ordem
+    """
+    linhas_por_parte = current_app.config['RELATORIOS_TABELA_LINHAS_POR_PARTE']
+    contexto = contexto_relatorio(query)
+
+    partes = []
+
+    def gravar_parte(itens, ultima):
+        dados = {'linhas': celulas_tabela(tabela, itens), **contexto,
+                 'primeira_parte': not partes, 'ultima_parte': ultima}
+        caminho = os.path.join(pasta, f'{id}.parte-{len(partes):05d}.json')
+        gravar_arquivo_atomico(caminho, json.dumps(dados, ensure_ascii=False).encode('utf-8'))
+        partes.append(caminho)
+
+    itens = []
+    for item in query.yield_per(linhas_por_parte):
+        if len(itens) == linhas_por_parte:
+            gravar_parte(itens, ultima=False)
+            itens = []
+        itens.append(item)
+    gravar_parte(itens, ultima=True)
+    return partes
+
+def verificar_execucao(futuro, pasta, id, metricas=None):
+    """
+    Registra como erro um relatório cujo processo falhou sem gravar o
+    resultado; se deu certo, soma o tempo de conversão às métricas.
+    """
+    erro = 'cancelado' if futuro.cancelled() else futuro.exception()
+    if erro is not None:
+        registrar_erro(pasta, id, f'Falha no processo de geração: {erro!r}')
+        descartar_executor()
+    elif metricas is not None and futuro.result() is not None:
+        metricas.registrar_pdf(id.rsplit('-', 1)[0], futuro.result())
+
+def registrar_erro(pasta, id, mensagem):
+    """Grava a mensagem de erro e remove o marcador de andamento e as partes"""
+    caminhos = caminhos_relatorio(pasta, id)
+    gravar_arquivo_atomico(caminhos['erro'], mensagem.encode('utf-8'))
+    remover_arquivos(pasta, lambda arquivo: arquivo.startswith(id + '.parte-') or arquivo == id + '.pendente')
+
+def remover_arquivos(pasta, filtro):
+    """Remove os arquivos da pasta cujo nome satisfaz o filtro"""
+    for arquivo in os.listdir(pasta):
+        if filtro(arquivo):
+            try:
+                os.remove(os.path.join(pasta, arquivo))
+            except FileNotFoundError:
+                pass
+
+def modificado_em(caminho):
+    """Data de modificação do arquivo (infinita se ele já não existe, para não ser removido)"""
+    try:
+        return os.path.getmtime(caminho)
+    except FileNotFoundError:
+        return float('inf')
+
+def atualizar_marcador(caminho, **valores):
+    """Atualiza o estado gravado no marcador de andamento"""
+    with open(caminho, 'r+', encoding='utf-8') as f:
+        marcador = json.load(f)
+        marcador.update(valores)
+        f.seek(0)
+        f.truncate()
+        json.dump(marcador, f)
+
+def gerar_relatorio_pdf(partes, pasta, id, layout=None):
+    """
+    Converte as partes do relatório em um único PDF; executada em um processo do pool.
+
+    Cada parte é convertida separadamente, o que limita a memória usada pelo
+    xhtml2pdf (ou pelo reportlab), e as páginas resultantes são concatenadas.
+    O andamento (partes concluídas) fica no marcador, para a página de
+    acompanhamento. Com layout (TabelaPdf), as partes são as células em JSON
+    gravadas por gravar_partes_tabela(); sem ele, HTML.
+
+    Ao terminar, remove os PDFs de versões anteriores do mesmo relatório,
+    de modo que o cache em disco guarde apenas um arquivo por relatório.
+    Só os .pdf já prontos e gravados antes deste são removidos: as partes e
+    o marcador de uma versão ainda em conversão ficam, e uma versão antiga
+    que termine depois não apaga o PDF de uma mais nova.
+
+    Returns:
+        Segundos gastos na conversão, ou None se ela falhou
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    inicio = time.perf_counter()
+
+    caminhos = caminhos_relatorio(pasta, id)
+    atualizar_marcador(caminhos['pendente'], estado=PROCESSANDO, partes=len(partes), concluidas=0)
+
+    documento = PdfWriter()
+    for numero, parte in enumerate(partes, 1):
+        with open(parte, encoding='utf-8') as f:
+            pdf = tabela_para_pdf(layout, **json.load(f)) if layout is not None else html_para_pdf(f.read())
+        if pdf is None:
+            registrar_erro(pasta, id, 'Erro ao converter o relatório para PDF')
+            return None
+        documento.append(PdfReader(BytesIO(pdf)))
+        os.remove(parte)
+        atualizar_marcador(caminhos['pendente'], concluidas=numero)
+
+    saida = BytesIO()
+    documento.write(saida)
+    gravar_arquivo_atomico(caminhos['pdf'], saida.getvalue())
+    os.remove(caminhos['pendente'])
+
+    nome = id.rsplit('-', 1)[0]
+    gravado_em = os.path.getmtime(caminhos['pdf'])
+    remover_arquivos(pasta, lambda arquivo: (arquivo.startswith(nome + '-') and arquivo.endswith('.pdf')
+                                             and arquivo != id + '.pdf'
+                                             and modificado_em(os.path.join(pasta, arquivo)) < gravado_em))
+    return time.perf_counter() - inicio
@@ -0,0 +1,94 @@
+from flask import current_app
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.models import ExecucaoTarefa
+
+# Situação de uma tarefa ao pedir para executá-la
+INICIADA = 'iniciada'
+RETOMADA = 'retomada'
+OCUPADA = 'ocupada'      # outro processo está executando a tarefa
+CONCLUIDA = 'concluida'  # a tarefa já foi concluída para a data de referência
+
+# Resultado de iniciar_execucao(): situação, checkpoint e registros já processados
+Execucao = namedtuple('Execucao', ['estado', 'checkpoint', 'processados'])
+
+def iniciar_execucao(tarefa, referencia, reiniciar=False):
+    """
+    Reserva a execução de uma tarefa em lote para uma data de referência.
+
+    A reserva é um UPDATE condicional na linha da tarefa em
+    execucoes_tarefas, feito e confirmado (commit) antes do processamento:
+    se dois processos (ou o agendador de dois workers) tentarem ao mesmo
+    tempo, só um consegue. Uma execução interrompida para a mesma data é
+    retomada a partir do checkpoint, a menos que reiniciar seja True.
+
+    Returns:
+        Execucao; em OCUPADA e CONCLUIDA nada foi reservado
+    """
+    tabela = ExecucaoTarefa.__table__
+    agora = datetime.utcnow()
+    expirada = agora - timedelta(seconds=current_app.config['TAREFAS_TEMPO_LIMITE'])
+
+    resultado = db.session.execute(
+        tabela.update()
+        .where(tabela.c.tarefa == tarefa,
+               db.or_(tabela.c.ultimo_sinal.is_(None), tabela.c.ultimo_sinal < expirada))
+        .values(ultimo_sinal=agora)
+    )
+    if resultado.rowcount == 0:
+        try:
+            db.session.execute(tabela.insert().values(tarefa=tarefa, processados=0, ultimo_sinal=agora))
+        except IntegrityError:
+            # A linha existe e está travada por outra execução
+            db.session.rollback()
+            return Execucao(OCUPADA, None, 0)
+
+    execucao = db.session.get(ExecucaoTarefa, tarefa, populate_existing=True)
+    mesma_data = execucao.referencia == referencia and not reiniciar
+    if mesma_data and execucao.concluida_em is not None:
+        execucao.ultimo_sinal = None
+        db.session.commit()
+        return Execucao(CONCLUIDA, None, execucao.processados)
+
+    if mesma_data and execucao.checkpoint is not None:
+        estado = RETOMADA
+    else:
+        estado = INICIADA
+        execucao.referencia = referencia
+        execucao.checkpoint = None
+        execucao.processados = 0
+        execucao.iniciada_em = agora
+    execucao.concluida_em = None
+    resposta = Execucao(estado, execucao.checkpoint, execucao.processados)
+    db.session.commit()
+    return resposta
+
+def salvar_checkpoint(tarefa, checkpoint, processados):
+    """
+    Registra o último registro processado e renova a trava.
+
+    Deve ser chamada na mesma transação que grava o lote, para que o
+    checkpoint nunca fique à frente (ou atrás) do que foi de fato gravado.
+    """
+    tabela = ExecucaoTarefa.__table__
+    db.session.execute(
+        tabela.update().where(tabela.c.tarefa == tarefa)
+        .values(checkpoint=checkpoint, processados=processados, ultimo_sinal=datetime.utcnow())
+    )
+
+def concluir_execucao(tarefa):
+    """Marca a tarefa como concluída e libera a trava (sem commit)"""
+    tabela = ExecucaoTarefa.__table__
+    db.session.execute(
+        tabela.update().where(tabela.c.tarefa == tarefa)
+        .values(checkpoint=None, concluida_em=datetime.utcnow(), ultimo_sinal=None)
+    )
+
+def liberar_execucao(tarefa):
+    """Libera a trava após uma falha, mantendo o checkpoint para a próxima tentativa"""
+    tabela = ExecucaoTarefa.__table__
+    db.session.rollback()
+    db.session.execute(tabela.update().where(tabela.c.tarefa == tarefa).values(ultimo_sinal=None))
+    db.session.commit()
@@ -0,0 +1,87 @@
+from sqlalchemy import event
+from app import db
+from app.models.models import VersaoDados
+
+# Tabelas cujas alterações são contadas em versoes_dados
+TABELAS_VERSIONADAS = ('livros', 'usuarios', 'emprestimos', 'atrasos')
+
+def incrementar_versoes(conexao, tabelas):
+    """
+    Incrementa a versão das tabelas informadas, na transação da conexão.
+
+    Para gravações pela sessão use registrar_versoes(), que adia o
+    incremento para o commit; esta função é para cargas com SQL puro em
+    conexões próprias, que não passam pela sessão.
+
+    A linha de cada tabela já deve existir (as migrações e criar_versoes a
+    criam): inserir na primeira vez faria dois primeiros incrementos
+    simultâneos tentarem o mesmo INSERT e um deles falhar no commit.
+    """
+    versoes = VersaoDados.__table__
+    for tabela in sorted(tabelas):
+        resultado = conexao.execute(
+            versoes.update().where(versoes.c.tabela == tabela).values(versao=versoes.c.versao + 1)
+        )
+        if resultado.rowcount == 0:
+            raise RuntimeError(f'versoes_dados não tem a linha de {tabela!r}; rode "flask db upgrade"')
+
+@event.listens_for(VersaoDados.__table__, 'after_create')
+def criar_versoes(tabela, conexao, **kwargs):
+    """Cria as linhas de TABELAS_VERSIONADAS (versão 0) quando versoes_dados é criada por db.create_all()"""
+    conexao.execute(tabela.insert(), [{'tabela': nome, 'versao': 0} for nome in TABELAS_VERSIONADAS])
+
+def versoes_dados(*tabelas):
+    """
+    Retorna a versão atual de cada tabela em uma única consulta.
+
+    Returns:
+        Dicionário {tabela: versão}; tabelas ainda sem registro valem 0
+    """
+    linhas = db.session.execute(
+        db.select(VersaoDados.tabela, VersaoDados.versao).where(VersaoDados.tabela.in_(tabelas))
+    ).all()
+    versoes = dict.fromkeys(tabelas, 0)
+    versoes.update(linhas)
+    return versoes
+
+def registrar_versoes(tabelas, session=None):
+    """
+    Marca as tabelas para terem a versão incrementada no commit da sessão.
+
+    Gravações feitas pelo ORM são registradas automaticamente; use esta
+    função em gravações com SQL direto na sessão (ex.: circulação, lotes).
+    """
+    session = session or db.session()
+    session.info.setdefault('versoes', set()).update(tabelas)
+
+@event.listens_for(db.session, 'after_flush')
+def registrar_alteracoes(session, contexto):
+    """Marca as tabelas que tiveram linhas inseridas, alteradas ou removidas no flush"""
+    tabelas = set()
+    for objeto in (*session.new, *session.dirty, *session.deleted):
+        tabela = getattr(objeto, '__tablename__', None)
+        if tabela in TABELAS_VERSIONADAS and (objeto not in session.dirty or session.is_modified(objeto)):
+            tabelas.add(tabela)
+    if tabelas:
+        registrar_versoes(tabelas, session)
+
+@event.listens_for(db.session, 'before_commit')
+def aplicar_versoes(session):
+    """
+    Incrementa de uma vez, no fim da transação, as versões marcadas.
+
+    As linhas de versoes_dados ficam travadas só entre o incremento e o
+    commit, e sempre na mesma ordem (incrementar_versoes ordena as tabelas),
+    então transações que alteram as mesmas tabelas em ordens diferentes não
+    se bloqueiam mutuamente nem ficam em fila pela transação inteira.
+    """
+    # O commit só faz o último flush depois deste evento
+    session.flush()
+    tabelas = session.info.pop('versoes', None)
+    if tabelas:
+        incrementar_versoes(session.connection(), tabelas)
+
+@event.listens_for(db.session, 'after_rollback')
+def descartar_versoes(session):
+    """Descarta as tabelas marcadas em uma transação desfeita"""
+    session.info.pop('versoes', None)
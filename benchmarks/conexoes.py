@@ -0,0 +1,152 @@
+"""
+Teste de carga do pool de conexões.
+
+Dispara requisições simultâneas contra a própria aplicação (um cliente de
+teste por thread, sem servidor HTTP) e acompanha, por eventos do pool, as
+conexões de cada banco: quantas foram abertas, o máximo emprestado ao mesmo
+tempo e quantas requisições falharam esperando uma conexão livre. Com
+REPLICA_DATABASE_URL definida, mostra também quanto da leitura foi para a
+réplica.
+
+Uso:
+    python benchmarks/conexoes.py [--threads 32] [--requisicoes 2000]
+        [--rotas /livros,/usuarios,/emprestimos] [--pool-tamanho 5]
+        [--pool-excedente 10] [--pool-espera 10] [--com-cache] [--json]
+
+O banco é o de DATABASE_URL (e REPLICA_DATABASE_URL); para simular uma
+réplica localmente, aponte REPLICA_DATABASE_URL para uma cópia do banco.
+O cache de páginas fica desligado, para que toda requisição vá ao banco.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(int(len(valores) * p / 100), len(valores) - 1)] if valores else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32, help='Requisições simultâneas (padrão: 32)')
+    parser.add_argument('--requisicoes', type=int, default=2000, help='Total de requisições (padrão: 2000)')
+    parser.add_argument('--rotas', default='/livros,/usuarios,/emprestimos', help='Rotas visitadas em rodízio')
+    parser.add_argument('--pool-tamanho', type=int, help='DB_POOL_TAMANHO')
+    parser.add_argument('--pool-excedente', type=int, help='DB_POOL_EXCEDENTE')
+    parser.add_argument('--pool-espera', type=int, help='DB_POOL_ESPERA (segundos)')
+    parser.add_argument('--com-cache', action='store_true', help='Mantém o cache de páginas ligado')
+    parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON')
+    args = parser.parse_args()
+
+    # As configurações são lidas do ambiente quando config.py é importado
+    for variavel, valor in (('DB_POOL_TAMANHO', args.pool_tamanho), ('DB_POOL_EXCEDENTE', args.pool_excedente),
+                            ('DB_POOL_ESPERA', args.pool_espera)):
+        if valor is not None:
+            os.environ[variavel] = str(valor)
+    if not args.com_cache:
+        os.environ['RESPOSTAS_CACHE_BACKEND'] = 'nenhum'
+
+    from flask import got_request_exception
+    from sqlalchemy import event
+    from app import create_app, db
+
+    app = create_app()
+    app.config['METRICAS_REQUISICAO_LENTA_SEGUNDOS'] = 0
+
+    trava = threading.Lock()
+    bancos = {}
+    with app.app_context():
+        engines = {'principal' if chave is None else chave: engine for chave, engine in db.engines.items()}
+    for nome, engine in engines.items():
+        estado = bancos[nome] = {'abertas': 0, 'em_uso': 0, 'max_em_uso': 0, 'emprestimos': 0}
+
+        def ao_conectar(*_, estado=estado):
+            with trava:
+                estado['abertas'] += 1
+
+        def ao_emprestar(*_, estado=estado):
+            with trava:
+                estado['em_uso'] += 1
+                estado['emprestimos'] += 1
+                estado['max_em_uso'] = max(estado['max_em_uso'], estado['em_uso'])
+
+        def ao_devolver(*_, estado=estado):
+            with trava:
+                estado['em_uso'] -= 1
+
+        event.listen(engine, 'connect', ao_conectar)
+        event.listen(engine, 'checkout', ao_emprestar)
+        event.listen(engine, 'checkin', ao_devolver)
+
+    erros = Counter()
+
+    def registrar_erro(sender, exception, **extra):
+        with trava:
+            erros[type(exception).__name__] += 1
+    got_request_exception.connect(registrar_erro, app)
+
+    rotas = args.rotas.split(',')
+    proxima = iter(range(args.requisicoes))
+    tempos = []
+    status = Counter()
+
+    def trabalhar():
+        cliente = app.test_client()
+        while True:
+            with trava:
+                numero = next(proxima, None)
+            if numero is None:
+                return
+            inicio = time.perf_counter()
+            resposta = cliente.get(rotas[numero % len(rotas)])
+            duracao = time.perf_counter() - inicio
+            with trava:
+                tempos.append(duracao)
+                status[resposta.status_code] += 1
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhar) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total = time.perf_counter() - inicio
+
+    ms = [tempo * 1000 for tempo in tempos]
+    resultado = {
+        'threads': args.threads,
+        'requisicoes': len(tempos),
+        'requisicoes_por_segundo': round(len(tempos) / total, 1),
+        'latencia_ms_p50': round(percentil(ms, 50), 1),
+        'latencia_ms_p95': round(percentil(ms, 95), 1),
+        'latencia_ms_max': round(max(ms), 1) if ms else 0,
+        'latencia_ms_media': round(statistics.mean(ms), 1) if ms else 0,
+        'status': dict(status),
+        'erros': dict(erros),
+        'pool': {'tamanho': app.config['DB_POOL_TAMANHO'], 'excedente': app.config['DB_POOL_EXCEDENTE'],
+                 'espera_segundos': app.config['DB_POOL_ESPERA']},
+        'bancos': {nome: {chave: valor for chave, valor in estado.items() if chave != 'em_uso'}
+                   for nome, estado in bancos.items()},
+    }
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+        return
+    print(f"{resultado['requisicoes']} requisições com {args.threads} threads: "
+          f"{resultado['requisicoes_por_segundo']} req/s")
+    print(f"Latência: p50 {resultado['latencia_ms_p50']} ms, p95 {resultado['latencia_ms_p95']} ms, "
+          f"máx {resultado['latencia_ms_max']} ms")
+    print(f"Status: {resultado['status']}" + (f"; erros: {resultado['erros']}" if erros else ''))
+    for nome, estado in resultado['bancos'].items():
+        print(f"Banco {nome}: {estado['abertas']} conexão(ões) aberta(s), no máximo {estado['max_em_uso']} "
+              f"em uso ao mesmo tempo, {estado['emprestimos']} empréstimo(s) do pool")
+
+if __name__ == '__main__':
+    main()
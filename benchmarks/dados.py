@@ -0,0 +1,262 @@
+"""
+Gerador de dados sintéticos para testes de carga e benchmarks.
+
+Preenche livros, usuários e empréstimos com volumes configuráveis (de
+milhares a milhões de linhas): parte dos livros com capa (um conjunto de
+imagens distintas, com as miniaturas já geradas), empréstimos com vários
+livros, uma fração deles ativa e, entre os ativos, uma fração atrasada.
+Os contadores de exemplares disponíveis, o índice de busca, as versões
+dos dados e as estatísticas ficam coerentes com o que foi gravado.
+
+Uso:
+    python benchmarks/dados.py [--livros 10000] [--usuarios N] [--emprestimos N]
+        [--fracao-capas 0.1] [--livros-por-emprestimo 1-4] [--fracao-ativos 0.2]
+        [--fracao-atrasados 0.3] [--semente 42] [--lote 5000] [--limpar]
+        [--pasta-capas benchmarks/resultados/capas]
+
+O banco é o de DATABASE_URL, já com as migrações aplicadas (flask db
+upgrade). Sem --limpar, os registros são acrescentados aos existentes.
+As capas não vão para a pasta da aplicação (app/static/uploads/capas):
+ficam em --pasta-capas (padrão: UPLOAD_FOLDER, se definida, ou
+benchmarks/resultados/capas, ignorada pelo Git), e as miniaturas ao lado,
+em benchmarks/resultados/variantes (ou CAPA_VARIANTES_FOLDER).
+Com a mesma semente e o mesmo banco de partida, os dados gerados são os mesmos.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+PALAVRAS = ('Sombra', 'Vento', 'Mar', 'Cidade', 'Noite', 'Jardim', 'Segredo', 'Rio', 'Casa', 'Memória',
+            'Tempo', 'Viagem', 'Silêncio', 'Estrela', 'Caminho', 'Ilha', 'Fogo', 'Montanha', 'Espelho', 'Carta')
+LIGACOES = ('do', 'da', 'de', 'sem', 'entre', 'sob', 'além do', 'contra a')
+NOMES = ('Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Heitor', 'Isabela', 'João',
+         'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sofia', 'Tiago', 'Vitória', 'Yuri')
+SOBRENOMES = ('Silva', 'Souza', 'Oliveira', 'Santos', 'Pereira', 'Lima', 'Costa', 'Ferreira', 'Almeida',
+              'Ribeiro', 'Carvalho', 'Gomes', 'Martins', 'Rocha', 'Barbosa', 'Araújo', 'Moreira', 'Teixeira')
+CATEGORIAS = ('Romance', 'Ficção Científica', 'Fantasia', 'Suspense', 'Biografia', 'História', 'Poesia',
+              'Filosofia', 'Tecnologia', 'Infantil', 'Autoajuda', 'Culinária', 'Arte', 'Ciências', 'Direito')
+
+# Imagens distintas usadas como capa (cada livro com capa recebe uma delas)
+CAPAS_DISTINTAS = 50
+
+# Pastas de trabalho das capas e miniaturas sintéticas (benchmarks/rotas.py usa as mesmas)
+PASTA_CAPAS = os.path.join(RAIZ, 'benchmarks', 'resultados', 'capas')
+PASTA_VARIANTES = os.path.join(RAIZ, 'benchmarks', 'resultados', 'variantes')
+
+def isbn13(numero):
+    """ISBN-13 com dígito verificador correto, a partir de um número sequencial"""
+    base = f'978{numero:09d}'
+    return base + str((10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(base)) % 10) % 10)
+
+def intervalo(texto):
+    """'1-4' -> (1, 4); '3' -> (3, 3)"""
+    minimo, _, maximo = texto.partition('-')
+    minimo, maximo = int(minimo), int(maximo or minimo)
+    if not 1 <= minimo <= maximo:
+        raise argparse.ArgumentTypeError('use MIN-MAX, com 1 <= MIN <= MAX')
+    return minimo, maximo
+
+def fracao(texto):
+    valor = float(texto)
+    if not 0 <= valor <= 1:
+        raise argparse.ArgumentTypeError('use um valor entre 0 e 1')
+    return valor
+
+def lotes(itens, tamanho):
+    for inicio in range(0, len(itens), tamanho):
+        yield itens[inicio:inicio + tamanho]
+
+def informar(rotulo, quantidade, inicio):
+    segundos = time.perf_counter() - inicio
+    print(f'✅ {quantidade} {rotulo} em {segundos:.1f}s ({quantidade / segundos if segundos else 0:.0f}/s)')
+
+def gerar_capas(aleatorio, quantidade):
+    """Grava imagens PNG distintas como capas e gera suas miniaturas; devolve [(hash, tamanho)]"""
+    from PIL import Image, ImageDraw
+    from app.utils.capa_utils import salvar_capa, gerar_variantes
+
+    capas = []
+    for _ in range(quantidade):
+        imagem = Image.new('RGB', (400, 600), tuple(aleatorio.randrange(256) for _ in range(3)))
+        desenho = ImageDraw.Draw(imagem)
+        desenho.rectangle((40, 60, 360, 200), fill=tuple(aleatorio.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        imagem.save(buffer, 'PNG')
+        capa_hash, tamanho = salvar_capa(buffer.getvalue())
+        gerar_variantes(capa_hash)
+        capas.append((capa_hash, tamanho))
+    return capas
+
+def limpar_dados(db):
+    """Remove empréstimos, livros e usuários (e o que depende deles)"""
+    from app.models.models import Atraso, Notificacao, Emprestimo, Livro, Usuario, emprestimo_livro
+    for tabela in (Notificacao.__table__, Atraso.__table__, emprestimo_livro, Emprestimo.__table__,
+                   Livro.__table__, Usuario.__table__):
+        db.session.execute(tabela.delete())
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(db.text('DELETE FROM livros_busca'))
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--livros', type=int, default=10000, help='Livros a gerar (padrão: 10000)')
+    parser.add_argument('--usuarios', type=int, help='Usuários a gerar (padrão: livros / 10)')
+    parser.add_argument('--emprestimos', type=int, help='Empréstimos a gerar (padrão: igual a --livros)')
+    parser.add_argument('--fracao-capas', type=fracao, default=0.1, help='Fração dos livros com capa (padrão: 0.1)')
+    parser.add_argument('--livros-por-emprestimo', type=intervalo, default=(1, 4),
+                        help='Livros por empréstimo, MIN-MAX (padrão: 1-4)')
+    parser.add_argument('--fracao-ativos', type=fracao, default=0.2,
+                        help='Fração dos empréstimos ainda não devolvidos (padrão: 0.2)')
+    parser.add_argument('--fracao-atrasados', type=fracao, default=0.3,
+                        help='Fração dos empréstimos ativos com a devolução vencida (padrão: 0.3)')
+    parser.add_argument('--semente', type=int, default=42, help='Semente dos números aleatórios (padrão: 42)')
+    parser.add_argument('--lote', type=int, default=5000, help='Linhas por INSERT em lote (padrão: 5000)')
+    parser.add_argument('--limpar', action='store_true', help='Apaga livros, usuários e empréstimos antes')
+    parser.add_argument('--pasta-capas', default=os.getenv('UPLOAD_FOLDER', PASTA_CAPAS),
+                        help='Pasta das capas geradas (padrão: UPLOAD_FOLDER ou benchmarks/resultados/capas)')
+    args = parser.parse_args()
+    usuarios_total = args.usuarios if args.usuarios is not None else max(args.livros // 10, 1)
+    emprestimos_total = args.emprestimos if args.emprestimos is not None else args.livros
+
+    # Cargas longas: sem tempo limite por instrução e sem o cache de páginas
+    os.environ['DB_TEMPO_LIMITE_CONSULTA_MS'] = '0'
+    os.environ['RESPOSTAS_CACHE_BACKEND'] = 'nenhum'
+    # Capas sintéticas fora da pasta de uploads da aplicação
+    os.environ['UPLOAD_FOLDER'] = args.pasta_capas
+    os.environ.setdefault('CAPA_VARIANTES_FOLDER', PASTA_VARIANTES)
+
+    from app import create_app, db
+    from app.models.models import Livro, Usuario, Emprestimo, emprestimo_livro
+    from app.utils.busca import indexar_livros
+    from app.utils.estatisticas import recalcular_estatisticas
+    from app.utils.versoes import incrementar_versoes
+
+    aleatorio = random.Random(args.semente)
+    app = create_app()
+    with app.app_context():
+        if args.limpar:
+            limpar_dados(db)
+
+        def proximo(coluna):
+            return (db.session.execute(db.select(db.func.max(coluna))).scalar() or 0) + 1
+
+        # Livros (e capas)
+        inicio = time.perf_counter()
+        capas = gerar_capas(aleatorio, min(CAPAS_DISTINTAS, round(args.livros * args.fracao_capas)))
+        if capas:
+            informar('capas distintas gravadas', len(capas), inicio)
+
+        inicio = time.perf_counter()
+        primeiro = proximo(Livro.id)
+        livros = Livro.__table__
+        disponiveis = {}
+        for numeros in lotes(range(primeiro, primeiro + args.livros), args.lote):
+            linhas = []
+            for numero in numeros:
+                exemplares = aleatorio.choice((1, 1, 1, 2, 2, 3, 5))
+                capa = aleatorio.choice(capas) if capas and aleatorio.random() < args.fracao_capas else None
+                titulo = (f'{aleatorio.choice(PALAVRAS)} {aleatorio.choice(LIGACOES)} '
+                          f'{aleatorio.choice(PALAVRAS)} {numero}')
+                isbn = isbn13(numero)
+                linhas.append({
+                    'titulo': titulo, 'autor': f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)}',
+                    'isbn': isbn, 'isbn_normalizado': isbn, 'ano_publicacao': aleatorio.randint(1850, 2025),
+                    'categoria': aleatorio.choice(CATEGORIAS), 'exemplares': exemplares, 'disponiveis': exemplares,
+                    'capa_hash': capa[0] if capa else None, 'capa_tipo': 'image/png' if capa else None,
+                    'capa_tamanho': capa[1] if capa else None,
+                })
+            ids = db.session.execute(livros.insert().returning(livros.c.id, sort_by_parameter_order=True),
+                                     linhas).scalars().all()
+            # INSERT direto: o índice de busca não é atualizado pelos eventos do ORM
+            conexao = db.session.connection()
+            indexar_livros(conexao, [{'id': id, **linha} for id, linha in zip(ids, linhas)])
+            incrementar_versoes(conexao, {'livros'})
+            db.session.commit()
+            disponiveis.update((id, linha['exemplares']) for id, linha in zip(ids, linhas))
+        informar('livros', args.livros, inicio)
+
+        # Usuários
+        inicio = time.perf_counter()
+        primeiro = proximo(Usuario.id)
+        usuario_ids = []
+        for numeros in lotes(range(primeiro, primeiro + usuarios_total), args.lote):
+            linhas = [{'nome': f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {numero}',
+                       'email': f'leitor{numero}@exemplo.com'} for numero in numeros]
+            usuario_ids += db.session.execute(
+                Usuario.__table__.insert().returning(Usuario.__table__.c.id, sort_by_parameter_order=True),
+                linhas).scalars().all()
+            incrementar_versoes(db.session.connection(), {'usuarios'})
+            db.session.commit()
+        informar('usuários', usuarios_total, inicio)
+
+        # Empréstimos: os ativos retiram exemplares da estante (só de livros com algum disponível)
+        inicio = time.perf_counter()
+        if emprestimos_total and (not usuario_ids or not disponiveis):
+            parser.error('Para gerar empréstimos é preciso ter livros e usuários.')
+        primeiro = proximo(Emprestimo.id)
+        livro_ids = list(disponiveis)
+        retirados = set()
+        agora = datetime.utcnow()
+        emprestimos = Emprestimo.__table__
+        associacoes_total = 0
+        for numeros in lotes(range(primeiro, primeiro + emprestimos_total), args.lote):
+            linhas = []
+            livros_por_emprestimo = []
+            for numero in numeros:
+                quantidade = min(aleatorio.randint(*args.livros_por_emprestimo), len(livro_ids))
+                escolhidos = aleatorio.sample(livro_ids, quantidade)
+                ativo = aleatorio.random() < args.fracao_ativos
+                if ativo:
+                    escolhidos = [livro_id for livro_id in escolhidos if disponiveis[livro_id] > 0]
+                    ativo = bool(escolhidos)
+                    if not ativo:
+                        escolhidos = aleatorio.sample(livro_ids, quantidade)
+                if ativo:
+                    for livro_id in escolhidos:
+                        disponiveis[livro_id] -= 1
+                    retirados.update(escolhidos)
+                    atrasado = aleatorio.random() < args.fracao_atrasados
+                    emprestado = agora - timedelta(days=aleatorio.randint(15, 90) if atrasado
+                                                   else aleatorio.randint(0, 13))
+                    devolvido = None
+                else:
+                    emprestado = agora - timedelta(days=aleatorio.randint(20, 730), minutes=aleatorio.randint(0, 1440))
+                    devolvido = emprestado + timedelta(days=aleatorio.randint(1, 20))
+                linhas.append({'numero_emprestimo': f'EMP-{numero:08d}', 'usuario_id': aleatorio.choice(usuario_ids),
+                               'data_emprestimo': emprestado, 'devolvido_em': devolvido,
+                               'data_devolucao': emprestado.date() + timedelta(days=14)})
+                livros_por_emprestimo.append(escolhidos)
+            ids = db.session.execute(emprestimos.insert().returning(emprestimos.c.id, sort_by_parameter_order=True),
+                                     linhas).scalars().all()
+            associacoes = [{'emprestimo_id': id, 'livro_id': livro_id}
+                           for id, escolhidos in zip(ids, livros_por_emprestimo) for livro_id in escolhidos]
+            db.session.execute(emprestimo_livro.insert(), associacoes)
+            associacoes_total += len(associacoes)
+            incrementar_versoes(db.session.connection(), {'emprestimos'})
+            db.session.commit()
+        informar(f'empréstimos ({associacoes_total} livros emprestados)', emprestimos_total, inicio)
+
+        # Contadores de exemplares disponíveis dos livros com empréstimos ativos
+        inicio = time.perf_counter()
+        alterados = [{'id_livro': id, 'valor': disponiveis[id]} for id in sorted(retirados)]
+        atualizacao = livros.update().where(livros.c.id == db.bindparam('id_livro')).values(
+            disponiveis=db.bindparam('valor'))
+        for lote in lotes(alterados, args.lote):
+            db.session.execute(atualizacao, lote)
+            db.session.commit()
+        incrementar_versoes(db.session.connection(), {'livros'})
+        db.session.commit()
+
+        recalcular_estatisticas()
+        informar('contadores de disponíveis e estatísticas atualizados', len(alterados), inicio)
+        print('Para o retrato dos empréstimos atrasados, rode "flask atrasos processar".')
+
+if __name__ == '__main__':
+    main()
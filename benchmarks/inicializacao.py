@@ -0,0 +1,75 @@
+"""
+Mede o custo de inicialização de um worker da aplicação.
+
+Cada repetição roda em um processo Python novo (como um worker do gunicorn
+recém-criado), que importa o pacote, cria a aplicação e informa o tempo
+gasto, a memória residente (RSS) e se o xhtml2pdf já foi carregado.
+
+Uso:
+    python benchmarks/inicializacao.py [--repeticoes 10] [--json]
+
+Para comparar versões, rode o script em cada uma (ex: antes e depois de
+uma mudança) com o mesmo banco e as mesmas variáveis de ambiente.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executado em cada processo filho
+MEDICAO = r'''
+import json, resource, sys, time
+inicio = time.perf_counter()
+import app as pacote
+aplicacao = pacote.create_app() if hasattr(pacote, 'create_app') else pacote.app
+segundos = time.perf_counter() - inicio
+print(json.dumps({
+    'segundos': segundos,
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modulos': len(sys.modules),
+    'xhtml2pdf': 'xhtml2pdf' in sys.modules,
+}))
+'''
+
+def medir():
+    """Inicializa a aplicação em um processo novo e retorna as medições"""
+    saida = subprocess.run([sys.executable, '-c', MEDICAO], cwd=RAIZ, check=True,
+                           capture_output=True, text=True).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeticoes', type=int, default=10, help='Número de processos medidos (padrão: 10)')
+    parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON')
+    args = parser.parse_args()
+
+    # A primeira execução aquece o cache de bytecode e do sistema de arquivos
+    medir()
+    medicoes = [medir() for _ in range(args.repeticoes)]
+
+    tempos = [m['segundos'] * 1000 for m in medicoes]
+    rss = [m['rss_kb'] / 1024 for m in medicoes]
+    resultado = {
+        'repeticoes': args.repeticoes,
+        'inicializacao_ms_mediana': round(statistics.median(tempos), 1),
+        'inicializacao_ms_min': round(min(tempos), 1),
+        'rss_mb_mediana': round(statistics.median(rss), 1),
+        'modulos': medicoes[-1]['modulos'],
+        'xhtml2pdf_carregado': medicoes[-1]['xhtml2pdf'],
+    }
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+    else:
+        print(f"Inicialização: {resultado['inicializacao_ms_mediana']} ms (mediana), "
+              f"{resultado['inicializacao_ms_min']} ms (mínimo) em {args.repeticoes} processos")
+        print(f"Memória (RSS): {resultado['rss_mb_mediana']} MB por worker")
+        print(f"Módulos importados: {resultado['modulos']}; "
+              f"xhtml2pdf carregado: {'sim' if resultado['xhtml2pdf_carregado'] else 'não'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Benchmark dos relatórios em PDF: linhas por segundo de cada backend.
+
+Gera o relatório de livros para cada quantidade de linhas informada, com
+livros sintéticos em memória (sem banco), de três formas:
+  - generate_pdf: o template inteiro renderizado e convertido pelo
+    xhtml2pdf de uma vez, como nas rotas antes do pool de relatórios;
+  - html: o caminho de RELATORIOS_BACKEND = 'html', partes de
+    RELATORIOS_LINHAS_POR_PARTE linhas do template convertidas pelo
+    xhtml2pdf e concatenadas (gerar_relatorio_pdf);
+  - tabela: o caminho de RELATORIOS_BACKEND = 'tabela', partes de
+    RELATORIOS_TABELA_LINHAS_POR_PARTE linhas montadas direto com o
+    reportlab (tabela_para_pdf) e concatenadas.
+
+Para cada backend e quantidade são informados os segundos (renderização
+das partes mais a conversão) e as linhas por segundo, a medida que se
+compara entre os backends. O número de páginas e as páginas por segundo
+vêm em seguida, só como referência: o xhtml2pdf desenha linhas mais altas,
+então o mesmo relatório tem mais páginas nos backends com HTML. Os backends
+com xhtml2pdf levam vários minutos a partir de dezenas de milhares de
+linhas; acima de --html-max-linhas eles são pulados.
+
+Uso:
+    python benchmarks/relatorios.py [--linhas 1000,10000,100000]
+        [--backends generate_pdf,html,tabela] [--html-max-linhas 10000]
+        [--semente 42] [--salvar resultado.json] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from io import BytesIO
+from types import SimpleNamespace
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from dados import PALAVRAS, LIGACOES, NOMES, SOBRENOMES, CATEGORIAS, isbn13
+
+BACKENDS = ('generate_pdf', 'html', 'tabela')
+
+def gerar_livros(quantidade, semente):
+    """Livros com os atributos usados pelo relatório, como os de benchmarks/dados.py"""
+    aleatorio = random.Random(semente)
+    return [SimpleNamespace(
+        titulo=f'{aleatorio.choice(PALAVRAS)} {aleatorio.choice(LIGACOES)} {aleatorio.choice(PALAVRAS)} {numero}',
+        autor=f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)}',
+        isbn=isbn13(numero),
+        ano_publicacao=aleatorio.randint(1850, 2025),
+        categoria=aleatorio.choice(CATEGORIAS),
+        total_emprestimos=aleatorio.randint(0, 30),
+    ) for numero in range(1, quantidade + 1)]
+
+def fatiar(itens, tamanho):
+    return [itens[inicio:inicio + tamanho] for inicio in range(0, len(itens), tamanho)] or [[]]
+
+def contexto(livros):
+    agora = datetime.now()
+    return {'total': len(livros), 'data_geracao': agora.strftime('%d/%m/%Y às %H:%M'), 'ano_atual': agora.year}
+
+def converter(partes, pasta, id, layout=None):
+    """Concatena as partes com gerar_relatorio_pdf(), que espera o marcador criado por solicitar_relatorio()"""
+    from app.utils.relatorios import caminhos_relatorio, gerar_relatorio_pdf
+
+    caminhos = caminhos_relatorio(pasta, id)
+    with open(caminhos['pendente'], 'w', encoding='utf-8') as arquivo:
+        json.dump({}, arquivo)
+    gerar_relatorio_pdf(partes, pasta, id, layout)
+    with open(caminhos['pdf'], 'rb') as arquivo:
+        return arquivo.read()
+
+def medir_generate_pdf(app, livros, pasta):
+    from app.utils.pdf_utils import generate_pdf
+
+    with app.test_request_context():
+        resposta = generate_pdf('livros/livros_pdf.html', {'livros': livros, **contexto(livros),
+                                                            'primeira_parte': True, 'ultima_parte': True})
+    return resposta.get_data()
+
+def medir_html(app, livros, pasta):
+    """Grava as partes HTML como renderizar_partes() e as converte com gerar_relatorio_pdf()"""
+    from flask import render_template
+
+    fatias = fatiar(livros, app.config['RELATORIOS_LINHAS_POR_PARTE'])
+    partes = []
+    with app.test_request_context():
+        for numero, fatia in enumerate(fatias):
+            html = render_template('livros/livros_pdf.html', livros=fatia, **contexto(livros),
+                                   primeira_parte=numero == 0, ultima_parte=numero == len(fatias) - 1)
+            partes.append(os.path.join(pasta, f'html.parte-{numero:05d}.html'))
+            with open(partes[-1], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(html)
+    return converter(partes, pasta, 'html')
+
+def medir_tabela(app, livros, pasta):
+    """Grava as partes JSON como gravar_partes_tabela() e as converte com gerar_relatorio_pdf()"""
+    from app.controllers.livro_controller import TABELA_PDF_LIVROS
+    from app.utils.pdf_utils import celulas_tabela, layout_tabela
+
+    fatias = fatiar(livros, app.config['RELATORIOS_TABELA_LINHAS_POR_PARTE'])
+    partes = []
+    for numero, fatia in enumerate(fatias):
+        dados = {'linhas': celulas_tabela(TABELA_PDF_LIVROS, fatia), **contexto(livros),
+                 'primeira_parte': numero == 0, 'ultima_parte': numero == len(fatias) - 1}
+        partes.append(os.path.join(pasta, f'tabela.parte-{numero:05d}.json'))
+        with open(partes[-1], 'w', encoding='utf-8') as arquivo:
+            json.dump(dados, arquivo, ensure_ascii=False)
+    return converter(partes, pasta, 'tabela', layout_tabela(TABELA_PDF_LIVROS))
+
+MEDICOES = {'generate_pdf': medir_generate_pdf, 'html': medir_html, 'tabela': medir_tabela}
+
+def medir(app, backend, livros):
+    from pypdf import PdfReader
+
+    with tempfile.TemporaryDirectory() as pasta:
+        inicio = time.perf_counter()
+        pdf = MEDICOES[backend](app, livros, pasta)
+        segundos = time.perf_counter() - inicio
+    paginas = len(PdfReader(BytesIO(pdf)).pages)
+    return {'backend': backend, 'linhas': len(livros), 'segundos': round(segundos, 2),
+            'linhas_por_segundo': round(len(livros) / segundos), 'paginas': paginas,
+            'paginas_por_segundo': round(paginas / segundos, 1), 'bytes': len(pdf)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--linhas', default='1000,10000,100000',
+                        help='Quantidades de livros separadas por vírgula (padrão: 1000,10000,100000)')
+    parser.add_argument('--backends', default=','.join(BACKENDS),
+                        help=f'Backends medidos, entre {", ".join(BACKENDS)} (padrão: todos)')
+    parser.add_argument('--html-max-linhas', type=int, default=10000,
+                        help='Acima disso, generate_pdf e html são pulados; 0 mede sempre (padrão: 10000)')
+    parser.add_argument('--semente', type=int, default=42, help='Semente dos dados sintéticos (padrão: 42)')
+    parser.add_argument('--salvar', help='Grava o resultado em JSON neste arquivo')
+    parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON')
+    args = parser.parse_args()
+
+    backends = args.backends.split(',')
+    desconhecidos = [backend for backend in backends if backend not in MEDICOES]
+    if desconhecidos:
+        parser.error(f'Backend(s) desconhecido(s): {", ".join(desconhecidos)}')
+
+    # Sem banco: a aplicação só é usada para renderizar os templates
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ['AUDITORIA_BACKEND'] = 'nenhum'
+    from app import create_app
+    app = create_app()
+
+    resultado = {'data': datetime.now().isoformat(timespec='seconds'), 'medicoes': []}
+    for quantidade in (int(valor) for valor in args.linhas.split(',')):
+        livros = gerar_livros(quantidade, args.semente)
+        for backend in backends:
+            if backend != 'tabela' and args.html_max_linhas and quantidade > args.html_max_linhas:
+                medicao = {'backend': backend, 'linhas': quantidade, 'pulado': True}
+            else:
+                medicao = medir(app, backend, livros)
+            resultado['medicoes'].append(medicao)
+            if not args.json:
+                if medicao.get('pulado'):
+                    print(f'{backend:>12} {quantidade:>7} linhas: pulado (--html-max-linhas {args.html_max_linhas})')
+                else:
+                    print(f"{backend:>12} {quantidade:>7} linhas: {medicao['segundos']:>8.2f}s "
+                          f"{medicao['linhas_por_segundo']:>7} linhas/s "
+                          f"({medicao['paginas']} páginas, {medicao['paginas_por_segundo']:.1f} páginas/s)")
+
+    if args.salvar:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salvar)), exist_ok=True)
+        with open(args.salvar, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
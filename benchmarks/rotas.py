@@ -0,0 +1,379 @@
+"""
+Benchmark das rotas: latência, consultas SQL por requisição e memória.
+
+Cada rota é medida de duas formas:
+  - cliente: requisições sequenciais pelo cliente de teste do Flask (sem
+    rede), o custo da rota isolado;
+  - http: requisições simultâneas, de várias threads, a um servidor HTTP
+    com threads iniciado pelo próprio script (ou a --url, um servidor já
+    em execução, como o gunicorn).
+
+Para cada rota são informados p50/p95/p99 da latência, a média de
+consultas SQL por requisição e os códigos de resposta; ao final, o pico
+de memória residente (RSS) do processo. Com --pdf, mede também a conversão
+de uma parte do relatório de livros em PDF, no backend de
+RELATORIOS_BACKEND (o trabalho de cada processo do pool de relatórios).
+
+O resultado pode ser salvo em JSON (--salvar) e comparado com um resultado
+anterior (--comparar): rotas cujo p95 piorou mais que --tolerancia, ou que
+passaram a fazer mais consultas, são listadas, e o script termina com erro.
+
+Uso:
+    python benchmarks/rotas.py [--modos cliente,http] [--repeticoes 50]
+        [--threads 16] [--requisicoes 500] [--rotas /livros,/usuarios]
+        [--url http://localhost:8000] [--com-cache] [--pdf]
+        [--salvar base.json] [--comparar base.json] [--tolerancia 0.2] [--json]
+        [--pasta-capas benchmarks/resultados/capas]
+
+O banco é o de DATABASE_URL; para volumes realistas, preencha-o antes com
+benchmarks/dados.py. As capas são lidas da mesma pasta em que dados.py as
+gravou (--pasta-capas, com o mesmo padrão); um servidor em --url precisa
+ter UPLOAD_FOLDER apontando para ela. O cache de páginas fica desligado (exceto com
+--com-cache), para que toda requisição chegue ao banco.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlsplit
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# Pastas de trabalho das capas e miniaturas sintéticas (as mesmas de benchmarks/dados.py)
+PASTA_CAPAS = os.path.join(RAIZ, 'benchmarks', 'resultados', 'capas')
+PASTA_VARIANTES = os.path.join(RAIZ, 'benchmarks', 'resultados', 'variantes')
+
+# Rotas medidas por padrão; {capa} é trocado pelo id de um livro com capa
+ROTAS_PADRAO = (
+    '/',
+    '/livros',
+    '/livros?ordem=autor',
+    '/livros?categoria=Romance',
+    '/livros/busca?q=sombra',
+    '/livros/autocomplete?q=mar',
+    '/usuarios',
+    '/emprestimos',
+    '/emprestimos?atrasados=1',
+    '/capa_livro/{capa}',
+    '/capa_livro/{capa}?tamanho=thumb',
+)
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(int(len(valores) * p / 100), len(valores) - 1)] if valores else 0
+
+def rss_pico_kb():
+    """Pico de memória residente do processo, em KB (ru_maxrss é em bytes no macOS)"""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico // 1024 if sys.platform == 'darwin' else pico
+
+def versao_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def resumir(tempos, consultas, status):
+    """Estatísticas de uma rota a partir das medições de cada requisição"""
+    ms = [tempo * 1000 for tempo in tempos]
+    return {
+        'requisicoes': len(ms),
+        'p50_ms': round(percentil(ms, 50), 2),
+        'p95_ms': round(percentil(ms, 95), 2),
+        'p99_ms': round(percentil(ms, 99), 2),
+        'media_ms': round(statistics.mean(ms), 2) if ms else 0,
+        'consultas': round(statistics.mean(consultas), 2) if consultas else None,
+        'consultas_max': max(consultas) if consultas else None,
+        'status': {str(codigo): total for codigo, total in sorted(status.items())},
+    }
+
+class ContadorConsultas:
+    """
+    Middleware WSGI que conta as consultas SQL de cada requisição.
+
+    A contagem é por thread (ver contar_consultas), então funciona também
+    com o servidor HTTP de várias threads. O corpo da resposta é lido
+    dentro da contagem, para incluir as consultas das respostas em streaming.
+    """
+
+    def __init__(self, aplicacao):
+        self.aplicacao = aplicacao
+        self.trava = threading.Lock()
+        self.por_rota = {}
+
+    def __call__(self, environ, start_response):
+        from app.utils.consultas import contar_consultas
+
+        with contar_consultas() as consultas:
+            resposta = self.aplicacao(environ, start_response)
+            try:
+                corpo = list(resposta)
+            finally:
+                if hasattr(resposta, 'close'):
+                    resposta.close()
+        rota = environ.get('PATH_INFO', '') + ('?' + environ['QUERY_STRING'] if environ.get('QUERY_STRING') else '')
+        with self.trava:
+            self.por_rota.setdefault(rota, []).append(len(consultas))
+        return corpo
+
+    def coletar(self, rota):
+        with self.trava:
+            return self.por_rota.pop(rota, [])
+
+def medir_cliente(app, contador, rotas, repeticoes, aquecimento):
+    """Requisições sequenciais pelo cliente de teste, rota a rota"""
+    cliente = app.test_client()
+    resultado = {}
+    for rota in rotas:
+        for _ in range(aquecimento):
+            cliente.get(rota)
+        contador.coletar(rota)
+        tempos = []
+        status = Counter()
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            resposta = cliente.get(rota)
+            tempos.append(time.perf_counter() - inicio)
+            status[resposta.status_code] += 1
+        resultado[rota] = resumir(tempos, contador.coletar(rota), status)
+    return resultado
+
+def medir_http(endereco, contador, rotas, threads, requisicoes):
+    """Requisições simultâneas de várias threads, em rodízio pelas rotas"""
+    destino = urlsplit(endereco)
+    trava = threading.Lock()
+    proxima = iter(range(requisicoes * len(rotas)))
+    tempos = {rota: [] for rota in rotas}
+    status = {rota: Counter() for rota in rotas}
+    erros = Counter()
+
+    def trabalhar():
+        conexao = http.client.HTTPConnection(destino.hostname, destino.port, timeout=60)
+        while True:
+            with trava:
+                numero = next(proxima, None)
+            if numero is None:
+                conexao.close()
+                return
+            rota = rotas[numero % len(rotas)]
+            inicio = time.perf_counter()
+            try:
+                conexao.request('GET', destino.path.rstrip('/') + rota)
+                resposta = conexao.getresponse()
+                resposta.read()
+                codigo = resposta.status
+            except (OSError, http.client.HTTPException) as erro:
+                conexao.close()
+                conexao = http.client.HTTPConnection(destino.hostname, destino.port, timeout=60)
+                with trava:
+                    erros[type(erro).__name__] += 1
+                continue
+            duracao = time.perf_counter() - inicio
+            with trava:
+                tempos[rota].append(duracao)
+                status[rota][codigo] += 1
+
+    inicio = time.perf_counter()
+    trabalhadores = [threading.Thread(target=trabalhar) for _ in range(threads)]
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    total = time.perf_counter() - inicio
+
+    rotas_medidas = {rota: resumir(tempos[rota], contador.coletar(rota) if contador else [], status[rota])
+                     for rota in rotas}
+    atendidas = sum(len(valores) for valores in tempos.values())
+    return {'threads': threads, 'requisicoes_por_segundo': round(atendidas / total, 1),
+            'erros': dict(erros), 'rotas': rotas_medidas}
+
+def medir_pdf(app, repeticoes):
+    """
+    Gera o PDF de uma parte do relatório de livros no backend de
+    RELATORIOS_BACKEND: RELATORIOS_TABELA_LINHAS_POR_PARTE linhas com o
+    reportlab ('tabela') ou RELATORIOS_LINHAS_POR_PARTE com o xhtml2pdf ('html')
+    """
+    from flask import render_template
+    from sqlalchemy.orm import undefer
+    from app.models.models import Livro
+    from app.controllers.livro_controller import TABELA_PDF_LIVROS
+    from app.utils.pdf_utils import html_para_pdf, tabela_para_pdf, layout_tabela, celulas_tabela
+
+    backend = app.config['RELATORIOS_BACKEND']
+    with app.test_request_context():
+        linhas = app.config['RELATORIOS_TABELA_LINHAS_POR_PARTE' if backend == 'tabela' else 'RELATORIOS_LINHAS_POR_PARTE']
+        livros = Livro.query.options(undefer(Livro.total_emprestimos)).order_by(Livro.id).limit(linhas).all()
+        contexto = {'total': len(livros), 'data_geracao': datetime.now().strftime('%d/%m/%Y às %H:%M'),
+                    'ano_atual': datetime.now().year, 'primeira_parte': True, 'ultima_parte': True}
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            if backend == 'tabela':
+                tabela_para_pdf(layout_tabela(TABELA_PDF_LIVROS), celulas_tabela(TABELA_PDF_LIVROS, livros), **contexto)
+            else:
+                html_para_pdf(render_template('livros/livros_pdf.html', livros=livros, **contexto))
+            tempos.append(time.perf_counter() - inicio)
+    return {'backend': backend, 'linhas': len(livros), **resumir(tempos, [], Counter())}
+
+def comparar(atual, base, tolerancia):
+    """Lista as pioras de p95 (acima da tolerância) e de consultas em relação à base"""
+    pioras = []
+    for modo in ('cliente', 'http'):
+        rotas_atuais = atual.get(modo, {})
+        rotas_base = base.get(modo, {})
+        if modo == 'http':
+            rotas_atuais, rotas_base = rotas_atuais.get('rotas', {}), rotas_base.get('rotas', {})
+        for rota, medida in rotas_atuais.items():
+            anterior = rotas_base.get(rota)
+            if not anterior:
+                continue
+            if anterior['p95_ms'] and medida['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+                pioras.append(f"[{modo}] {rota}: p95 {anterior['p95_ms']} -> {medida['p95_ms']} ms "
+                              f"(+{(medida['p95_ms'] / anterior['p95_ms'] - 1) * 100:.0f}%)")
+            if (medida['consultas'] is not None and anterior['consultas'] is not None
+                    and medida['consultas'] > anterior['consultas']):
+                pioras.append(f"[{modo}] {rota}: consultas {anterior['consultas']} -> {medida['consultas']}")
+    if 'pdf' in atual and 'pdf' in base and atual['pdf']['p95_ms'] > base['pdf']['p95_ms'] * (1 + tolerancia):
+        pioras.append(f"[pdf] p95 {base['pdf']['p95_ms']} -> {atual['pdf']['p95_ms']} ms")
+    return pioras
+
+def imprimir_rotas(titulo, rotas):
+    print(titulo)
+    largura = max(len(rota) for rota in rotas)
+    print(f"  {'rota'.ljust(largura)}  {'p50':>8} {'p95':>8} {'p99':>8}  consultas  status")
+    for rota, medida in rotas.items():
+        consultas = '-' if medida['consultas'] is None else f"{medida['consultas']:g}"
+        print(f"  {rota.ljust(largura)}  {medida['p50_ms']:>8} {medida['p95_ms']:>8} {medida['p99_ms']:>8}  "
+              f"{consultas:>9}  {medida['status']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modos', default='cliente,http', help='cliente, http ou ambos (padrão: cliente,http)')
+    parser.add_argument('--rotas', help='Rotas separadas por vírgula (padrão: listagens, busca e capas)')
+    parser.add_argument('--repeticoes', type=int, default=50, help='Requisições por rota no modo cliente (padrão: 50)')
+    parser.add_argument('--aquecimento', type=int, default=3, help='Requisições descartadas por rota (padrão: 3)')
+    parser.add_argument('--threads', type=int, default=16, help='Threads no modo http (padrão: 16)')
+    parser.add_argument('--requisicoes', type=int, default=200,
+                        help='Requisições por rota no modo http (padrão: 200)')
+    parser.add_argument('--url', help='Servidor já em execução para o modo http (padrão: um servidor local)')
+    parser.add_argument('--com-cache', action='store_true', help='Mantém o cache de páginas ligado')
+    parser.add_argument('--pdf', action='store_true', help='Mede também a conversão de uma parte do relatório')
+    parser.add_argument('--salvar', help='Grava o resultado em JSON neste arquivo')
+    parser.add_argument('--comparar', help='Resultado anterior (JSON) para comparação')
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help='Aumento de p95 aceito na comparação (padrão: 0.2 = 20%%)')
+    parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON')
+    parser.add_argument('--pasta-capas', default=os.getenv('UPLOAD_FOLDER', PASTA_CAPAS),
+                        help='Pasta das capas geradas por dados.py (padrão: UPLOAD_FOLDER ou benchmarks/resultados/capas)')
+    args = parser.parse_args()
+    modos = set(args.modos.split(','))
+
+    if not args.com_cache:
+        os.environ['RESPOSTAS_CACHE_BACKEND'] = 'nenhum'
+    os.environ['UPLOAD_FOLDER'] = args.pasta_capas
+    os.environ.setdefault('CAPA_VARIANTES_FOLDER', PASTA_VARIANTES)
+
+    from werkzeug.serving import make_server
+    from app import create_app, db
+    from app.models.models import Livro, Usuario, Emprestimo
+
+    app = create_app()
+    app.config['METRICAS_REQUISICAO_LENTA_SEGUNDOS'] = 0
+    contador = ContadorConsultas(app.wsgi_app)
+    app.wsgi_app = contador
+
+    with app.app_context():
+        banco = db.engine.dialect.name
+        capa = db.session.execute(db.select(Livro.id).where(Livro.capa_hash.isnot(None)).limit(1)).scalar()
+        volumes = {modelo.__tablename__: db.session.execute(db.select(db.func.count()).select_from(modelo)).scalar()
+                   for modelo in (Livro, Usuario, Emprestimo)}
+    rotas = args.rotas.split(',') if args.rotas else list(ROTAS_PADRAO)
+    rotas = [rota.format(capa=capa) for rota in rotas if capa is not None or '{capa}' not in rota]
+
+    resultado = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'codigo': versao_codigo(),
+        'banco': banco,
+        'volumes': volumes,
+        'com_cache': args.com_cache,
+    }
+
+    if 'cliente' in modos:
+        resultado['cliente'] = medir_cliente(app, contador, rotas, args.repeticoes, args.aquecimento)
+
+    if 'http' in modos:
+        servidor = None
+        if args.url:
+            endereco = args.url
+            contador_http = None
+        else:
+            # Sem o log de cada requisição do servidor de desenvolvimento
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)
+            servidor = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=servidor.serve_forever, daemon=True).start()
+            endereco = f'http://127.0.0.1:{servidor.server_port}'
+            contador_http = contador
+            # Aquecimento: uma requisição por rota, fora da medição
+            medir_http(endereco, None, rotas, 1, 1)
+            for rota in rotas:
+                contador.coletar(rota)
+        try:
+            resultado['http'] = medir_http(endereco, contador_http, rotas, args.threads, args.requisicoes)
+        finally:
+            if servidor is not None:
+                servidor.shutdown()
+
+    if args.pdf:
+        resultado['pdf'] = medir_pdf(app, max(args.repeticoes // 10, 3))
+
+    # Com --url, a memória do servidor externo não é medida (só a deste processo)
+    resultado['rss_pico_kb'] = rss_pico_kb()
+
+    if args.salvar:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salvar)), exist_ok=True)
+        with open(args.salvar, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+    pioras = []
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            pioras = comparar(resultado, json.load(arquivo), args.tolerancia)
+
+    if args.json:
+        print(json.dumps({**resultado, 'pioras': pioras}, indent=2, ensure_ascii=False))
+    else:
+        print(f"Banco {resultado['banco']}: {volumes['livros']} livros, {volumes['usuarios']} usuários, "
+              f"{volumes['emprestimos']} empréstimos; código {resultado['codigo'] or '?'}")
+        if 'cliente' in resultado:
+            imprimir_rotas(f'Cliente de teste ({args.repeticoes} requisições por rota), ms:', resultado['cliente'])
+        if 'http' in resultado:
+            http_resultado = resultado['http']
+            imprimir_rotas(f"HTTP ({args.threads} threads, {http_resultado['requisicoes_por_segundo']} req/s), ms:",
+                           http_resultado['rotas'])
+            if http_resultado['erros']:
+                print(f"  Erros de conexão: {http_resultado['erros']}")
+        if 'pdf' in resultado:
+            pdf = resultado['pdf']
+            print(f"PDF ({pdf.get('backend', 'html')}, {pdf['linhas']} livros por parte): p50 {pdf['p50_ms']} ms, p95 {pdf['p95_ms']} ms")
+        print(f"Pico de memória (RSS): {resultado['rss_pico_kb'] / 1024:.0f} MB")
+        if args.comparar:
+            print('Sem pioras em relação a ' + args.comparar if not pioras else
+                  f'{len(pioras)} piora(s) em relação a {args.comparar}:')
+            for piora in pioras:
+                print(f'  {piora}')
+    if pioras:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Micro-benchmark da validação e da gravação de livros, usuários e empréstimos.
+
+Mede, por registro, o custo das regras de app/services (sem banco), da
+conferência de duplicados (uma consulta por registro contra uma consulta
+para o lote inteiro) e da gravação pelo mesmo caminho dos formulários
+(validação, conferência e commit de um registro por vez), com o número
+de consultas SQL de cada gravação.
+
+A auditoria fica ligada (AUDITORIA_BACKEND do ambiente): a thread que grava
+os registros em lote disputa o banco com as gravações medidas, então as
+latências de gravação incluem esse trabalho de fundo, como em produção.
+
+Uso:
+    python benchmarks/validacao.py [--registros 5000] [--gravacoes 500]
+        [--banco sqlite:////tmp/bench.db] [--json]
+
+Sem --banco, usa um SQLite temporário, criado e apagado pelo script. Com
+--banco, informe um banco vazio: as tabelas são criadas e os registros de
+teste ficam gravados nele.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(int(len(valores) * p / 100), len(valores) - 1)] if valores else 0
+
+def isbn13(numero):
+    """ISBN-13 com hífens e dígito verificador correto, a partir de um número sequencial"""
+    base = f'978{numero:09d}'
+    digito = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(base)) % 10) % 10
+    return f'{base[:3]}-{base[3:5]}-{base[5:9]}-{base[9:]}-{digito}'
+
+def formularios_livros(quantidade, inicio=0):
+    return [{'titulo': f'Livro {numero}', 'autor': f'Autor {numero % 97}', 'isbn': isbn13(numero),
+             'ano_publicacao': str(1900 + numero % 120), 'categoria': f'Categoria {numero % 13}',
+             'exemplares': str(1 + numero % 3)}
+            for numero in range(inicio, inicio + quantidade)]
+
+def formularios_usuarios(quantidade, inicio=0):
+    return [{'nome': f'Usuário {numero}', 'email': f'usuario{numero}@exemplo.com'}
+            for numero in range(inicio, inicio + quantidade)]
+
+def por_registro(funcao, itens):
+    """Microssegundos por item de funcao(item), medidos sobre a lista inteira"""
+    inicio = time.perf_counter()
+    for item in itens:
+        funcao(item)
+    return (time.perf_counter() - inicio) * 1e6 / len(itens)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--registros', type=int, default=5000,
+                        help='Registros validados e conferidos (padrão: 5000)')
+    parser.add_argument('--gravacoes', type=int, default=500,
+                        help='Registros gravados um a um, por tipo (padrão: 500)')
+    parser.add_argument('--banco', help='URL do banco (padrão: SQLite temporário)')
+    parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON')
+    args = parser.parse_args()
+    args.gravacoes = min(args.gravacoes, args.registros)
+
+    temporario = None
+    if not args.banco:
+        temporario = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        temporario.close()
+        args.banco = f'sqlite:///{temporario.name}'
+    # As configurações são lidas do ambiente quando config.py é importado
+    os.environ['DATABASE_URL'] = args.banco
+    os.environ.pop('REPLICA_DATABASE_URL', None)
+
+    from app import create_app, db
+    from app.services.validacao import validar_livro, validar_usuario
+    from app.services.livros import isbns_em_uso, validar_livros, validar_um_livro, criar_livro
+    from app.services.usuarios import emails_em_uso, validar_usuarios, validar_um_usuario, criar_usuario
+    from app.services.emprestimos import (validar_campos, pre_verificacao, conferir_emprestimo,
+                                          travar_usuarios, criar_emprestimo)
+    from app.models.models import normalizar_isbn
+    from app.utils.busca import criar_estrutura_busca
+    from app.utils.circulacao import reservar_exemplares
+    from app.utils.consultas import contar_consultas
+
+    app = create_app()
+    resultado = {'registros': args.registros, 'gravacoes': args.gravacoes,
+                 'auditoria': app.config['AUDITORIA_BACKEND']}
+    try:
+        with app.app_context():
+            db.create_all()
+            with db.engine.begin() as conexao:
+                criar_estrutura_busca(conexao)
+
+            livros = formularios_livros(args.registros)
+            usuarios = formularios_usuarios(args.registros)
+            devolucao = (date.today() + timedelta(days=14)).isoformat()
+
+            # Regras sem banco
+            resultado['validacao_us'] = {
+                'livro': round(por_registro(validar_livro, livros), 2),
+                'usuario': round(por_registro(validar_usuario, usuarios), 2),
+                'emprestimo': round(por_registro(
+                    lambda numero: validar_campos(f'EMP-{numero}', '1', ['1', '2'], devolucao),
+                    range(args.registros)), 2),
+            }
+
+            # Gravação pelo caminho dos formulários: um registro e um commit por vez
+            gravados = {'livro': [], 'usuario': [], 'emprestimo': []}
+            consultas = {'livro': [], 'usuario': [], 'emprestimo': []}
+
+            def gravar(tipo, funcao, itens):
+                for item in itens:
+                    with contar_consultas() as executadas:
+                        inicio = time.perf_counter()
+                        funcao(item)
+                        gravados[tipo].append((time.perf_counter() - inicio) * 1000)
+                    consultas[tipo].append(len(executadas))
+
+            def gravar_livro(formulario):
+                erro, dados = validar_um_livro(formulario)
+                assert erro is None, erro
+                criar_livro(dados)
+
+            def gravar_usuario(formulario):
+                erro, dados = validar_um_usuario(formulario)
+                assert erro is None, erro
+                criar_usuario(dados)
+
+            gravar('livro', gravar_livro, livros[:args.gravacoes])
+            gravar('usuario', gravar_usuario, usuarios[:args.gravacoes])
+
+            def gravar_emprestimo(numero):
+                id = str(numero % args.gravacoes + 1)
+                erro, dados = validar_campos(f'BENCH-{numero}', id, [id], devolucao)
+                erro = erro or conferir_emprestimo(dados, pre_verificacao([dados]))
+                assert erro is None, erro
+                if reservar_exemplares(dados.livro_ids) or travar_usuarios([dados.usuario_id]):
+                    # Sem exemplares na estante (mais empréstimos do que livros) ou usuário excluído: não grava
+                    db.session.rollback()
+                    return
+                criar_emprestimo(dados)
+                db.session.commit()
+
+            gravar('emprestimo', gravar_emprestimo, range(args.gravacoes))
+
+            resultado['gravacao_ms'] = {
+                tipo: {'p50': round(percentil(tempos, 50), 3), 'p95': round(percentil(tempos, 95), 3),
+                       'media': round(statistics.mean(tempos), 3) if tempos else 0,
+                       'consultas': round(statistics.mean(consultas[tipo]), 1) if consultas[tipo] else 0}
+                for tipo, tempos in gravados.items()
+            }
+
+            # Conferência de duplicados, com parte dos registros já cadastrada
+            isbns = [normalizar_isbn(formulario['isbn']) for formulario in livros]
+            emails = [formulario['email'] for formulario in usuarios]
+            resultado['unicidade_us'] = {
+                'livro_por_registro': round(por_registro(lambda isbn: isbns_em_uso([isbn]), isbns), 2),
+                'livro_em_lote': round(por_registro(validar_livros, [livros]) / len(livros), 2),
+                'usuario_por_registro': round(por_registro(lambda email: emails_em_uso([email]), emails), 2),
+                'usuario_em_lote': round(por_registro(validar_usuarios, [usuarios]) / len(usuarios), 2),
+            }
+    finally:
+        # Grava a fila da auditoria antes de apagar o banco (o atexit do
+        # buffer encontraria o arquivo já removido)
+        buffer = app.extensions.get('auditoria')
+        if buffer is not None:
+            with app.app_context():
+                buffer.descarregar()
+        if temporario is not None:
+            os.remove(temporario.name)
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+        return
+    print(f"Validação sem banco ({args.registros} registros), µs por registro: "
+          + ', '.join(f'{tipo} {valor}' for tipo, valor in resultado['validacao_us'].items()))
+    unicidade = resultado['unicidade_us']
+    print(f"Conferência de duplicados, µs por registro: livros {unicidade['livro_por_registro']} (uma consulta "
+          f"cada) x {unicidade['livro_em_lote']} (em lote); usuários {unicidade['usuario_por_registro']} x "
+          f"{unicidade['usuario_em_lote']}")
+    print(f"Gravação pelo caminho dos formulários ({args.gravacoes} por tipo; inclui a gravação "
+          f"da auditoria em segundo plano, backend '{resultado['auditoria']}'):")
+    for tipo, medidas in resultado['gravacao_ms'].items():
+        print(f"  {tipo}: p50 {medidas['p50']} ms, p95 {medidas['p95']} ms, "
+              f"{medidas['consultas']} consulta(s) por gravação")
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,133 @@ class Config:
     # Chave secreta para sessões e formulários
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     
-    # Configuração de upload de imagens
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static', 'uploads', 'capas')
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    # Pool de conexões e opções do engine (ver app/utils/banco.py). O pool é
+    # por processo: o total de conexões no servidor chega a
+    # workers x (DB_POOL_TAMANHO + DB_POOL_EXCEDENTE)
+    DB_POOL_TAMANHO = int(os.getenv('DB_POOL_TAMANHO', 5))  # conexões mantidas abertas
+    DB_POOL_EXCEDENTE = int(os.getenv('DB_POOL_EXCEDENTE', 10))  # conexões extras abertas em picos
+    DB_POOL_ESPERA = int(os.getenv('DB_POOL_ESPERA', 10))  # segundos esperando uma conexão livre antes de falhar
+    DB_POOL_RECICLAR = int(os.getenv('DB_POOL_RECICLAR', 30 * 60))  # segundos até uma conexão ser reaberta
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'  # testa a conexão antes de usá-la
+    # Tempo máximo de cada instrução no servidor (PostgreSQL; 0 desativa)
+    DB_TEMPO_LIMITE_CONSULTA_MS = int(os.getenv('DB_TEMPO_LIMITE_CONSULTA_MS', 30 * 1000))
+    DB_NOME_APLICACAO = os.getenv('DB_NOME_APLICACAO', 'biblioteca')  # application_name em pg_stat_activity
+
+    # Réplica de leitura (opcional): listagens, exportações e relatórios leem
+    # dela; gravações vão sempre para o banco principal. Depois de gravar, o
+    # mesmo cliente lê do principal por REPLICA_ATRASO_SEGUNDOS
+    REPLICA_DATABASE_URL = os.getenv('REPLICA_DATABASE_URL')
+    REPLICA_ATRASO_SEGUNDOS = int(os.getenv('REPLICA_ATRASO_SEGUNDOS', 5))
+
+    # Paginação das listagens (livros, usuários e empréstimos)
+    ITENS_POR_PAGINA = 25
+    ITENS_POR_PAGINA_MAX = 100
+
+    # Máximo de consultas SQL por requisição; acima disso a requisição falha.
+    # Use em desenvolvimento e testes para detectar consultas N+1 (0 desativa).
+    ORCAMENTO_CONSULTAS = int(os.getenv('ORCAMENTO_CONSULTAS', 0))
+
+    # Máximo de empréstimos aceitos por requisição em POST /emprestimos/lote
+    EMPRESTIMOS_LOTE_MAX = 1000
+
+    # Sugestões (autocomplete) de usuários e livros no formulário de empréstimo
+    AUTOCOMPLETE_LIMITE = 10
+    AUTOCOMPLETE_LIMITE_MAX = 20
+    AUTOCOMPLETE_CACHE_SEGUNDOS = 30
+
+    # Relatórios em PDF: gerados em segundo plano por um pool de processos e
+    # guardados em disco enquanto os dados do relatório não mudarem
+    RELATORIOS_FOLDER = os.getenv('RELATORIOS_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'relatorios'))
+    RELATORIOS_PROCESSOS = int(os.getenv('RELATORIOS_PROCESSOS', 2))
+    RELATORIOS_TEMPO_LIMITE = 10 * 60  # segundos até um relatório pendente ser considerado perdido
+    RELATORIOS_LINHAS_POR_PARTE = 500  # linhas convertidas por vez pelo xhtml2pdf
+    # 'tabela' monta o PDF direto com o reportlab, a partir das colunas
+    # declaradas nos controllers (TABELA_PDF_*); 'html' converte os templates
+    # *_pdf.html com o xhtml2pdf
+    RELATORIOS_BACKEND = os.getenv('RELATORIOS_BACKEND', 'tabela')
+    RELATORIOS_TABELA_LINHAS_POR_PARTE = 5000  # linhas por parte no backend 'tabela'
+
+    # Templates Jinja compilados guardados em disco (bytecode), compartilhados
+    # entre os processos; vazio desativa
+    TEMPLATES_CACHE_FOLDER = os.getenv('TEMPLATES_CACHE_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_templates'))
+
+    # Exportações em CSV/NDJSON/XLSX: registros lidos do banco por lote
+    EXPORTACAO_LOTE = 1000
+
+    # Importação de livros e usuários (flask catalogo importar): registros gravados por lote
+    IMPORTACAO_LOTE = int(os.getenv('IMPORTACAO_LOTE', 5000))
+
+    # Processamento diário dos empréstimos atrasados (flask atrasos processar)
+    ATRASOS_LOTE = 1000
+    MULTA_DIARIA_CENTAVOS = int(os.getenv('MULTA_DIARIA_CENTAVOS', 50))  # por livro e dia de atraso
+
+    # Agendador de tarefas dentro do processo da aplicação (desligado por padrão).
+    # Com vários processos, a trava em execucoes_tarefas garante uma execução por vez
+    AGENDADOR_ATIVO = os.getenv('AGENDADOR_ATIVO', '0') == '1'
+    ATRASOS_HORARIO = os.getenv('ATRASOS_HORARIO', '02:00')
+    AUDITORIA_PODA_HORARIO = os.getenv('AUDITORIA_PODA_HORARIO', '03:00')
+    TAREFAS_TEMPO_LIMITE = 30 * 60  # segundos sem checkpoint até a trava de uma tarefa expirar
+
+    # Estatísticas da página inicial: guardadas em cache, ajustadas a cada
+    # gravação e recalculadas por completo a cada ESTATISTICAS_RECALCULO_SEGUNDOS.
+    # 'memoria' mantém uma cópia por processo; 'redis' compartilha entre processos
+    ESTATISTICAS_BACKEND = os.getenv('ESTATISTICAS_BACKEND', 'memoria')
+    ESTATISTICAS_REDIS_URL = os.getenv('ESTATISTICAS_REDIS_URL', 'redis://localhost:6379/0')
+    ESTATISTICAS_RECALCULO_SEGUNDOS = int(os.getenv('ESTATISTICAS_RECALCULO_SEGUNDOS', 10 * 60))
+    ESTATISTICAS_TOP = 5  # categorias e autores exibidos
+
+    # Cache das páginas de listagem e de fragmentos dos templates, invalidado
+    # pela versão dos dados (versoes_dados). 'memoria' é um LRU por processo;
+    # 'arquivos' grava em RESPOSTAS_CACHE_FOLDER, compartilhado entre processos;
+    # 'nenhum' desliga o cache
+    RESPOSTAS_CACHE_BACKEND = os.getenv('RESPOSTAS_CACHE_BACKEND', 'memoria')
+    RESPOSTAS_CACHE_ITENS = 2048  # backend 'memoria'
+    RESPOSTAS_CACHE_SEGUNDOS = 60 * 60  # backend 'memoria'; as chaves já mudam quando os dados mudam
+    RESPOSTAS_CACHE_FOLDER = os.getenv('RESPOSTAS_CACHE_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_respostas'))
+    RESPOSTAS_CACHE_MAX_BYTES = int(os.getenv('RESPOSTAS_CACHE_MAX_BYTES', 100 * 1024 * 1024))  # 100MB
+
+    # Auditoria das alterações de livros, usuários e empréstimos: 'banco'
+    # (tabela auditoria), 'arquivo' (JSONL em AUDITORIA_ARQUIVO, com rotação)
+    # ou 'nenhum'. Os registros ficam em memória e são gravados em lotes de
+    # AUDITORIA_LOTE a cada AUDITORIA_INTERVALO_SEGUNDOS, fora das requisições
+    AUDITORIA_BACKEND = os.getenv('AUDITORIA_BACKEND', 'banco')
+    AUDITORIA_LOTE = 500
+    AUDITORIA_INTERVALO_SEGUNDOS = float(os.getenv('AUDITORIA_INTERVALO_SEGUNDOS', 2.0))
+    AUDITORIA_BUFFER_MAXIMO = 100000  # registros em memória se o destino estiver fora do ar
+    AUDITORIA_ARQUIVO = os.getenv('AUDITORIA_ARQUIVO', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'auditoria', 'auditoria.jsonl'))
+    AUDITORIA_ARQUIVO_MAX_BYTES = int(os.getenv('AUDITORIA_ARQUIVO_MAX_BYTES', 50 * 1024 * 1024))  # 50MB
+    AUDITORIA_ARQUIVO_COPIAS = 10
+    # Registros da tabela mais antigos que isso são removidos pelo agendador (0 desativa)
+    AUDITORIA_RETENCAO_DIAS = int(os.getenv('AUDITORIA_RETENCAO_DIAS', 365))
+
+    # API JSON (/api/v1): respostas menores que o limite vão sem compressão;
+    # brotli só é usado se o pacote estiver instalado (pip install brotli)
+    API_COMPRESSAO_MIN_BYTES = int(os.getenv('API_COMPRESSAO_MIN_BYTES', 1024))
+    API_COMPRESSAO_NIVEL_GZIP = 6
+    API_COMPRESSAO_NIVEL_BROTLI = 5
+
+    # Instrumentação das requisições (métricas em /metrics). Requisições mais
+    # lentas que o limite vão para o log com as consultas SQL mais demoradas (0 desativa)
+    METRICAS_REQUISICAO_LENTA_SEGUNDOS = float(os.getenv('METRICAS_REQUISICAO_LENTA_SEGUNDOS', 1.0))
+
+    # Profiler por amostragem: com PERFIL_ATIVO=1, as requisições com o cabeçalho
+    # X-Perfil: 1 ou das rotas em PERFIL_ROTAS (ex.: 'livros.livros,emprestimos.emprestimos')
+    # têm as pilhas gravadas em PERFIL_FOLDER, no formato do flamegraph.pl
+    PERFIL_ATIVO = os.getenv('PERFIL_ATIVO', '0') == '1'
+    PERFIL_ROTAS = {rota for rota in os.getenv('PERFIL_ROTAS', '').split(',') if rota}
+    PERFIL_INTERVALO = 0.005  # segundos entre amostras
+    PERFIL_FOLDER = os.getenv('PERFIL_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perfis'))
+
+    # Configuração de upload de imagens (PNG e JPEG, reconhecidos pelo conteúdo do arquivo)
+    UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static', 'uploads', 'capas'))
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5MB max
+
+    # Threads de cada processo que geram as miniaturas das capas enviadas, fora da requisição
+    CAPAS_THREADS = int(os.getenv('CAPAS_THREADS', 2))
+
+    # Cache em disco das variantes redimensionadas das capas (thumb, medium)
+    CAPA_VARIANTES_FOLDER = os.getenv('CAPA_VARIANTES_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static', 'uploads', 'variantes'))
+    CAPA_VARIANTES_MAX_BYTES = int(os.getenv('CAPA_VARIANTES_MAX_BYTES', 500 * 1024 * 1024))  # 500MB
+
+    # Tempo de cache (em segundos) das capas servidas com o hash na URL
+    CAPA_CACHE_MAX_AGE = 365 * 24 * 60 * 60  # 1 ano
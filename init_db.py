@@ -1,8 +1,15 @@
 """Script para inicializar o banco de dados"""
-from app import app, db
+from app import create_app, db
+from app.utils.busca import criar_estrutura_busca
+
+app = create_app()
 
 with app.app_context():
     # Cria todas as tabelas
     db.create_all()
+
+    # Cria o índice de busca (tsvector no PostgreSQL, FTS5 no SQLite)
+    with db.engine.begin() as conexao:
+        criar_estrutura_busca(conexao)
     print("✅ Banco de dados criado com sucesso!")
     print("✅ Todas as tabelas foram criadas!")
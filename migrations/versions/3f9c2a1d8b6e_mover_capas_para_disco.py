@@ -0,0 +1,113 @@
+"""mover capas para disco
+
+Revision ID: 3f9c2a1d8b6e
+Revises: 07ad4949c171
+Create Date: 2026-10-18 15:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+import hashlib
+import os
+import tempfile
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a1d8b6e'
+down_revision = '07ad4949c171'
+branch_labels = None
+depends_on = None
+
+# Quantidade de capas lidas do banco por vez durante a cópia
+LOTE = 100
+
+# Cópia da gravação e da leitura de app/utils/capa_utils.py nesta revisão: a
+# migração não deve mudar de comportamento quando o código da aplicação mudar
+
+
+def caminho_capa(capa_hash, pasta):
+    """Capas endereçadas por SHA-256, em subpastas com os dois primeiros caracteres do hash"""
+    return os.path.join(pasta, capa_hash[:2], capa_hash)
+
+
+def salvar_capa(dados, pasta):
+    """Grava a capa (uma única vez por conteúdo) via arquivo temporário e os.replace()"""
+    capa_hash = hashlib.sha256(dados).hexdigest()
+    destino = caminho_capa(capa_hash, pasta)
+
+    if not os.path.exists(destino):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(dados)
+            os.replace(temporario, destino)
+        except BaseException:
+            os.unlink(temporario)
+            raise
+
+    return capa_hash, len(dados)
+
+
+def ler_capa(capa_hash, pasta):
+    """Bytes de uma capa gravada, ou None se o arquivo não existir"""
+    try:
+        with open(caminho_capa(capa_hash, pasta), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def upgrade():
+    with op.batch_alter_table('livros') as batch_op:
+        batch_op.add_column(sa.Column('capa_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('capa_tamanho', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_livros_capa_hash', ['capa_hash'])
+
+    # Copia as imagens existentes para o disco em lotes, sem carregar
+    # todas as capas em memória de uma vez
+    conexao = op.get_bind()
+    pasta = current_app.config['UPLOAD_FOLDER']
+    ultimo_id = 0
+    while True:
+        linhas = conexao.execute(
+            sa.text('SELECT id, capa_dados FROM livros '
+                    'WHERE capa_dados IS NOT NULL AND id > :ultimo_id '
+                    'ORDER BY id LIMIT :lote'),
+            {'ultimo_id': ultimo_id, 'lote': LOTE}
+        ).fetchall()
+        if not linhas:
+            break
+        for livro_id, capa_dados in linhas:
+            capa_hash, capa_tamanho = salvar_capa(bytes(capa_dados), pasta)
+            conexao.execute(
+                sa.text('UPDATE livros SET capa_hash = :capa_hash, capa_tamanho = :capa_tamanho '
+                        'WHERE id = :id'),
+                {'capa_hash': capa_hash, 'capa_tamanho': capa_tamanho, 'id': livro_id}
+            )
+        ultimo_id = linhas[-1][0]
+
+    with op.batch_alter_table('livros') as batch_op:
+        batch_op.drop_column('capa_dados')
+
+
+def downgrade():
+    with op.batch_alter_table('livros') as batch_op:
+        batch_op.add_column(sa.Column('capa_dados', sa.LargeBinary(), nullable=True))
+
+    conexao = op.get_bind()
+    pasta = current_app.config['UPLOAD_FOLDER']
+    linhas = conexao.execute(
+        sa.text('SELECT id, capa_hash FROM livros WHERE capa_hash IS NOT NULL')
+    ).fetchall()
+    for livro_id, capa_hash in linhas:
+        conexao.execute(
+            sa.text('UPDATE livros SET capa_dados = :capa_dados WHERE id = :id'),
+            {'capa_dados': ler_capa(capa_hash, pasta), 'id': livro_id}
+        )
+
+    with op.batch_alter_table('livros') as batch_op:
+        batch_op.drop_index('ix_livros_capa_hash')
+        batch_op.drop_column('capa_tamanho')
+        batch_op.drop_column('capa_hash')
@@ -0,0 +1,54 @@
+"""indices de listagem
+
+Revision ID: 8b1e4d7c2a90
+Revises: 3f9c2a1d8b6e
+Create Date: 2026-10-18 16:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1e4d7c2a90'
+down_revision = '3f9c2a1d8b6e'
+branch_labels = None
+depends_on = None
+
+
+def criar_indice_lower(nome, tabela, coluna):
+    # No PostgreSQL o operador varchar_pattern_ops permite usar o índice em LIKE 'x%'
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(f'CREATE INDEX {nome} ON {tabela} (lower({coluna}) varchar_pattern_ops)')
+    else:
+        op.create_index(nome, tabela, [sa.text(f'lower({coluna})')])
+
+
+def upgrade():
+    op.create_index('ix_livros_titulo_id', 'livros', ['titulo', 'id'])
+    op.create_index('ix_livros_autor_id', 'livros', ['autor', 'id'])
+    op.create_index('ix_livros_ano_publicacao_id', 'livros', ['ano_publicacao', 'id'])
+    op.create_index('ix_livros_categoria_id', 'livros', ['categoria', 'id'])
+    criar_indice_lower('ix_livros_autor_lower', 'livros', 'autor')
+
+    op.create_index('ix_usuarios_nome_id', 'usuarios', ['nome', 'id'])
+    criar_indice_lower('ix_usuarios_nome_lower', 'usuarios', 'nome')
+
+    op.create_index('ix_emprestimos_usuario_id', 'emprestimos', ['usuario_id'])
+    op.create_index('ix_emprestimos_data_emprestimo_id', 'emprestimos', ['data_emprestimo', 'id'])
+    op.create_index('ix_emprestimos_data_devolucao_id', 'emprestimos', ['data_devolucao', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_emprestimos_data_devolucao_id', table_name='emprestimos')
+    op.drop_index('ix_emprestimos_data_emprestimo_id', table_name='emprestimos')
+    op.drop_index('ix_emprestimos_usuario_id', table_name='emprestimos')
+
+    op.drop_index('ix_usuarios_nome_lower', table_name='usuarios')
+    op.drop_index('ix_usuarios_nome_id', table_name='usuarios')
+
+    op.drop_index('ix_livros_autor_lower', table_name='livros')
+    op.drop_index('ix_livros_categoria_id', table_name='livros')
+    op.drop_index('ix_livros_ano_publicacao_id', table_name='livros')
+    op.drop_index('ix_livros_autor_id', table_name='livros')
+    op.drop_index('ix_livros_titulo_id', table_name='livros')
@@ -0,0 +1,70 @@
+"""atrasos e tarefas
+
+Revision ID: a7d3e9f2b5c1
+Revises: f1b6d2a8c4e9
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e9f2b5c1'
+down_revision = 'f1b6d2a8c4e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('atrasos',
+    sa.Column('emprestimo_id', sa.Integer(), nullable=False),
+    sa.Column('dias_atraso', sa.Integer(), nullable=False),
+    sa.Column('multa_centavos', sa.Integer(), nullable=False),
+    sa.Column('data_referencia', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['emprestimo_id'], ['emprestimos.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('emprestimo_id')
+    )
+    op.create_index('ix_atrasos_dias_atraso', 'atrasos', ['dias_atraso'], unique=False)
+    op.create_index('ix_atrasos_data_referencia', 'atrasos', ['data_referencia'], unique=False)
+    # atrasos também tem versão de dados (ver TABELAS_VERSIONADAS): a linha já
+    # existe antes do primeiro incremento, como as de e5a7b3c9d214
+    versoes = sa.table('versoes_dados', sa.column('tabela', sa.String), sa.column('versao', sa.Integer))
+    op.bulk_insert(versoes, [{'tabela': 'atrasos', 'versao': 0}])
+
+    op.create_table('notificacoes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('emprestimo_id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=30), nullable=False),
+    sa.Column('mensagem', sa.String(length=255), nullable=False),
+    sa.Column('criada_em', sa.DateTime(), nullable=False),
+    sa.Column('enviada_em', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['emprestimo_id'], ['emprestimos.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notificacoes_usuario_id', 'notificacoes', ['usuario_id'], unique=False)
+    op.create_index('ix_notificacoes_emprestimo_id', 'notificacoes', ['emprestimo_id'], unique=False)
+
+    op.create_table('execucoes_tarefas',
+    sa.Column('tarefa', sa.String(length=50), nullable=False),
+    sa.Column('referencia', sa.Date(), nullable=True),
+    sa.Column('checkpoint', sa.JSON(none_as_null=True), nullable=True),
+    sa.Column('processados', sa.Integer(), nullable=False),
+    sa.Column('iniciada_em', sa.DateTime(), nullable=True),
+    sa.Column('concluida_em', sa.DateTime(), nullable=True),
+    sa.Column('ultimo_sinal', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('tarefa')
+    )
+
+
+def downgrade():
+    op.drop_table('execucoes_tarefas')
+    op.drop_index('ix_notificacoes_emprestimo_id', table_name='notificacoes')
+    op.drop_index('ix_notificacoes_usuario_id', table_name='notificacoes')
+    op.drop_table('notificacoes')
+    op.execute("DELETE FROM versoes_dados WHERE tabela = 'atrasos'")
+    op.drop_index('ix_atrasos_data_referencia', table_name='atrasos')
+    op.drop_index('ix_atrasos_dias_atraso', table_name='atrasos')
+    op.drop_table('atrasos')
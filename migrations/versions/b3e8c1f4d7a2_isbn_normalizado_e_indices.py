@@ -0,0 +1,46 @@
+"""isbn normalizado e indices
+
+Revision ID: b3e8c1f4d7a2
+Revises: a7d3e9f2b5c1
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8c1f4d7a2'
+down_revision = 'a7d3e9f2b5c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Conferido antes de qualquer alteração: no SQLite as mudanças de estrutura
+    # não são desfeitas se a migração falhar no meio
+    normalizado = "UPPER(REPLACE(REPLACE(isbn, '-', ''), ' ', ''))"
+    duplicados = op.get_bind().execute(sa.text(
+        f'SELECT {normalizado} FROM livros GROUP BY {normalizado} HAVING COUNT(*) > 1'
+    )).scalars().all()
+    if duplicados:
+        raise RuntimeError('Há livros com o mesmo ISBN escrito de formas diferentes; corrija-os antes de migrar: '
+                           + ', '.join(duplicados))
+
+    op.create_index('ix_emprestimo_livro_livro_id', 'emprestimo_livro', ['livro_id'], unique=False)
+
+    # A coluna entra com um valor padrão para que o SQLite aceite NOT NULL sem
+    # recriar a tabela (e a estrutura de busca ligada a ela); a aplicação
+    # sempre a preenche a partir de isbn (ver normalizar_isbn)
+    op.add_column('livros', sa.Column('isbn_normalizado', sa.String(length=20), server_default='', nullable=False))
+    op.execute(f'UPDATE livros SET isbn_normalizado = {normalizado}')
+    op.create_index('uq_livros_isbn_normalizado', 'livros', ['isbn_normalizado'], unique=True)
+
+    if op.get_bind().dialect.name != 'sqlite':
+        op.alter_column('livros', 'isbn_normalizado', server_default=None)
+
+
+def downgrade():
+    op.drop_index('uq_livros_isbn_normalizado', table_name='livros')
+    op.drop_column('livros', 'isbn_normalizado')
+    op.drop_index('ix_emprestimo_livro_livro_id', table_name='emprestimo_livro')
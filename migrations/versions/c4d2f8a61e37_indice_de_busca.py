@@ -0,0 +1,87 @@
+"""indice de busca
+
+Revision ID: c4d2f8a61e37
+Revises: 8b1e4d7c2a90
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import unicodedata
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d2f8a61e37'
+down_revision = '8b1e4d7c2a90'
+branch_labels = None
+depends_on = None
+
+# Quantidade de livros indexados por lote durante a migração
+LOTE = 1000
+
+# Cópia do SQL e da normalização de app/utils/busca.py nesta revisão: a
+# migração não deve mudar de comportamento quando o código da aplicação mudar
+
+
+def normalizar(texto):
+    """Remove acentos e converte para minúsculas ('Ficção' -> 'ficcao')"""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def indexar(conexao, livros):
+    parametros = [
+        {'id': livro['id'], 'titulo': normalizar(livro['titulo']),
+         'autor': normalizar(livro['autor']), 'categoria': normalizar(livro['categoria'])}
+        for livro in livros
+    ]
+    if conexao.dialect.name == 'postgresql':
+        conexao.execute(sa.text(
+            "UPDATE livros SET busca = "
+            "setweight(to_tsvector('simple', :titulo), 'A') || "
+            "setweight(to_tsvector('simple', :autor), 'B') || "
+            "setweight(to_tsvector('simple', :categoria), 'C') "
+            "WHERE id = :id"
+        ), parametros)
+    else:
+        conexao.execute(sa.text(
+            'INSERT INTO livros_busca (rowid, titulo, autor, categoria) '
+            'VALUES (:id, :titulo, :autor, :categoria)'
+        ), parametros)
+
+
+def upgrade():
+    # PostgreSQL: coluna tsvector + índice GIN; SQLite: tabela FTS5
+    conexao = op.get_bind()
+    dialeto = conexao.dialect.name
+    if dialeto == 'postgresql':
+        op.execute('ALTER TABLE livros ADD COLUMN IF NOT EXISTS busca tsvector')
+        op.execute('CREATE INDEX IF NOT EXISTS ix_livros_busca ON livros USING gin (busca)')
+    elif dialeto == 'sqlite':
+        op.execute('CREATE VIRTUAL TABLE IF NOT EXISTS livros_busca '
+                   "USING fts5(titulo, autor, categoria, tokenize='unicode61 remove_diacritics 2')")
+        op.execute('DELETE FROM livros_busca')
+    else:
+        return
+
+    # Indexa o acervo existente em lotes por id
+    ultimo_id = 0
+    while True:
+        lote = conexao.execute(
+            sa.text('SELECT id, titulo, autor, categoria FROM livros '
+                    'WHERE id > :ultimo_id ORDER BY id LIMIT :lote'),
+            {'ultimo_id': ultimo_id, 'lote': LOTE}
+        ).mappings().all()
+        if not lote:
+            break
+        indexar(conexao, lote)
+        ultimo_id = lote[-1]['id']
+
+
+def downgrade():
+    dialeto = op.get_bind().dialect.name
+    if dialeto == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_livros_busca')
+        op.execute('ALTER TABLE livros DROP COLUMN IF EXISTS busca')
+    elif dialeto == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS livros_busca')
@@ -0,0 +1,146 @@
+"""exclusao logica e auditoria
+
+Revision ID: d9f4a2c7e6b1
+Revises: b3e8c1f4d7a2
+Create Date: 2026-10-22 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f4a2c7e6b1'
+down_revision = 'b3e8c1f4d7a2'
+branch_labels = None
+depends_on = None
+
+NAO_EXCLUIDO = 'excluido_em IS NULL'
+
+# Índices da listagem, recriados como parciais (só os registros não excluídos)
+INDICES = (
+    ('ix_livros_titulo_id', 'livros', ['titulo', 'id']),
+    ('ix_livros_autor_id', 'livros', ['autor', 'id']),
+    ('ix_livros_ano_publicacao_id', 'livros', ['ano_publicacao', 'id']),
+    ('ix_livros_categoria_id', 'livros', ['categoria', 'id']),
+    ('ix_usuarios_nome_id', 'usuarios', ['nome', 'id']),
+    ('ix_emprestimos_data_emprestimo_id', 'emprestimos', ['data_emprestimo', 'id']),
+    ('ix_emprestimos_data_devolucao_id', 'emprestimos', ['data_devolucao', 'id']),
+)
+INDICES_LOWER = (
+    ('ix_livros_autor_lower', 'livros', 'autor'),
+    ('ix_usuarios_nome_lower', 'usuarios', 'nome'),
+)
+# Restrições UNIQUE da criação inicial, que passam a ser índices únicos parciais
+# (o ISBN já era único por isbn_normalizado; a restrição sobre isbn só sai)
+UNICOS = (
+    ('livros', 'isbn', None),
+    ('usuarios', 'email', 'uq_usuarios_email'),
+    ('emprestimos', 'numero_emprestimo', 'uq_emprestimos_numero_emprestimo'),
+)
+
+
+def criar_indice(nome, tabela, colunas, where=None, unique=False):
+    op.create_index(nome, tabela, colunas, unique=unique,
+                    postgresql_where=sa.text(where) if where else None,
+                    sqlite_where=sa.text(where) if where else None)
+
+
+def criar_indice_lower(nome, tabela, coluna, where=None):
+    # No PostgreSQL o operador varchar_pattern_ops permite usar o índice em LIKE 'x%'
+    condicao = f' WHERE {where}' if where else ''
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(f'CREATE INDEX {nome} ON {tabela} (lower({coluna}) varchar_pattern_ops){condicao}')
+    else:
+        op.execute(f'CREATE INDEX {nome} ON {tabela} (lower({coluna})){condicao}')
+
+
+def remover_indices():
+    for nome, tabela, _ in INDICES + INDICES_LOWER:
+        op.drop_index(nome, table_name=tabela)
+    op.drop_index('uq_livros_isbn_normalizado', table_name='livros')
+    op.drop_index('ix_emprestimos_ativos_data_devolucao', table_name='emprestimos')
+
+
+def upgrade():
+    for tabela in ('livros', 'usuarios', 'emprestimos'):
+        op.add_column(tabela, sa.Column('excluido_em', sa.DateTime(), nullable=True))
+
+    # Removidos antes das restrições: no SQLite a tabela é recriada sem os
+    # índices de expressão, e todos eles voltam parciais em seguida
+    remover_indices()
+
+    if op.get_bind().dialect.name == 'sqlite':
+        # As restrições UNIQUE da criação inicial não têm nome no SQLite e só
+        # saem recriando a tabela; a convenção dá a elas o nome que o
+        # PostgreSQL usa (o mesmo que o downgrade grava)
+        for tabela, coluna, _ in UNICOS:
+            with op.batch_alter_table(tabela, recreate='always',
+                                      naming_convention={'uq': '%(table_name)s_%(column_0_name)s_key'}) as batch:
+                batch.drop_constraint(f'{tabela}_{coluna}_key', type_='unique')
+    else:
+        for tabela, coluna, _ in UNICOS:
+            op.drop_constraint(f'{tabela}_{coluna}_key', tabela, type_='unique')
+
+    for nome, tabela, colunas in INDICES:
+        criar_indice(nome, tabela, colunas, NAO_EXCLUIDO)
+    for nome, tabela, coluna in INDICES_LOWER:
+        criar_indice_lower(nome, tabela, coluna, NAO_EXCLUIDO)
+    criar_indice('uq_livros_isbn_normalizado', 'livros', ['isbn_normalizado'], NAO_EXCLUIDO, unique=True)
+    for tabela, coluna, nome in UNICOS:
+        if nome:
+            criar_indice(nome, tabela, [coluna], NAO_EXCLUIDO, unique=True)
+    criar_indice('ix_emprestimos_ativos_data_devolucao', 'emprestimos', ['data_devolucao', 'id'],
+                 f'devolvido_em IS NULL AND {NAO_EXCLUIDO}')
+
+    op.create_table('auditoria',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('registrado_em', sa.DateTime(), nullable=False),
+    sa.Column('tabela', sa.String(length=50), nullable=False),
+    sa.Column('registro_id', sa.Integer(), nullable=False),
+    sa.Column('operacao', sa.String(length=10), nullable=False),
+    sa.Column('alteracoes', sa.JSON(), nullable=False),
+    sa.Column('origem', sa.String(length=200), nullable=True),
+    sa.Column('endereco_ip', sa.String(length=45), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_auditoria_tabela_registro', 'auditoria', ['tabela', 'registro_id', 'id'], unique=False)
+    op.create_index('ix_auditoria_registrado_em', 'auditoria', ['registrado_em'], unique=False,
+                    postgresql_using='brin')
+
+
+def downgrade():
+    op.drop_index('ix_auditoria_registrado_em', table_name='auditoria')
+    op.drop_index('ix_auditoria_tabela_registro', table_name='auditoria')
+    op.drop_table('auditoria')
+
+    # Os registros excluídos logicamente são apagados de vez: sem a coluna
+    # eles voltariam a aparecer, e poderiam repetir e-mails e números
+    op.execute('DELETE FROM emprestimo_livro WHERE emprestimo_id IN '
+               '(SELECT id FROM emprestimos WHERE excluido_em IS NOT NULL)')
+    for tabela in ('atrasos', 'notificacoes'):
+        op.execute(f'DELETE FROM {tabela} WHERE emprestimo_id IN '
+                   '(SELECT id FROM emprestimos WHERE excluido_em IS NOT NULL)')
+    op.execute('DELETE FROM emprestimos WHERE excluido_em IS NOT NULL')
+    op.execute('DELETE FROM notificacoes WHERE usuario_id IN (SELECT id FROM usuarios WHERE excluido_em IS NOT NULL)')
+    op.execute('DELETE FROM usuarios WHERE excluido_em IS NOT NULL')
+    op.execute('DELETE FROM livros WHERE excluido_em IS NOT NULL '
+               'AND id NOT IN (SELECT livro_id FROM emprestimo_livro)')
+
+    for tabela, coluna, nome in UNICOS:
+        if nome:
+            op.drop_index(nome, table_name=tabela)
+    remover_indices()
+
+    for tabela, coluna, _ in UNICOS:
+        with op.batch_alter_table(tabela) as batch:
+            batch.create_unique_constraint(f'{tabela}_{coluna}_key', [coluna])
+            batch.drop_column('excluido_em')
+
+    for nome, tabela, colunas in INDICES:
+        criar_indice(nome, tabela, colunas)
+    for nome, tabela, coluna in INDICES_LOWER:
+        criar_indice_lower(nome, tabela, coluna)
+    criar_indice('uq_livros_isbn_normalizado', 'livros', ['isbn_normalizado'], unique=True)
+    criar_indice('ix_emprestimos_ativos_data_devolucao', 'emprestimos', ['data_devolucao', 'id'],
+                 'devolvido_em IS NULL')
@@ -0,0 +1,31 @@
+"""versoes de dados
+
+Revision ID: e5a7b3c9d214
+Revises: c4d2f8a61e37
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7b3c9d214'
+down_revision = 'c4d2f8a61e37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    versoes = op.create_table('versoes_dados',
+    sa.Column('tabela', sa.String(length=50), nullable=False),
+    sa.Column('versao', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('tabela')
+    )
+    op.bulk_insert(versoes, [
+        {'tabela': tabela, 'versao': 0} for tabela in ('livros', 'usuarios', 'emprestimos')
+    ])
+
+
+def downgrade():
+    op.drop_table('versoes_dados')
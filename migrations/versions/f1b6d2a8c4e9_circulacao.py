@@ -0,0 +1,54 @@
+"""circulacao
+
+Revision ID: f1b6d2a8c4e9
+Revises: e5a7b3c9d214
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6d2a8c4e9'
+down_revision = 'e5a7b3c9d214'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('livros', sa.Column('exemplares', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('livros', sa.Column('disponiveis', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('emprestimos', sa.Column('devolvido_em', sa.DateTime(), nullable=True))
+
+    # Até aqui não havia registro de devolução: todos os empréstimos existentes
+    # são considerados ativos. Cada livro fica com exemplares suficientes para
+    # cobri-los, e o contador de disponíveis com o que sobra
+    op.execute("""
+        UPDATE livros SET exemplares = CASE WHEN ativos.total > 1 THEN ativos.total ELSE 1 END
+        FROM (SELECT livro_id, COUNT(*) AS total FROM emprestimo_livro GROUP BY livro_id) AS ativos
+        WHERE ativos.livro_id = livros.id
+    """)
+    op.execute("""
+        UPDATE livros SET disponiveis = exemplares - (
+            SELECT COUNT(*) FROM emprestimo_livro WHERE emprestimo_livro.livro_id = livros.id
+        )
+    """)
+
+    # No SQLite, adicionar uma CHECK exigiria recriar a tabela (e a estrutura
+    # de busca ligada a ela); lá a restrição só existe em bancos criados com create_all()
+    if op.get_bind().dialect.name != 'sqlite':
+        op.create_check_constraint('ck_livros_disponiveis', 'livros',
+                                   'disponiveis >= 0 AND disponiveis <= exemplares')
+
+    op.create_index('ix_emprestimos_ativos_data_devolucao', 'emprestimos', ['data_devolucao', 'id'], unique=False,
+                    postgresql_where=sa.text('devolvido_em IS NULL'), sqlite_where=sa.text('devolvido_em IS NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_emprestimos_ativos_data_devolucao', table_name='emprestimos')
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint('ck_livros_disponiveis', 'livros', type_='check')
+    op.drop_column('emprestimos', 'devolvido_em')
+    op.drop_column('livros', 'disponiveis')
+    op.drop_column('livros', 'exemplares')